@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Measures decode throughput per format.
+
+Decodes every supported file of PATH, or a synthetic 60 s stereo sine written
+in each format libsndfile can encode when no path is given, with the same block
+reads as the playback fill worker.
+
+    python -m benchmarks.decode [PATH]
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy
+import soundfile
+from core.decoders import registry as decoder_registry
+
+SYNTHETIC_FORMATS = [
+    ("flac", "FLAC", "PCM_16"),
+    ("flac", "FLAC", "PCM_24"),
+    ("wav", "WAV", "PCM_16"),
+    ("wav", "WAV", "FLOAT"),
+    ("aiff", "AIFF", "PCM_24"),
+    ("ogg", "OGG", "VORBIS"),
+    ("opus", "OGG", "OPUS"),
+    ("mp3", "MP3", "MPEG_LAYER_III"),
+]
+
+def write_synthetic_files(directory: str, seconds: int = 60, samplerate: int = 48000) -> list[str]:
+    t = numpy.arange(seconds * samplerate) / samplerate
+    signal = 0.5 * numpy.stack([numpy.sin(2 * numpy.pi * 440 * t), numpy.sin(2 * numpy.pi * 660 * t)], axis=1)
+    files = list[str]()
+    for extension, format, subtype in SYNTHETIC_FORMATS:
+        if not soundfile.check_format(format, subtype):
+            continue
+        path = os.path.join(directory, f"sine_{subtype.lower()}.{extension}")
+        try:
+            soundfile.write(path, signal, samplerate, format=format, subtype=subtype)
+        except (RuntimeError, soundfile.LibsndfileError):
+            continue
+        files.append(path)
+    return files
+
+def decode(filepath: str) -> tuple[str, int, float, float]:
+    decoder = decoder_registry.get(filepath)
+    info = decoder.info(filepath)
+    dtype = numpy.int16 if info.subtype == "PCM_16" else numpy.int32 if info.subtype == "PCM_24" else numpy.float32
+    start = time.perf_counter()
+    with decoder.open(filepath) as f:
+        blocksize = int(f.samplerate)
+        while f.tell() < f.frames:
+            f.read(frames=min(blocksize, f.frames - f.tell()), dtype=dtype, always_2d=True)
+    elapsed = time.perf_counter() - start
+    return f"{info.format}/{info.subtype}", info.frames, info.duration, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', metavar='PATH', nargs='?', help='audio files directory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.path:
+            files = [os.path.join(root, file) for root, _, names in os.walk(args.path) for file in names if decoder_registry.is_supported_name(file)]
+        else:
+            files = write_synthetic_files(directory)
+
+        results : dict[str, list[float]] = dict()
+        for filepath in files:
+            try:
+                name, frames, duration, elapsed = decode(filepath)
+            except Exception as e:
+                print(f"skipped {filepath}: {e}")
+                continue
+            totals = results.setdefault(name, [0, 0.0, 0.0, 0])
+            totals[0] += frames
+            totals[1] += duration
+            totals[2] += elapsed
+            totals[3] += 1
+
+    print(f"{'format':<28}{'files':>7}{'Mframes/s':>12}{'x realtime':>12}")
+    for name, (frames, duration, elapsed, count) in sorted(results.items()):
+        print(f"{name:<28}{count:>7}{frames / elapsed / 1e6:>12.2f}{duration / elapsed:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Measures the cost of the playback transitions per block.
+
+Transitions are mixed from the decoded buffers before the audio callback
+reads them, the report gives the time spent per block of one second of
+stereo audio for every output format, next to the copy the callback does.
+
+    python -m benchmarks.mixing [-n RUNS]
+"""
+import argparse
+import time
+import numpy
+from core import mixer
+
+FORMATS = [
+    ("PCM_16", numpy.int16, 44100),
+    ("PCM_24", numpy.int32, 96000),
+    ("FLOAT", numpy.float32, 192000),
+]
+
+def synthetic_block(dtype: type, frames: int, seed: int) -> numpy.ndarray:
+    noise = numpy.random.default_rng(seed).uniform(-0.5, 0.5, size=(frames, 2))
+    if numpy.issubdtype(dtype, numpy.integer):
+        return (noise * numpy.iinfo(dtype).max).astype(dtype)
+    return noise.astype(dtype)
+
+def measure(function, runs: int) -> float:
+    """Best time of runs calls in seconds, the least disturbed by other processes"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--runs', type=int, default=20, help='runs per measure, the best is reported')
+    args = parser.parse_args()
+
+    print(f"{'format':<10}{'rate':>8}{'copy':>12}{'fade':>12}{'crossfade':>12}{'realtime':>12}")
+    for name, dtype, samplerate in FORMATS:
+        outgoing = synthetic_block(dtype, samplerate, 1)
+        incoming = synthetic_block(dtype, samplerate, 2)
+        outdata = numpy.empty_like(incoming)
+        def copy():
+            outdata[:] = incoming
+        copy_time = measure(copy, args.runs)
+        fade_time = measure(lambda: mixer.fade(incoming, rising=True), args.runs)
+        crossfade_time = measure(lambda: mixer.crossfade(outgoing, incoming), args.runs)
+        print(f"{name:<10}{samplerate:>8}{copy_time * 1e6:>10.0f}us{fade_time * 1e6:>10.0f}us{crossfade_time * 1e6:>10.0f}us{1 / crossfade_time:>11.0f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Counts playback underruns with the realtime mode off and on, under CPU load.
+
+Plays a synthetic 24 bit FLAC on an output device while busy processes keep
+every core loaded, once with the default scheduling and once with the
+realtime mode, and reports the underruns of each run with the scheduling
+the system granted.
+
+    python -m benchmarks.realtime [-s SECONDS] [-l PROCESSES] [-d DEVICE]
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy
+import soundfile
+from core.device import OutputDevice
+from core.diagnostics import diagnostics
+from core.headless import find_output_device
+from core.player import HandcraftedAudioPlayer
+
+COUNTERS = [("playback", "decode underruns"), ("playback", "output underflows"), ("realtime", "memory lock failures")]
+
+def write_synthetic_file(path: str, seconds: int, samplerate: int = 96000):
+    # Noise compresses poorly, the heaviest FLAC to decode
+    noise = numpy.random.default_rng(1).uniform(-0.5, 0.5, size=(seconds * samplerate, 2))
+    soundfile.write(path, noise, samplerate, format="FLAC", subtype="PCM_24")
+
+def busy_loop():
+    while True:
+        pass
+
+def run(device: OutputDevice, filepath: str, seconds: float) -> dict[str, object]:
+    before = {counter: diagnostics.get(*counter, 0) for counter in COUNTERS}
+    device.play(filepath)
+    deadline = time.perf_counter() + seconds
+    locked = 0.0
+    while device.is_playing and time.perf_counter() < deadline:
+        locked = max(locked, diagnostics.get("realtime", "locked memory (MB)", 0.0))
+        time.sleep(0.1)
+    played = seconds - max(deadline - time.perf_counter(), 0)
+    device.close()
+    result : dict[str, object] = {name: diagnostics.get(section, name, 0) - before[(section, name)] for section, name in COUNTERS}
+    result["played (s)"] = round(played, 1)
+    result["locked memory (MB)"] = round(locked, 1)
+    for name in ("decode worker scheduling", "callback scheduling"):
+        result[name] = diagnostics.get("realtime", name, "-") if device.realtime else "-"
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--seconds', type=int, default=30, help='seconds played per mode')
+    parser.add_argument('-l', '--load', type=int, default=2 * (os.cpu_count() or 1), help='busy processes running during playback')
+    parser.add_argument('-d', '--device', metavar='NAME', help='output device, the default one otherwise')
+    args = parser.parse_args()
+
+    player = HandcraftedAudioPlayer()
+    device_info = find_output_device(player, args.device)
+    if not device_info:
+        parser.exit(1, f"Output device not found: {args.device}\n")
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, "noise.flac")
+        write_synthetic_file(filepath, args.seconds + 5)
+        load = [multiprocessing.Process(target=busy_loop, daemon=True) for _ in range(args.load)]
+        for process in load:
+            process.start()
+        try:
+            results = {mode: run(OutputDevice(device_info, realtime=mode), filepath, args.seconds) for mode in (False, True)}
+        finally:
+            for process in load:
+                process.terminate()
+
+    print(f"{device_info.name}, {args.load} busy processes, {args.seconds} s per mode")
+    print(f"{'':<28}{'off':>12}{'on':>12}")
+    for name in results[False]:
+        print(f"{name:<28}{results[False][name]!s:>12}{results[True][name]!s:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Soak test of the player, fails on memory, thread, callback or latency growth.
+
+Drives the player through thousands of random play, next, previous, seek,
+pause and shuffle operations on a synthetic library, against a simulated
+output device clocked faster than real time so tracks also end on their own.
+The resident memory, the allocations traced by tracemalloc, the thread count,
+the callbacks registered on the player and the track change latency are
+sampled along the run; growth beyond the thresholds after the warm up fails
+it, and the allocators which grew the most are listed.
+
+    python -m benchmarks.soak [-n OPERATIONS] [-t TRACKS] [-x SPEED] [--seed SEED]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy
+import sounddevice
+import soundfile
+from core.device import DeviceInfo, HostApiInfo
+from core.player import HandcraftedAudioPlayer
+
+MEGABYTE = 2**20
+# Sample rates and formats cycled through the library, format changes reopen the output stream
+SYNTHETIC_FORMATS = [
+    (44100, "FLAC", "PCM_16", "flac"),
+    (48000, "WAV", "PCM_16", "wav"),
+    (96000, "FLAC", "PCM_24", "flac"),
+    (44100, "FLAC", "PCM_24", "flac"),
+]
+OPERATIONS = [
+    ("play", 0.2),
+    ("next", 0.3),
+    ("previous", 0.1),
+    ("seek", 0.25),
+    ("pause", 0.05),
+    ("shuffle", 0.1),
+]
+
+class SimulatedOutputStream():
+    """Output stream taking the blocks of its callback from a thread, speed times faster than real time.
+
+    Stands for sounddevice.OutputStream, the played blocks are dropped.
+    """
+    speed : float = 20.0
+
+    def __init__(self, samplerate : float, blocksize : int, channels : int, dtype : str, callback : object, finished_callback : object = None, latency : float = 0.01, **_ : object):
+        self.samplerate = samplerate
+        self.blocksize = blocksize or 1024
+        self.channels = channels
+        self.dtype = dtype
+        self.latency = latency
+        self.__callback = callback
+        self.__finished_callback = finished_callback
+        self.__active : bool = False
+        self.__worker : threading.Thread | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.__active
+
+    def __run(self):
+        outdata = numpy.zeros((self.blocksize, self.channels), dtype=self.dtype)
+        status = sounddevice.CallbackFlags()
+        deadline = time.perf_counter()
+        while self.__active:
+            try:
+                self.__callback(outdata, self.blocksize, None, status)
+            except (sounddevice.CallbackStop, sounddevice.CallbackAbort):
+                break
+            deadline += self.blocksize / self.samplerate / self.speed
+            time.sleep(max(deadline - time.perf_counter(), 0))
+        self.__active = False
+        if self.__finished_callback:
+            self.__finished_callback()
+
+    def start(self):
+        if self.__active:
+            return
+        self.__active = True
+        self.__worker = threading.Thread(target=self.__run, name="simulated output", daemon=True)
+        self.__worker.start()
+
+    def stop(self, ignore_errors : bool = True):
+        self.__active = False
+        if self.__worker and self.__worker is not threading.current_thread():
+            self.__worker.join()
+        self.__worker = None
+
+    def abort(self, ignore_errors : bool = True):
+        self.stop()
+
+    def close(self, ignore_errors : bool = True):
+        self.stop()
+
+def check_output_settings(samplerate : float = 0, **_ : object):
+    if samplerate > 192000:
+        raise ValueError(f"Invalid sample rate: {samplerate}")
+
+def simulated_output_device(speed : float) -> DeviceInfo:
+    """Replaces the output streams of sounddevice by simulated ones and returns the device they play to"""
+    SimulatedOutputStream.speed = speed
+    sounddevice.OutputStream = SimulatedOutputStream
+    sounddevice.check_output_settings = check_output_settings
+    device = {
+        "name": "Simulated output", "index": 0, "hostapi": 0,
+        "max_input_channels": 0, "max_output_channels": 2,
+        "default_low_output_latency": 0.01, "default_high_output_latency": 0.1, "default_samplerate": 48000.0,
+    }
+    host_api = HostApiInfo({"name": "Simulated", "devices": [0], "default_output_device": 0}, devices=[device])
+    return host_api.devices[0]
+
+def write_synthetic_library(directory : str, tracks : int, seconds : float):
+    for index in range(tracks):
+        samplerate, format, subtype, extension = SYNTHETIC_FORMATS[index % len(SYNTHETIC_FORMATS)]
+        t = numpy.arange(int(seconds * samplerate)) / samplerate
+        tone = 0.25 * numpy.sin(2 * numpy.pi * (220 + 20 * index) * t)
+        soundfile.write(os.path.join(directory, f"{index:04d}.{extension}"), numpy.stack((tone, tone), axis=1), samplerate, format=format, subtype=subtype)
+
+def resident_memory() -> int:
+    """Resident set size in bytes, the peak one where /proc doesn't exist"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def registered_callbacks(player : HandcraftedAudioPlayer) -> int:
+    lists = [player.on_track_changed, player.on_track_ended, player.on_playlist_changed, player.on_playback_state_changed, player.device_list.on_changed, player.waveforms.on_ready]
+    return sum(len(callbacks) for callbacks in lists)
+
+class Sample():
+    """Process state after a number of operations, with the track change latencies since the previous sample"""
+    def __init__(self, operations : int, elapsed : float, player : HandcraftedAudioPlayer, latencies : list[float]):
+        gc.collect()
+        self.operations = operations
+        self.elapsed = elapsed
+        self.resident = resident_memory()
+        self.traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        self.threads = threading.active_count()
+        self.callbacks = registered_callbacks(player)
+        self.latency_median = float(numpy.median(latencies)) if latencies else 0.0
+        self.latency_p95 = float(numpy.percentile(latencies, 95)) if latencies else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.operations:>8}{self.elapsed:>9.1f}{self.resident / MEGABYTE:>10.1f}{self.traced / MEGABYTE:>10.2f}{self.threads:>9}{self.callbacks:>11}{self.latency_median * 1000:>10.1f}{self.latency_p95 * 1000:>9.1f}"
+
+HEADER = f"{'ops':>8}{'time (s)':>9}{'rss (MB)':>10}{'py (MB)':>10}{'threads':>9}{'callbacks':>11}{'p50 (ms)':>10}{'p95 (ms)':>9}"
+
+async def soak(player : HandcraftedAudioPlayer, operations : int, sample_every : int, pause : float, rng : numpy.random.Generator, on_sample) -> None:
+    """Runs random operations, on_sample receives a Sample before the first one and every sample_every operations"""
+    latencies = list[float]()
+    started : float | None = None
+    def on_track_changed(*_ : object):
+        # Tracks ending on their own aren't timed
+        if started is not None:
+            latencies.append(time.perf_counter() - started)
+    player.on_track_changed.append(on_track_changed)
+    names = [name for name, _ in OPERATIONS]
+    weights = numpy.array([weight for _, weight in OPERATIONS])
+    start = time.perf_counter()
+    on_sample(Sample(0, 0.0, player, latencies))
+    for done in range(1, operations + 1):
+        operation = names[rng.choice(len(names), p=weights / weights.sum())]
+        queue = player.current_playlist or []
+        started = time.perf_counter()
+        if operation == "play" and queue:
+            await player.play(int(rng.integers(len(queue))))
+        elif operation == "next":
+            await player.next()
+        elif operation == "previous":
+            await player.previous()
+        elif operation == "seek" and player.current_track:
+            await player.seek(float(rng.uniform(0, player.current_track.duration or 0)))
+        elif operation == "pause":
+            player.pause()
+            await asyncio.sleep(pause)
+            player.resume()
+        elif operation == "shuffle":
+            player.shuffle()
+        started = None
+        # Lets playback run, and tracks end on their own now and then
+        await asyncio.sleep(float(rng.uniform(0, 2 * pause)))
+        if done % sample_every == 0:
+            on_sample(Sample(done, time.perf_counter() - start, player, latencies))
+            latencies.clear()
+    player.on_track_changed.remove(on_track_changed)
+
+def check(samples : list[Sample], args : argparse.Namespace) -> list[str]:
+    """Growth beyond the thresholds from the first sample to the last one"""
+    baseline, last = samples[0], samples[-1]
+    failures = list[str]()
+    if last.resident - baseline.resident > args.max_rss_growth * MEGABYTE:
+        failures.append(f"resident memory grew by {(last.resident - baseline.resident) / MEGABYTE:.1f} MB")
+    if last.traced - baseline.traced > args.max_traced_growth * MEGABYTE:
+        failures.append(f"python allocations grew by {(last.traced - baseline.traced) / MEGABYTE:.1f} MB")
+    if last.threads - baseline.threads > args.max_thread_growth:
+        failures.append(f"threads grew from {baseline.threads} to {last.threads}")
+    if last.callbacks > baseline.callbacks:
+        failures.append(f"callbacks grew from {baseline.callbacks} to {last.callbacks}")
+    # The first window after the warm up is the reference, small absolute drifts are noise
+    reference = next((sample for sample in samples[1:] if sample.latency_p95 > 0), None)
+    if reference and last.latency_p95 > reference.latency_p95 * args.max_latency_drift and last.latency_p95 - reference.latency_p95 > args.latency_floor / 1000:
+        failures.append(f"track change p95 latency drifted from {reference.latency_p95 * 1000:.1f} to {last.latency_p95 * 1000:.1f} ms")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--operations', type=int, default=5000, help='operations run after the warm up')
+    parser.add_argument('-w', '--warmup', type=int, default=300, help='operations run before the baseline is taken')
+    parser.add_argument('-t', '--tracks', type=int, default=24, help='tracks of the synthetic library')
+    parser.add_argument('-l', '--length', type=float, default=6.0, help='seconds per track')
+    parser.add_argument('-x', '--speed', type=float, default=20.0, help='simulated output speed, times real time')
+    parser.add_argument('-p', '--pause', type=float, default=0.01, help='mean seconds between operations')
+    parser.add_argument('-s', '--sample-every', type=int, default=250, help='operations between samples')
+    parser.add_argument('--top', type=int, default=10, help='allocators listed')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the random operations')
+    parser.add_argument('--max-rss-growth', metavar='MB', type=float, default=64, help='resident memory growth tolerated (default: %(default)s)')
+    parser.add_argument('--max-traced-growth', metavar='MB', type=float, default=16, help='python allocation growth tolerated (default: %(default)s)')
+    parser.add_argument('--max-thread-growth', metavar='N', type=int, default=4, help='thread count growth tolerated (default: %(default)s)')
+    parser.add_argument('--max-latency-drift', metavar='RATIO', type=float, default=2.0, help='track change p95 latency growth tolerated (default: %(default)s)')
+    parser.add_argument('--latency-floor', metavar='MS', type=float, default=5.0, help='latency drifts under this are ignored (default: %(default)s)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        library = os.path.join(directory, "library")
+        os.makedirs(library)
+        # Waveforms and other caches stay out of the user cache
+        os.environ["XDG_CACHE_HOME"] = os.path.join(directory, "cache")
+        write_synthetic_library(library, args.tracks, args.length)
+        device = simulated_output_device(args.speed)
+        player = HandcraftedAudioPlayer()
+        player.set_output_devices([device])
+        player.load_library(library)
+        rng = numpy.random.default_rng(args.seed)
+        samples = list[Sample]()
+        def on_sample(sample : Sample):
+            samples.append(sample)
+            print(sample, flush=True)
+
+        async def run() -> tuple[tracemalloc.Snapshot, tracemalloc.Snapshot]:
+            await player.play(0)
+            await soak(player, args.warmup, max(args.warmup, 1), args.pause, rng, lambda _: None)
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            print(f"{args.tracks} tracks of {args.length:g} s at {args.speed:g}x, {args.operations} operations after {args.warmup} to warm up")
+            print(HEADER)
+            await soak(player, args.operations, args.sample_every, args.pause, rng, on_sample)
+            after = tracemalloc.take_snapshot()
+            player.stop()
+            return before, after
+
+        before, after = asyncio.run(run())
+        tracemalloc.stop()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    print("top allocators by growth")
+    for statistic in after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")[:args.top]:
+        frame = statistic.traceback[0]
+        print(f"    {statistic.size_diff / 1024:>+10.1f} KiB {statistic.count_diff:>+8} blocks  {frame.filename}:{frame.lineno}")
+    failures = check(samples, args) if len(samples) > 1 else ["no sample taken"]
+    if failures:
+        parser.exit(1, "FAILED: " + ", ".join(failures) + "\n")
+    print("passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Measures startup time of the main code paths.
+
+Every scenario runs in a fresh interpreter with -X importtime, the report
+gives the wall time and the import time of the heaviest top level packages.
+
+    python -m benchmarks.startup [-n RUNS] [-t TOP]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+SCENARIOS = [
+    ("--help", [MAIN, "--help"]),
+    ("--list-devices", [MAIN, "--list-devices"]),
+    ("headless imports", ["-c", "import core.headless"]),
+    ("user interface imports", ["-c", "import ui.app"]),
+]
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Returns self import time in microseconds summed by top level package"""
+    packages : dict[str, int] = dict()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    return packages
+
+def run(arguments: list[str]) -> tuple[float, dict[str, int]]:
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", *arguments], cwd=ROOT, capture_output=True, text=True)
+    return time.perf_counter() - start, parse_importtime(process.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--runs', type=int, default=5, help='runs per scenario, the median is reported')
+    parser.add_argument('-t', '--top', type=int, default=8, help='number of packages listed per scenario')
+    args = parser.parse_args()
+
+    for name, arguments in SCENARIOS:
+        runs = [run(arguments) for _ in range(args.runs)]
+        wall_time = statistics.median(elapsed for elapsed, _ in runs)
+        packages = {package: statistics.median(run[1].get(package, 0) for run in runs) for package in runs[-1][1]}
+        print(f"{name}: {wall_time * 1000:.0f} ms wall, {sum(packages.values()) / 1000:.0f} ms importing")
+        for package, import_time in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"    {package:<24}{import_time / 1000:>8.1f} ms")
+
+if __name__ == "__main__":
+    main()
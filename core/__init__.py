@@ -1,2 +0,0 @@
-from .device import *
-from .player import *
@@ -0,0 +1,142 @@
+import threading
+import time
+import numpy
+from typing import Callable
+from core.diagnostics import diagnostics
+
+SILENCE_DB = -90.0
+
+class AnalyzerSnapshot():
+    """Levels and spectrum of the audio heard at one instant, never modified once published"""
+    sequence : int
+    peak : numpy.ndarray
+    rms : numpy.ndarray
+    bands : numpy.ndarray
+    frequencies : numpy.ndarray
+
+    def __init__(self, sequence : int, peak : numpy.ndarray, rms : numpy.ndarray, bands : numpy.ndarray, frequencies : numpy.ndarray):
+        self.sequence = sequence
+        # dBFS per channel
+        self.peak = peak
+        self.rms = rms
+        # dBFS per band and band center frequencies in Hz
+        self.bands = bands
+        self.frequencies = frequencies
+        for array in (peak, rms, bands, frequencies):
+            array.setflags(write=False)
+
+def to_db(power : numpy.ndarray) -> numpy.ndarray:
+    return numpy.maximum(10 * numpy.log10(numpy.maximum(power, 1e-12)), SILENCE_DB)
+
+class SpectrumAnalyzer():
+    """Computes level meters and a spectrum of the audio heard, in a worker thread at a fixed rate.
+
+    The audio comes from a tap returning the last frames heard, read from the
+    decoded buffers so the audio callback has nothing to do. High rates are
+    decimated below 48 kHz and the spectrum averages a batch of overlapping
+    windows transformed at once. Every result is published as a new snapshot,
+    readers take the reference without any lock.
+    """
+    def __init__(self, tap : Callable[[int], tuple[numpy.ndarray, int] | None], rate : float = 15.0, fft_size : int = 2048, batch : int = 4, bands : int = 32):
+        self.__tap = tap
+        self.__rate = rate
+        self.__fft_size = fft_size
+        self.__batch = batch
+        self.__band_count = bands
+        self.__window = numpy.hanning(fft_size).astype(numpy.float32)
+        self.__band_edges : dict[int, tuple[numpy.ndarray, numpy.ndarray]] = dict()
+        self.__snapshot : AnalyzerSnapshot | None = None
+        self.__sequence : int = 0
+        self.__stop_event = threading.Event()
+        self.__worker : threading.Thread | None = None
+
+    @property
+    def snapshot(self) -> AnalyzerSnapshot | None:
+        return self.__snapshot
+
+    @property
+    def is_running(self) -> bool:
+        return self.__worker is not None
+
+    def start(self):
+        if self.__worker:
+            return
+        self.__stop_event = threading.Event()
+        self.__worker = threading.Thread(target=self.__run, args=(self.__stop_event,), daemon=True)
+        self.__worker.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.__worker = None
+
+    def __bands(self, samplerate : int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """First FFT bin of every band, log spaced from 30 Hz to Nyquist, and band center frequencies"""
+        if samplerate not in self.__band_edges:
+            resolution = samplerate / self.__fft_size
+            edges = numpy.geomspace(30.0, samplerate / 2, self.__band_count + 1)
+            bins = numpy.maximum(numpy.round(edges / resolution).astype(int), 1)
+            # Low bands narrower than a bin take one bin each
+            steps = numpy.arange(len(bins))
+            bins = numpy.minimum(numpy.maximum.accumulate(bins - steps) + steps, self.__fft_size // 2)
+            centers = numpy.sqrt(edges[:-1] * edges[1:])
+            self.__band_edges[samplerate] = (bins[:-1], centers)
+        return self.__band_edges[samplerate]
+
+    def __analyze(self, frames : numpy.ndarray, samplerate : int, level_frames : int) -> AnalyzerSnapshot:
+        if numpy.issubdtype(frames.dtype, numpy.integer):
+            scale = 1.0 / -numpy.iinfo(frames.dtype).min
+        else:
+            scale = 1.0
+        factor = max(int(samplerate // 48000), 1)
+        frames = frames[-max((self.__fft_size + (self.__batch - 1) * self.__fft_size // 2) * factor, level_frames):]
+        recent = frames[-level_frames:].astype(numpy.float32) * numpy.float32(scale)
+        peak = to_db(numpy.max(numpy.abs(recent), axis=0) ** 2)
+        # Twice the mean square so that a full scale sine reads 0 dB like its peak
+        rms = to_db(numpy.mean(recent ** 2, axis=0) * 2)
+
+        # Decimated mono signal, a boxcar average is enough ahead of a display
+        usable = len(frames) // factor * factor
+        mono = frames[len(frames) - usable:].astype(numpy.float32).mean(axis=1) * numpy.float32(scale)
+        if factor > 1:
+            mono = mono.reshape(-1, factor).mean(axis=1)
+        samplerate //= factor
+        hop = self.__fft_size // 2
+        first_bins, centers = self.__bands(samplerate)
+        if len(mono) < self.__fft_size:
+            bands = numpy.full(len(centers), SILENCE_DB)
+        else:
+            windows = numpy.lib.stride_tricks.sliding_window_view(mono, self.__fft_size)[::-hop][:self.__batch]
+            spectrum = numpy.abs(numpy.fft.rfft(windows * self.__window, axis=1)) ** 2
+            # Mean square of the band content, full scale sine at 0 dB
+            power = spectrum.mean(axis=0) * 4 / (self.__fft_size * numpy.sum(self.__window ** 2))
+            bands = to_db(numpy.add.reduceat(power, first_bins))
+        self.__sequence += 1
+        return AnalyzerSnapshot(self.__sequence, peak, rms, bands, centers)
+
+    def __run(self, stop_event : threading.Event):
+        interval = 1.0 / self.__rate
+        deadline = time.perf_counter()
+        silent = False
+        while not stop_event.is_set():
+            start_cpu = time.thread_time()
+            start = time.perf_counter()
+            # Views of the decoded pages, copied only when spanning two of them
+            tap = self.__tap(8 * (self.__fft_size + (self.__batch - 1) * self.__fft_size // 2))
+            if tap is not None and len(tap[0]):
+                frames, samplerate = tap
+                self.__snapshot = self.__analyze(frames, samplerate, int(samplerate * interval))
+                silent = False
+            elif not silent:
+                channels = len(self.__snapshot.peak) if self.__snapshot else 2
+                self.__sequence += 1
+                centers = self.__snapshot.frequencies if self.__snapshot else numpy.zeros(self.__band_count)
+                silence = numpy.full(channels, SILENCE_DB)
+                self.__snapshot = AnalyzerSnapshot(self.__sequence, silence, silence.copy(), numpy.full(len(centers), SILENCE_DB), centers.copy())
+                silent = True
+            elapsed = time.perf_counter() - start
+            diagnostics.add("analyzer", "updates")
+            diagnostics.add("analyzer", "cpu time (s)", time.thread_time() - start_cpu)
+            diagnostics.set("analyzer", "last update (ms)", round(elapsed * 1000, 3))
+            diagnostics.set("analyzer", "load (%)", round(100 * elapsed / interval, 2))
+            deadline += interval
+            stop_event.wait(max(deadline - time.perf_counter(), 0))
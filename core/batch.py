@@ -0,0 +1,35 @@
+import os
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Iterator
+
+def run_in_processes(function : Callable, jobs : Iterable[tuple], workers : int | None = None) -> Iterator[tuple[tuple, Future]]:
+    """Runs function over the arguments of each job in a process pool, yields every job with its future as it completes
+
+    Jobs are submitted as workers free up, twice as many as workers at most,
+    so memory doesn't grow with the number of jobs on huge libraries. The
+    future of a failed job raises its exception from result.
+
+    Parameters
+    ----------
+    function: callable
+        picklable function called with the arguments of a job in a worker process
+    jobs: iterable
+        argument tuples, read as the pool needs more work
+    workers: int
+        processes of the pool, the number of CPUs if None
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        in_flight : dict[Future, tuple] = dict()
+        queue = iter(jobs)
+        while True:
+            for arguments in queue:
+                in_flight[executor.submit(function, *arguments)] = arguments
+                if len(in_flight) >= workers * 2:
+                    break
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield in_flight.pop(future), future
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import sys
+from typing import Any
+
+APPLICATION_NAME = "handcrafted-audio-player"
+
+def cache_directory(name : str) -> str:
+    """Returns the per user cache directory of name, creating it when needed"""
+    if sys.platform == "win32":
+        root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        root = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    directory = os.path.join(root, APPLICATION_NAME, name)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def file_identity(filepath : str) -> str:
+    """Returns a key identifying a file's content as long as it isn't rewritten or moved
+
+    Derived from the absolute path, size and modification time so that no byte
+    of the file has to be read.
+    """
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+
+def content_identity(filepath : str, sample : int = 65536) -> str:
+    """Returns a key identifying a file's content wherever it is, moved or renamed
+
+    Derived from the size, modification time and the first and last sample
+    bytes, files extracted together with equal sizes and times still differ.
+    """
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        stat = os.fstat(f.fileno())
+        digest.update(f"{stat.st_size}\0{stat.st_mtime_ns}\0".encode())
+        digest.update(f.read(sample))
+        if stat.st_size > sample:
+            f.seek(max(stat.st_size - sample, sample))
+            digest.update(f.read(sample))
+    return digest.hexdigest()
+
+class IdentityStore():
+    """Values keyed by file identity, persisted as a JSON object in the user cache directory
+
+    A file rewritten or moved gets a new identity, its stale entry is never read again.
+    """
+    def __init__(self, filepath : str):
+        self.__filepath = filepath
+        self.__values : dict[str, Any] = dict()
+        try:
+            with open(self.__filepath, "r", encoding="utf-8") as f:
+                self.__values = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def get(self, filepath : str) -> Any | None:
+        try:
+            return self.__values.get(file_identity(filepath))
+        except OSError:
+            return None
+
+    def set(self, filepath : str, value : Any):
+        self.__values[file_identity(filepath)] = value
+
+    def save(self):
+        temporary_path = self.__filepath + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.__values, f)
+        os.replace(temporary_path, self.__filepath)
@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import tempfile
+from typing import Any, Callable
+
+# Kept free of the player modules, sending a command doesn't load audio libraries
+
+def default_socket_path() -> str:
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_directory:
+        return os.path.join(runtime_directory, "handcrafted-audio-player.sock")
+    return os.path.join(tempfile.gettempdir(), f"handcrafted-audio-player-{os.getuid()}.sock")
+
+def encode(message : dict[str, Any]) -> bytes:
+    """Messages are compact JSON objects, one per line"""
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+def daemon_reachable(socket_path : str | None = None) -> bool:
+    """True when a daemon accepts connections on socket_path, the default one if None"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(1.0)
+            connection.connect(socket_path or default_socket_path())
+        return True
+    except OSError:
+        return False
+
+class PlayerClient():
+    """Thin client of a PlayerDaemon, see PlayerDaemon for the protocol"""
+    # Longest message read, a page of the queue holds many tracks
+    LINE_LIMIT = 2**22
+
+    def __init__(self, socket_path : str | None = None):
+        self.__socket_path = socket_path or default_socket_path()
+        self.__reader : asyncio.StreamReader | None = None
+        self.__writer : asyncio.StreamWriter | None = None
+        self.__reader_task : asyncio.Task | None = None
+        self.__ids = itertools.count(1)
+        self.__pending : dict[int, asyncio.Future] = dict()
+        self.__on_status : list[Callable[[dict[str, Any]], None]] = list()
+        self.__on_device_changed : list[Callable[[dict[str, Any]], None]] = list()
+
+    @property
+    def on_status(self) -> list:
+        """Callbacks receiving the status pushed by the daemon once subscribed"""
+        return self.__on_status
+
+    @property
+    def on_device_changed(self) -> list:
+        """Callbacks receiving the device event pushed when the daemon moves playback to another output device"""
+        return self.__on_device_changed
+
+    async def connect(self):
+        self.__reader, self.__writer = await asyncio.open_unix_connection(self.__socket_path, limit=self.LINE_LIMIT)
+        self.__reader_task = asyncio.create_task(self.__read_messages())
+
+    async def close(self):
+        if self.__writer:
+            self.__writer.close()
+            await self.__writer.wait_closed()
+            self.__writer = None
+        if self.__reader_task:
+            await self.__reader_task
+            self.__reader_task = None
+
+    async def __aenter__(self) -> "PlayerClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def __read_messages(self):
+        assert self.__reader
+        try:
+            while line := await self.__reader.readline():
+                message = json.loads(line)
+                if "event" in message:
+                    for event in self.__on_status if message["event"] == "status" else self.__on_device_changed:
+                        event(message.get("status", message))
+                    continue
+                future = self.__pending.pop(message.get("id"), None)
+                if future and not future.done():
+                    if message["ok"]:
+                        future.set_result(message.get("result"))
+                    else:
+                        future.set_exception(RuntimeError(message["error"]))
+        except ConnectionResetError:
+            pass
+        finally:
+            for future in self.__pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection to the player daemon closed"))
+            self.__pending.clear()
+
+    async def request(self, command : str, **args) -> Any:
+        if not self.__writer:
+            raise ConnectionError("not connected to the player daemon")
+        request_id = next(self.__ids)
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[request_id] = future
+        self.__writer.write(encode({"id": request_id, "command": command, "args": args}))
+        await self.__writer.drain()
+        return await future
+
+    async def subscribe(self) -> dict[str, Any]:
+        return await self.request("subscribe")
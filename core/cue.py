@@ -0,0 +1,167 @@
+import os
+from core.decoders import registry as decoder_registry
+
+# INDEX times are minutes:seconds:frames of a compact disc, 75 frames per second
+CD_FRAMES_PER_SECOND = 75
+
+def is_cue_sheet(filename : str) -> bool:
+    return filename.lower().endswith(".cue")
+
+def parse_time(text : str) -> int:
+    """Returns an INDEX time as a number of compact disc frames"""
+    minutes, seconds, frames = (int(part) for part in text.split(":"))
+    if not 0 <= seconds < 60 or not 0 <= frames < CD_FRAMES_PER_SECOND:
+        raise ValueError(f"Invalid CUE time: {text}")
+    return (minutes * 60 + seconds) * CD_FRAMES_PER_SECOND + frames
+
+def _unquote(text : str) -> str:
+    text = text.strip()
+    if text.startswith('"'):
+        end = text.rfind('"')
+        return text[1:end] if end > 0 else text[1:]
+    return text
+
+def _read_lines(filepath : str) -> list[str]:
+    with open(filepath, "rb") as f:
+        content = f.read()
+    # Sheets written by older rippers are in the local code page
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("cp1252", errors="replace")
+    return text.splitlines()
+
+class CueTrack():
+    """Track of a CUE sheet, its start is the INDEX 01 of the track in compact disc frames"""
+    number : int
+    file : str
+    title : str | None = None
+    performer : str | None = None
+    start : int = 0
+
+    def start_frame(self, samplerate : int) -> int:
+        """Frame of the file the track starts at"""
+        return self.start * samplerate // CD_FRAMES_PER_SECOND
+
+class CueSheet():
+    """Tracks of a CUE sheet, grouped by the audio file they are read from.
+
+    Pregaps (INDEX 00) are played at the end of the previous track, so that
+    consecutive tracks of a file are contiguous and play without gap.
+    """
+    def __init__(self, path : str):
+        self.path : str = path
+        self.title : str | None = None
+        self.performer : str | None = None
+        self.tracks : list[CueTrack] = list()
+
+    @property
+    def files(self) -> list[str]:
+        return list(dict.fromkeys(track.file for track in self.tracks))
+
+    def tracks_of(self, filepath : str) -> list[CueTrack]:
+        """Tracks read from filepath, in the order of the sheet"""
+        return [track for track in self.tracks if track.file == filepath]
+
+    def end_frame(self, track : CueTrack, samplerate : int) -> int | None:
+        """Frame of the file the track ends at, the start of the next one, None for the last track of the file"""
+        tracks = self.tracks_of(track.file)
+        index = tracks.index(track)
+        return tracks[index + 1].start_frame(samplerate) if index + 1 < len(tracks) else None
+
+def resolve_file(directory : str, name : str) -> str:
+    """Path of a FILE entry, or of a file with the same name and another audio extension when it was converted after ripping"""
+    path = os.path.join(directory, name.replace("\\", os.sep))
+    if os.path.exists(path):
+        return path
+    stem = os.path.splitext(os.path.basename(path))[0].casefold()
+    directory = os.path.dirname(path)
+    try:
+        for candidate in sorted(os.listdir(directory)):
+            if os.path.splitext(candidate)[0].casefold() == stem and decoder_registry.is_supported_name(candidate):
+                return os.path.join(directory, candidate)
+    except OSError:
+        pass
+    return path
+
+def parse_cue_sheet(filepath : str) -> CueSheet:
+    """Reads the audio tracks of a CUE sheet
+
+    Raises
+    ------
+    OSError
+        when the sheet can't be read
+    ValueError
+        when the sheet is malformed
+    """
+    filepath = os.path.abspath(filepath)
+    directory = os.path.dirname(filepath)
+    sheet = CueSheet(filepath)
+    file : str | None = None
+    track : CueTrack | None = None
+    indexes : dict[int, int] = dict()
+
+    def close_track():
+        if track and (1 in indexes or 0 in indexes):
+            track.start = indexes.get(1, indexes.get(0, 0))
+            sheet.tracks.append(track)
+
+    for line in _read_lines(filepath):
+        keyword, _, rest = line.strip().partition(" ")
+        keyword = keyword.upper()
+        if keyword == "FILE":
+            # The last word is the file type, the name may be unquoted and hold spaces
+            name = rest.rsplit(" ", 1)[0] if not rest.strip().startswith('"') else rest
+            file = resolve_file(directory, _unquote(name))
+            if track and 1 not in indexes:
+                # The pregap was in the previous file, the track starts in this one
+                track.file = file
+                indexes.pop(0, None)
+            else:
+                close_track()
+                track = None
+        elif keyword == "TRACK":
+            close_track()
+            indexes = dict()
+            number, _, kind = rest.strip().partition(" ")
+            if not file:
+                raise ValueError(f"TRACK before FILE in {filepath}")
+            track = None
+            if kind.strip().upper() == "AUDIO":
+                track = CueTrack()
+                track.number = int(number)
+                track.file = file
+        elif keyword == "INDEX" and track:
+            number, _, value = rest.strip().partition(" ")
+            indexes[int(number)] = parse_time(value.strip())
+        elif keyword == "TITLE":
+            if track:
+                track.title = _unquote(rest)
+            else:
+                sheet.title = _unquote(rest)
+        elif keyword == "PERFORMER":
+            if track:
+                track.performer = _unquote(rest)
+            else:
+                sheet.performer = _unquote(rest)
+    close_track()
+    return sheet
+
+def find_cue_sheet(filepath : str) -> CueSheet | None:
+    """Returns the sheet of the directory of filepath referencing it, None if there isn't any"""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    try:
+        names = sorted(name for name in os.listdir(directory) if is_cue_sheet(name))
+    except OSError:
+        return None
+    # album.cue or album.flac.cue next to album.flac first
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    names.sort(key=lambda name: os.path.splitext(name)[0] not in (stem, os.path.basename(filepath)))
+    for name in names:
+        try:
+            sheet = parse_cue_sheet(os.path.join(directory, name))
+        except (OSError, ValueError):
+            continue
+        if sheet.tracks_of(os.path.abspath(filepath)):
+            return sheet
+    return None
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import os
+from typing import Any
+from core.client import default_socket_path, encode
+from core.device import DeviceInfo, HostApiInfo
+from core.hotplug import find_device
+from core.player import HandcraftedAudioPlayer, TrackInfo
+
+def track_to_dict(track : TrackInfo | None) -> dict[str, Any] | None:
+    if not track:
+        return None
+    return {
+        "path": track.path,
+        "title": track.title,
+        "artist": track.artist,
+        "album": track.album,
+        "duration": track.duration,
+        "elapsed": track.elapsed,
+        "samplerate": track.samplerate,
+        "bitdepth": getattr(track, "bitdepth", None),
+        "filetype": getattr(track, "filetype", None),
+        "start_frame": track.start_frame,
+        "cue_sheet": track.cue_sheet,
+    }
+
+def queue_change(previous : list[TrackInfo], queue : list[TrackInfo]) -> tuple[int, int, int]:
+    """Range of previous replaced to make queue: its start, the tracks removed and the tracks inserted there"""
+    end = min(len(previous), len(queue))
+    start = 0
+    while start < end and previous[start] is queue[start]:
+        start += 1
+    kept = 0
+    while kept < end - start and previous[-1 - kept] is queue[-1 - kept]:
+        kept += 1
+    return start, len(previous) - start - kept, len(queue) - start - kept
+
+def host_api_to_dict(api : HostApiInfo) -> dict[str, Any]:
+    """Host api and its output devices, shaped as sounddevice reports them so that HostApiInfo reads them back"""
+    return {
+        "name": api.name,
+        "default_output_device": api.default_output_device.index if api.default_output_device else -1,
+        "devices": [{
+            "name": device.name,
+            "index": device.index,
+            "max_input_channels": 0,
+            "max_output_channels": device.max_output_channels,
+            "default_low_output_latency": device.default_low_output_latency,
+            "default_high_output_latency": device.default_high_output_latency,
+            "default_samplerate": device.default_samplerate,
+        } for device in api.devices],
+    }
+
+class PlayerDaemon():
+    """Hosts a player and serves it to clients over a Unix domain socket.
+
+    Requests are {"id": n, "command": name, "args": {...}} and get a
+    {"id": n, "ok": bool, "result"|"error": ...} response. Clients sending
+    "subscribe" are pushed {"event": "status", "status": {...}} whenever the
+    track, playback state or queue changes, so they never have to poll, and
+    {"event": "device", ...} when the device monitor moves playback to
+    another output device.
+
+    A status whose queue changed since the previous push carries the range
+    replaced, {"since": version, "start": n, "removed": n, "count": n}, for
+    subscribers to fetch only the tracks inserted there. Subscribers reading
+    too slowly to keep SUBSCRIBER_BUFFER bytes of pushes are dropped.
+
+    The socket is created accessible to its owner only.
+    """
+    # Bytes of pushes left unread by a subscriber before it is dropped
+    SUBSCRIBER_BUFFER = 2**20
+
+    def __init__(self, player : HandcraftedAudioPlayer, socket_path : str | None = None):
+        self.__player = player
+        self.__socket_path = socket_path or default_socket_path()
+        self.__server : asyncio.AbstractServer | None = None
+        self.__subscribers : set[asyncio.StreamWriter] = set()
+        self.__status_scheduled : bool = False
+        # Tells subscribers to fetch the queue again, it may change without changing length
+        self.__queue_version : int = 0
+        # Queue and its version at the last push, the changes pushed are relative to it
+        self.__pushed_queue : list[TrackInfo] = list(player.current_playlist or [])
+        self.__pushed_version : int = 0
+        self.__commands = {
+            "status": self.__status,
+            "queue": self.__queue,
+            "load": self.__load,
+            "play": self.__play,
+            "pause": self.__pause,
+            "resume": self.__resume,
+            "stop": self.__stop,
+            "next": self.__next,
+            "previous": self.__previous,
+            "seek": self.__seek,
+            "crossfade": self.__crossfade,
+            "shuffle": self.__shuffle,
+            "repeat": self.__repeat,
+            "filter": self.__filter,
+            "collapse_duplicates": self.__collapse_duplicates,
+            "devices": self.__devices,
+            "device": self.__device,
+        }
+        player.on_track_changed.append(self.__schedule_status)
+        player.on_playback_state_changed.append(self.__schedule_status)
+        player.on_playlist_changed.append(self.__on_playlist_changed)
+        player.on_output_device_changed.append(self.__on_output_device_changed)
+
+    @property
+    def socket_path(self) -> str:
+        return self.__socket_path
+
+    async def start(self):
+        if os.path.exists(self.__socket_path):
+            # A socket left by a crashed daemon refuses connections
+            try:
+                _, writer = await asyncio.open_unix_connection(self.__socket_path)
+                writer.close()
+                raise RuntimeError(f"a daemon is already listening on {self.__socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.__socket_path)
+        # Created without group and other permissions rather than restricted once it already accepts connections
+        umask = os.umask(0o077)
+        try:
+            self.__server = await asyncio.start_unix_server(self.__handle_client, path=self.__socket_path)
+        finally:
+            os.umask(umask)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            if self.__server:
+                await self.__server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.__server:
+            self.__server.close()
+            self.__server = None
+        for writer in self.__subscribers:
+            writer.close()
+        self.__subscribers.clear()
+        if os.path.exists(self.__socket_path):
+            os.unlink(self.__socket_path)
+        self.__player.stop()
+
+    def status(self) -> dict[str, Any]:
+        player = self.__player
+        if player.is_stoped:
+            state = "stopped"
+        elif player.is_paused:
+            state = "paused"
+        else:
+            state = "playing"
+        return {
+            "state": state,
+            "index": player.current_track_index,
+            "track": track_to_dict(player.current_track),
+            "device": player.current_device.name if player.current_device else None,
+            "hostapi": player.current_device.hostapi.name if player.current_device else None,
+            "devices": [device.name for device in player.current_devices],
+            "repeat": player.is_repeat_enabled,
+            "shuffle": player.is_shuffle_enabled,
+            "crossfade": player.crossfade,
+            "collapse_duplicates": player.collapse_duplicates,
+            "search_query": player.search_query,
+            "queue_length": len(player.current_playlist or []),
+            "queue_version": self.__queue_version,
+        }
+
+    def __on_playlist_changed(self, *_):
+        self.__queue_version += 1
+        self.__schedule_status()
+
+    def __on_output_device_changed(self, device : DeviceInfo, reason : str, seconds : float):
+        self.__push(encode({"event": "device", "device": device.name, "hostapi": device.hostapi.name, "reason": reason, "seconds": seconds}))
+
+    def __schedule_status(self, *_):
+        # Events fired together (track change and state change) lead to a single push
+        if self.__subscribers and not self.__status_scheduled:
+            self.__status_scheduled = True
+            asyncio.get_running_loop().call_soon(self.__push_status)
+
+    def __push_status(self):
+        self.__status_scheduled = False
+        status = self.status()
+        if self.__queue_version != self.__pushed_version:
+            queue = self.__player.current_playlist or []
+            start, removed, count = queue_change(self.__pushed_queue, queue)
+            status["queue_change"] = {"since": self.__pushed_version, "start": start, "removed": removed, "count": count}
+            self.__pushed_queue = list(queue)
+            self.__pushed_version = self.__queue_version
+        self.__push(encode({"event": "status", "status": status}))
+
+    def __push(self, message : bytes):
+        for writer in list(self.__subscribers):
+            if writer.is_closing():
+                self.__subscribers.discard(writer)
+            elif writer.transport.get_write_buffer_size() > self.SUBSCRIBER_BUFFER:
+                # Pushes aren't drained, a subscriber not reading them would hold them all in memory
+                self.__subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(message)
+
+    async def __handle_client(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                response : dict[str, Any]
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    command = request["command"]
+                    if command == "subscribe":
+                        self.__subscribers.add(writer)
+                        result = self.status()
+                    elif command == "unsubscribe":
+                        self.__subscribers.discard(writer)
+                        result = None
+                    elif command in self.__commands:
+                        result = await self.__commands[command](**request.get("args", {}))
+                    else:
+                        raise ValueError(f"unknown command: {command}")
+                    response = {"id": request_id, "ok": True, "result": result}
+                except Exception as e:
+                    response = {"id": request_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+                writer.write(encode(response))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            self.__subscribers.discard(writer)
+            writer.close()
+
+    async def __status(self):
+        return self.status()
+
+    async def __queue(self, start : int = 0, count : int = 100, version : int | None = None):
+        if version is not None and version != self.__queue_version:
+            raise ValueError(f"queue changed since version {version}")
+        return [track_to_dict(track) for track in (self.__player.current_playlist or [])[start:start + count]]
+
+    async def __load(self, paths : list[str]):
+        self.__player.load_files(paths)
+        return len(self.__player.current_playlist or [])
+
+    async def __play(self, index : int | None = None):
+        await self.__player.play(index)
+
+    async def __pause(self):
+        self.__player.pause()
+
+    async def __resume(self):
+        self.__player.resume()
+
+    async def __stop(self):
+        self.__player.stop()
+
+    async def __next(self):
+        await self.__player.next()
+
+    async def __previous(self):
+        await self.__player.previous()
+
+    async def __seek(self, position : float):
+        return await self.__player.seek(position)
+
+    async def __crossfade(self, seconds : float | None = None):
+        if seconds is not None:
+            self.__player.crossfade = seconds
+        return self.__player.crossfade
+
+    async def __shuffle(self):
+        self.__player.shuffle()
+        return self.__player.is_shuffle_enabled
+
+    async def __repeat(self):
+        self.__player.repeat()
+        return self.__player.is_repeat_enabled
+
+    async def __filter(self, query : str):
+        self.__player.filter(query)
+        return len(self.__player.current_playlist or [])
+
+    async def __collapse_duplicates(self, value : bool | None = None):
+        if value is not None:
+            self.__player.collapse_duplicates = value
+        return self.__player.collapse_duplicates
+
+    async def __devices(self, refresh : bool = False):
+        # Enumerating may reinitialize PortAudio, kept off the loop
+        host_apis = await asyncio.to_thread(self.__player.refresh_device_list if refresh else self.__player.get_outout_device_list_by_api)
+        return [host_api_to_dict(api) for api in host_apis]
+
+    async def __device(self, hostapi : str, name : str):
+        device = find_device(self.__player.get_outout_device_list_by_api(), (hostapi, name))
+        if not device:
+            raise ValueError(f"output device not found: {hostapi}: {name}")
+        current = self.__player.current_device
+        if not current or (current.hostapi.name, current.name) != (hostapi, name):
+            self.__player.stop()
+            self.__player.set_output_device(device)
+            self.__schedule_status()
+        return device.name
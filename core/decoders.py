@@ -0,0 +1,207 @@
+import os
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from typing import Any, Iterator
+from core.readahead import ReadAheadFile
+from core.tracing import tracer
+
+HEADER_SIZE = 12
+ID3_HEADER_SIZE = 10
+
+def skip_id3v2(f: Any) -> int:
+    """Moves the binary file f past the ID3v2 tag it starts with, taggers prepend one to MP3 and FLAC files alike
+
+    Returns
+    -------
+    int
+        offset of the audio stream, 0 without tag
+    """
+    header = f.read(ID3_HEADER_SIZE)
+    offset = 0
+    if len(header) == ID3_HEADER_SIZE and header[:3] == b"ID3":
+        # Synchsafe size, 7 bits per byte, of the tag past its header and without its optional footer
+        size = (header[6] & 0x7F) << 21 | (header[7] & 0x7F) << 14 | (header[8] & 0x7F) << 7 | (header[9] & 0x7F)
+        offset = ID3_HEADER_SIZE + size + (ID3_HEADER_SIZE if header[5] & 0x10 else 0)
+    f.seek(offset)
+    return offset
+
+class Decoder(ABC):
+    """Base class of audio decoders, a decoder is selected by file extension and header magic"""
+    name : str = ""
+    extensions : tuple[str, ...] = ()
+
+    def sniff(self, header: bytes) -> bool:
+        """Returns True when the first HEADER_SIZE bytes of the stream of a file, past any ID3v2 tag, look like a supported one"""
+        return False
+
+    @abstractmethod
+    def info(self, filepath: str) -> Any:
+        """Returns a soundfile.info like object with samplerate, channels, frames, format, subtype and subtype_info"""
+
+    @abstractmethod
+    def open(self, filepath: str, file: Any = None) -> Any:
+        """Returns a soundfile.SoundFile like context manager supporting read, seek, tell, frames and samplerate
+
+        Parameters
+        ----------
+        file: file object
+            binary file the stream of filepath is read from, filepath is opened when not given
+        """
+
+class SoundFileDecoder(Decoder):
+    name = "libsndfile"
+    extensions = (".flac", ".wav", ".wave", ".aif", ".aiff", ".aifc", ".ogg", ".oga", ".opus", ".mp3", ".caf", ".w64", ".rf64")
+
+    def __init__(self):
+        self.__available_formats : set[str] | None = None
+
+    def __format(self, header: bytes) -> str | None:
+        if header.startswith(b"fLaC"):
+            return "FLAC"
+        if header[:4] in (b"RIFF", b"RIFX") and header[8:12] == b"WAVE":
+            return "WAV"
+        if header.startswith(b"RF64"):
+            return "RF64"
+        if header.startswith(b"riff"):
+            return "W64"
+        if header.startswith(b"FORM") and header[8:12] in (b"AIFF", b"AIFC"):
+            return "AIFF"
+        if header.startswith(b"OggS"):
+            return "OGG"
+        if header.startswith(b"caff"):
+            return "CAF"
+        if len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+            return "MP3"
+        return None
+
+    def sniff(self, header: bytes) -> bool:
+        if self.__available_formats is None:
+            import soundfile
+            self.__available_formats = set(soundfile.available_formats().keys())
+        return self.__format(header) in self.__available_formats
+
+    def info(self, filepath: str) -> Any:
+        import soundfile
+        return soundfile.info(filepath)
+
+    def open(self, filepath: str, file: Any = None) -> Any:
+        import soundfile
+        return soundfile.SoundFile(file=file or filepath)
+
+def sample_dtype(subtype: str) -> Any:
+    """Numpy dtype samples of a soundfile subtype are decoded to, integers are kept as such"""
+    import numpy
+    if subtype == 'PCM_16':
+        return numpy.int16
+    elif subtype == 'PCM_24':
+        return numpy.int32
+    return numpy.float32
+
+def decode_blocks(filepath: str, samplerate: int | None = None, channels: int | None = None, dtype: Any = None, blocksize: int | None = None, decoder: Decoder | None = None, start: int = 0, read_ahead: int = 0) -> Iterator[Any]:
+    """Yields the audio of a file as (frames, channels) arrays, decoded blockwise
+
+    Parameters
+    ----------
+    samplerate: int
+        rate the blocks are resampled to with soxr, the file rate when not given
+    channels: int
+        channel count of the blocks, see mixer.remix
+    dtype: numpy dtype
+        sample type, sample_dtype of the file subtype when not given
+    blocksize: int
+        frames read from the file per block, one second when not given
+    start: int
+        frame of the file decoding starts from
+    read_ahead: int
+        bytes of the file read ahead of the decoder by a worker thread, see ReadAheadFile. Read as decoded when 0
+    """
+    from core import mixer
+    decoder = decoder or registry.get(filepath)
+    source = ReadAheadFile(filepath, window=read_ahead) if read_ahead else None
+    try:
+        with tracer.span("open", "decode", path=filepath, decoder=decoder.name):
+            f = decoder.open(filepath, source)
+    except BaseException:
+        if source:
+            source.close()
+        raise
+    # The decoder is closed before its source
+    with source or nullcontext(), f:
+        dtype = dtype or sample_dtype(f.subtype)
+        channels = channels or f.channels
+        blocksize = blocksize or int(f.samplerate)
+        resampler = None
+        if samplerate and samplerate != f.samplerate:
+            with tracer.span("create resampler", "soxr", in_rate=f.samplerate, out_rate=samplerate):
+                import soxr
+                resampler = soxr.ResampleStream(
+                        in_rate=f.samplerate,
+                        out_rate=samplerate,
+                        num_channels=channels,
+                        dtype=dtype,
+                        quality=soxr.VHQ
+                    )
+        if start:
+            f.seek(min(start, f.frames))
+        while f.tell() < f.frames:
+            frames = min(blocksize, f.frames - f.tell())
+            with tracer.span("read", "decode", frames=frames):
+                data = f.read(frames=frames, dtype=dtype, always_2d=True, fill_value=0)
+            data = mixer.remix(data, channels)
+            if resampler:
+                with tracer.span("resample", "soxr", frames=len(data)):
+                    data = resampler.resample_chunk(data, last=f.tell() >= f.frames)
+            yield data
+
+class DecoderRegistry():
+    def __init__(self):
+        self.__decoders : list[Decoder] = list()
+        self.__by_extension : dict[str, list[Decoder]] = dict()
+
+    @property
+    def decoders(self) -> list[Decoder]:
+        return self.__decoders
+
+    def register(self, decoder: Decoder, first: bool = False):
+        """Registers a decoder, decoders registered with first=True are tried before the existing ones"""
+        if first:
+            self.__decoders.insert(0, decoder)
+        else:
+            self.__decoders.append(decoder)
+        self.__by_extension.clear()
+        for registered in self.__decoders:
+            for extension in registered.extensions:
+                self.__by_extension.setdefault(extension, list()).append(registered)
+
+    def is_supported_name(self, filename: str) -> bool:
+        return os.path.splitext(filename)[1].lower() in self.__by_extension
+
+    def find(self, filepath: str) -> Decoder | None:
+        """Returns the decoder able to read filepath, judging from its extension and header bytes
+
+        Only HEADER_SIZE bytes are read, past the ID3v2 tag the file may start
+        with, unsupported files are rejected without parsing tags or opening a
+        decoder.
+        """
+        candidates = self.__by_extension.get(os.path.splitext(filepath)[1].lower())
+        if not candidates:
+            return None
+        try:
+            with open(filepath, "rb") as f:
+                skip_id3v2(f)
+                header = f.read(HEADER_SIZE)
+        except OSError:
+            return None
+        for decoder in candidates:
+            if decoder.sniff(header):
+                return decoder
+        return None
+
+    def get(self, filepath: str) -> Decoder:
+        decoder = self.find(filepath)
+        if not decoder:
+            raise ValueError(f"unsupported audio file: {filepath}")
+        return decoder
+
+registry = DecoderRegistry()
+registry.register(SoundFileDecoder())
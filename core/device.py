@@ -1,22 +1,71 @@
 import numpy
-import soxr
-import soundfile
+import queue
 import threading
-import sounddevice
-import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import error
-from typing import Any
-from core.sounddeviceextensions import ExWasapiSettings
+from typing import Any, Callable
+from core.decoders import Decoder, decode_blocks, sample_dtype, registry as decoder_registry
+from core.diagnostics import diagnostics
+from core.tracing import tracer
+from core import memory, mixer, realtime
+
+# sounddevice loads PortAudio, it is imported by the code enumerating devices or opening streams
+
+class PortAudioStreams():
+    """Open PortAudio streams, PortAudio is only reinitialized when there is none
+
+    Streams are opened and closed, and PortAudio reinitialized, under one
+    lock: a stream opened from the event loop can't race a reinitialization
+    made from a thread to list hotplugged devices.
+    """
+    def __init__(self):
+        self.__lock : threading.RLock = threading.RLock()
+        self.__count : int = 0
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    def open(self, **kwargs) -> "sounddevice.OutputStream":
+        import sounddevice
+        with self.__lock:
+            stream = sounddevice.OutputStream(**kwargs)
+            self.__count += 1
+        return stream
+
+    def close(self, stream : "sounddevice.OutputStream", abort : bool = False):
+        with self.__lock:
+            if abort:
+                stream.abort(ignore_errors=True)
+            else:
+                stream.stop(ignore_errors=True)
+            stream.close(ignore_errors=True)
+            self.__count -= 1
+
+    def reinitialize(self) -> bool:
+        """Reinitializes PortAudio unless a stream is open, returns whether it was"""
+        with self.__lock:
+            if self.__count:
+                return False
+            import sounddevice
+            sounddevice._terminate()
+            sounddevice._initialize()
+            return True
+
+portaudio = PortAudioStreams()
 
 class HostApiInfo():
-    def __init__(self, hostapi_info: Any | dict[str, Any]):
-        print(hostapi_info)
+    def __init__(self, hostapi_info: Any | dict[str, Any], devices: Any | list[dict[str, Any]] | None = None):
         self.__name = hostapi_info['name']
         self.__index = self.__name.replace(" ", "_").lower()
         self.__devices = list[DeviceInfo]()
         self.__default_output_device = None
+        if devices is None:
+            import sounddevice
         for device_id in hostapi_info['devices']:
-            device = sounddevice.query_devices(device_id)
+            device = devices[device_id] if devices is not None else sounddevice.query_devices(device_id)
             if device['max_input_channels'] == 0 and device['name'] != "":
                 device_info = DeviceInfo(device_info=device, hostapi_info=self, is_default_device=device_id == hostapi_info['default_output_device'])
                 self.devices.append(device_info)
@@ -89,18 +138,86 @@ class DeviceInfo():
     def default_samplerate(self) -> int:
         return self.__default_samplerate
 
+class OutputDeviceList():
+    """Host APIs and their output devices, enumerated once and cached
+
+    PortAudio only sees devices plugged after its initialization once it has
+    been reinitialized, which a refresh does when no stream is open, see
+    PortAudioStreams.
+    """
+    def __init__(self):
+        self.__lock : threading.Lock = threading.Lock()
+        self.__host_apis : list[HostApiInfo] | None = None
+        self.__signature : tuple | None = None
+        self.__on_changed : list = list()
+
+    @property
+    def on_changed(self) -> list:
+        """Callbacks receiving the new host api list when a refresh finds different devices"""
+        return self.__on_changed
+
+    @property
+    def cached(self) -> list[HostApiInfo] | None:
+        return self.__host_apis
+
+    def invalidate(self):
+        with self.__lock:
+            self.__host_apis = None
+
+    def get(self, refresh: bool = False, on_host_api: Callable[[HostApiInfo], None] | None = None, reinitialize: bool = False) -> list[HostApiInfo]:
+        """Returns output devices grouped by host api, enumerating them if they aren't cached
+
+        Parameters
+        ----------
+        refresh: bool
+            enumerate again even if a list is cached
+        on_host_api: callable
+            called with every host api as soon as its devices are known, from the calling thread
+        reinitialize: bool
+            reinitialize PortAudio first so that hotplugged devices are listed, skipped while a stream is open
+        """
+        with self.__lock:
+            if self.__host_apis is not None and not refresh:
+                if on_host_api:
+                    for api in self.__host_apis:
+                        on_host_api(api)
+                return self.__host_apis
+            if reinitialize:
+                portaudio.reinitialize()
+            import sounddevice
+            # One query for all devices instead of one per device
+            devices = sounddevice.query_devices()
+            host_apis = list[HostApiInfo]()
+            for api in sounddevice.query_hostapis():
+                host_api = HostApiInfo(api, devices)
+                host_apis.append(host_api)
+                if on_host_api:
+                    on_host_api(host_api)
+            signature = tuple((device['name'], device['hostapi'], device['max_output_channels']) for device in devices)
+            changed = self.__signature is not None and signature != self.__signature
+            self.__host_apis = host_apis
+            self.__signature = signature
+        if changed:
+            for event in self.__on_changed:
+                event(host_apis)
+        return host_apis
+
 class OutputDeviceConfiguration:
     samplerate: int
     blocksize: int
     prefill_buffersize: int
     channels: int
     dtype: Any
-    file: soundfile._SoundFileInfo
+    file: Any
+    decoder: Decoder
     extra_settings : Any | None = None
 
     def __init__(self, filename: str, device_info : DeviceInfo):
         self.__device_info = device_info
-        self.file = soundfile.info(filename)
+        with tracer.span("select decoder", "configuration"):
+            self.decoder = decoder_registry.get(filename)
+        with tracer.span("file info", "configuration", decoder=self.decoder.name):
+            self.file = self.decoder.info(filename)
 
         self.__initialize_extra_settings()
 
@@ -112,26 +229,24 @@ class OutputDeviceConfiguration:
 
         # Define playback sample rate
         self.samplerate = int(self.file.samplerate)
-        max_output_samplerate = self.__get_max_playback_samplerate()
+        with tracer.span("probe sample rates", "configuration", device=device_info.name):
+            max_output_samplerate = self.__get_max_playback_samplerate()
         if self.samplerate > max_output_samplerate:
             self.samplerate = max_output_samplerate
 
         self.prefill_buffersize = 20
         self.blocksize = self.samplerate
 
-        if self.file.subtype == 'PCM_16':
-            self.dtype = numpy.int16
-        elif self.file.subtype == 'PCM_24':
-            self.dtype = numpy.int32
-        else:
-            self.dtype = numpy.float32
+        self.dtype = sample_dtype(self.file.subtype)
 
     def __initialize_extra_settings(self):
         self.extra_settings = None
         if self.__device_info.hostapi.name == "Windows WASAPI":
+            from core.sounddeviceextensions import ExWasapiSettings
             self.extra_settings = ExWasapiSettings(exclusive=True, thread_priority=True, polling=True)
 
     def __get_max_playback_samplerate(self) -> int:
+        import sounddevice
         sample_rates = [384000, 352800, 192000, 176400, 96000, 88200, 48000, 44100, 22050]
         for rate in sample_rates:
             try:
@@ -156,114 +271,841 @@ class DevicePlaybackInfo():
         self.bitdepth = bitdepth
         self.filetype = filetype
 
+class DecodeStream():
+    """Decodes a file at the output format of a device from a worker thread, into pages of one block.
+
+    Every page is asked to the memory governor: pages within the prefill
+    ahead of the played frame are playback buffers, further ones decode-ahead
+    and pages played already a cache for seeking back, dropped first when
+    memory runs short. A stream may start anywhere in the track.
+    """
+    # Pages kept behind the played frame, read by the tap and by fades
+    KEEP_BEHIND_PAGES = 2
+
+    def __init__(self, configuration: OutputDeviceConfiguration, realtime: bool = False, start: int = 0, preload: bool = False, read_ahead: int = 0):
+        self.__configuration = configuration
+        self.__page_frames = configuration.blocksize
+        self.__lead_frames = configuration.prefill_buffersize * configuration.blocksize
+        self.__pages: dict[int, numpy.ndarray] = dict()
+        self.__locked_pages: set[int] = set()
+        self.__realtime = realtime
+        self.__read_ahead = read_ahead
+        self.__preload = preload
+        self.__expected_frames = int(configuration.file.frames * configuration.samplerate / configuration.file.samplerate)
+        self.__start = start
+        self.__retained_from = start
+        self.__played = start
+        self.__frames : int = start
+        self.__finished : bool = False
+        self.__stop_event = threading.Event()
+        self.__progress = threading.Condition()
+        self.__worker = threading.Thread(target=self.__fill_buffer_worker, daemon=True)
+
+    @property
+    def configuration(self) -> OutputDeviceConfiguration:
+        return self.__configuration
+
+    @property
+    def frames(self) -> int:
+        """Frame decoding reached, frames before start aren't decoded"""
+        return self.__frames
+
+    @property
+    def start_frame(self) -> int:
+        return self.__start
+
+    @property
+    def retained_from(self) -> int:
+        """First frame still in memory"""
+        return self.__retained_from
+
+    @property
+    def finished(self) -> bool:
+        return self.__finished
+
+    @property
+    def expected_frames(self) -> int:
+        """Track length at the output sample rate, exact once decoding is finished"""
+        return self.__frames if self.__finished else self.__expected_frames
+
+    @property
+    def played(self) -> int:
+        """Frame playback reached, set by the segments reading the stream"""
+        return self.__played
+
+    @played.setter
+    def played(self, frame: int):
+        self.__played = frame
+
+    @property
+    def preload(self) -> bool:
+        """True while the stream is decoded ahead of its track, all its pages are then decode-ahead"""
+        return self.__preload
+
+    @preload.setter
+    def preload(self, value: bool):
+        self.__preload = value
+
+    def start(self):
+        self.__worker.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        with self.__progress:
+            for index in list(self.__locked_pages):
+                self.__unlock_page(index)
+
+    def wait_for(self, frames: int, timeout: float | None = None) -> bool:
+        """Waits until frames are decoded or the whole track is, returns False on timeout"""
+        with self.__progress:
+            return self.__progress.wait_for(lambda: self.__frames >= frames or self.__finished, timeout)
+
+    def view(self, position: int, frames: int) -> numpy.ndarray:
+        """Decoded frames from position up to the end of its page, without copy"""
+        page = self.__pages.get(position // self.__page_frames)
+        if page is None or position < self.__retained_from:
+            return numpy.empty((0, self.__configuration.channels), dtype=self.__configuration.dtype)
+        offset = position % self.__page_frames
+        return page[offset:offset + min(frames, self.__frames - position, self.__page_frames - offset)]
+
+    def frames_between(self, start: int, stop: int) -> numpy.ndarray:
+        """Frames from start to stop bounded to the frames in memory, a view when they lie in one page"""
+        start = max(start, self.__retained_from)
+        stop = min(stop, self.__frames)
+        blocks = list[numpy.ndarray]()
+        while start < stop:
+            block = self.view(start, stop - start)
+            if not len(block):
+                break
+            blocks.append(block)
+            start += len(block)
+        if len(blocks) == 1:
+            return blocks[0]
+        return numpy.concatenate(blocks) if blocks else self.view(start, 0)
+
+    def memory_usage(self) -> tuple[int, int, int]:
+        """Bytes of playback buffers, decode-ahead and played pages, indexed by memory priority"""
+        played_page = self.__played // self.__page_frames
+        lead_page = (self.__played + self.__lead_frames) // self.__page_frames
+        usage = [0, 0, 0]
+        for index, page in list(self.__pages.items()):
+            if self.__preload or index > lead_page:
+                usage[memory.DECODE_AHEAD] += page.nbytes
+            elif index < played_page - self.KEEP_BEHIND_PAGES:
+                usage[memory.CACHE] += page.nbytes
+            else:
+                usage[memory.PLAYBACK] += page.nbytes
+        return usage[0], usage[1], usage[2]
+
+    def release_played(self, size: int) -> int:
+        """Drops pages played already, the oldest first, until size bytes are freed. Returns the bytes freed"""
+        freed = 0
+        last = self.__played // self.__page_frames - self.KEEP_BEHIND_PAGES
+        with self.__progress:
+            for index in sorted(index for index in self.__pages if index < last):
+                if freed >= size:
+                    break
+                self.__retained_from = max(self.__retained_from, (index + 1) * self.__page_frames)
+                if index in self.__locked_pages:
+                    self.__unlock_page(index)
+                freed += self.__pages.pop(index).nbytes
+        return freed
+
+    def __unlock_page(self, index: int):
+        realtime.unlock_memory(self.__pages[index])
+        self.__locked_pages.discard(index)
+
+    def __allocate_page(self, index: int) -> numpy.ndarray | None:
+        """Allocates a page once the governor grants it, None when the stream is stopped first"""
+        configuration = self.__configuration
+        size = self.__page_frames * configuration.channels * numpy.dtype(configuration.dtype).itemsize
+        while not self.__stop_event.is_set():
+            ahead = self.__preload or index * self.__page_frames >= self.__played + self.__lead_frames
+            if memory.memory_governor.request(memory.DECODE_AHEAD if ahead else memory.PLAYBACK, size):
+                with tracer.span("allocate page", "decode", page=index, bytes=size):
+                    page = numpy.empty((self.__page_frames, configuration.channels), dtype=configuration.dtype)
+                    with self.__progress:
+                        self.__pages[index] = page
+                        if self.__realtime and not self.__stop_event.is_set() and realtime.lock_memory(page):
+                            self.__locked_pages.add(index)
+                return page
+            # Played pages freed or the budget raised later on
+            self.__stop_event.wait(0.1)
+        return None
+
+    def __fill_buffer_worker(self) -> None:
+        configuration = self.__configuration
+        if self.__realtime:
+            diagnostics.set("realtime", "decode worker scheduling", realtime.raise_thread_priority())
+        try:
+            position = self.__start
+            blocks = decode_blocks(
+                    configuration.file.name,
+                    samplerate=configuration.samplerate,
+                    channels=configuration.channels,
+                    dtype=configuration.dtype,
+                    blocksize=configuration.blocksize,
+                    decoder=configuration.decoder,
+                    read_ahead=self.__read_ahead,
+                    start=round(self.__start * configuration.file.samplerate / configuration.samplerate)
+                )
+            for data in blocks:
+                # The resampler may return a few frames more than the input length allows for, position is at the output rate
+                data = data[:max(self.__expected_frames - position, 0)]
+                while len(data):
+                    index, offset = divmod(position, self.__page_frames)
+                    page = self.__pages.get(index)
+                    if page is None:
+                        page = self.__allocate_page(index)
+                    if page is None:
+                        break
+                    count = min(len(data), self.__page_frames - offset)
+                    page[offset:offset+count] = data[:count]
+                    data = data[count:]
+                    position += count
+                    with self.__progress:
+                        self.__frames = position
+                        self.__progress.notify_all()
+                if self.__stop_event.is_set():
+                    blocks.close()
+                    break
+        finally:
+            with self.__progress:
+                self.__finished = True
+                self.__progress.notify_all()
+
+class PlaybackSegment():
+    """A run of frames the audio callback copies to the device.
+
+    Frames come either from the pages of a decode stream, growing while it is
+    decoded, or from a transition block (fade, crossfade) prepared outside of
+    the callback. A stop segment halts the output stream when reached.
+    """
+    data: numpy.ndarray | None
+    source: DecodeStream | None
+    position: int
+    end: int | None
+    origin: int
+    stop: bool
+
+    def __init__(self, source: DecodeStream | None, position: int = 0, end: int | None = None, data: numpy.ndarray | None = None, origin: int = 0, stop: bool = False):
+        self.source = source
+        self.data = data
+        self.position = position
+        self.end = len(data) if data is not None else end
+        # Track frame matching position 0 of a transition block
+        self.origin = origin
+        self.stop = stop
+
+    def available(self) -> int:
+        if self.data is not None:
+            return self.end - self.position
+        if not self.source:
+            return 0
+        limit = self.source.frames if self.end is None else min(self.end, self.source.frames)
+        return max(limit - self.position, 0)
+
+    def exhausted(self) -> bool:
+        if self.data is not None or not self.source:
+            return self.stop or self.position >= (self.end or 0)
+        if self.end is not None and self.position >= self.end:
+            return True
+        return self.source.finished and self.position >= self.source.frames
+
+    def read(self, frames: int) -> numpy.ndarray:
+        """Takes up to frames available, fewer at the end of a page of the source"""
+        if self.data is not None:
+            data = self.data[self.position:min(self.position+frames, self.end)]
+        else:
+            data = self.source.view(self.position, min(frames, self.available()))
+        self.position += len(data)
+        if self.source and self.data is None:
+            self.source.played = self.position
+        return data
+
+    @property
+    def track_position(self) -> int:
+        if self.data is not None:
+            return self.origin + self.position
+        return self.position
+
+    def remaining(self) -> int:
+        """Frames left to play, decoded or not"""
+        if self.data is not None:
+            return self.end - self.position
+        if not self.source:
+            return 0
+        end = self.source.expected_frames if self.end is None else self.end
+        return max(end - self.position, 0)
+
+class RingBuffer():
+    """Ring of frames with a single writer and a single reader, neither of them waits for the other"""
+    def __init__(self, frames: int, channels: int, dtype: Any, locked: bool = False):
+        self.__buffer = numpy.zeros((frames, channels), dtype=dtype)
+        self.__written : int = 0
+        self.__read : int = 0
+        self.__locked = locked and realtime.lock_memory(self.__buffer)
+
+    def release(self):
+        if self.__locked:
+            realtime.unlock_memory(self.__buffer)
+            self.__locked = False
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__buffer)
+
+    @property
+    def nbytes(self) -> int:
+        return self.__buffer.nbytes
+
+    @property
+    def fill(self) -> int:
+        return self.__written - self.__read
+
+    def write(self, data: numpy.ndarray) -> int:
+        """Writes as many frames of data as there is room for and returns their count"""
+        count = min(len(data), self.capacity - self.fill)
+        start = self.__written % self.capacity
+        first = min(count, self.capacity - start)
+        self.__buffer[start:start+first] = data[:first]
+        self.__buffer[:count-first] = data[first:count]
+        self.__written += count
+        return count
+
+    def read_into(self, out: numpy.ndarray) -> int:
+        """Fills out with as many frames as available and returns their count"""
+        count = min(len(out), self.fill)
+        start = self.__read % self.capacity
+        first = min(count, self.capacity - start)
+        out[:first] = self.__buffer[start:start+first]
+        out[first:count] = self.__buffer[:count-first]
+        self.__read += count
+        return count
+
+class MirrorOutput():
+    """Plays what an output device plays on another device.
+
+    Blocks rendered by the leading device are fed from its fan out worker,
+    resampled to the rate of this device, then frames are dropped or repeated
+    to keep the ring at its target fill however the two clocks drift apart.
+    The callback only copies from the ring.
+    """
+    RING_SECONDS = 4.0
+    MAX_DRIFT_PPM = 1000
+    # Drift correction in ratio per second of fill error and per accumulated second, critically damped
+    PROPORTIONAL_GAIN = 0.1
+    INTEGRAL_GAIN = 0.0025
+
+    def __init__(self, device_info: DeviceInfo, realtime: bool = False):
+        self.__device_info = device_info
+        self.__realtime = realtime
+        self.__output_stream: sounddevice.OutputStream | None = None
+        self.__format: tuple | None = None
+        self.__ring: RingBuffer | None = None
+        self.__resampler: Any | None = None
+        self.__samplerate: int = 0
+        self.__channels: int = 0
+        self.__target: int = 0
+        self.__integral: float = 0.0
+        self.__carry: float = 0.0
+        self.__drift_ppm: float = 0.0
+        self.__last_callback_time: float = 0.0
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        return self.__device_info
+
+    @property
+    def nbytes(self) -> int:
+        ring = self.__ring
+        return ring.nbytes if ring else 0
+
+    @property
+    def drift_ppm(self) -> float:
+        """Rate correction currently applied, positive when this device runs slower than the leading one"""
+        return self.__drift_ppm
+
+    def open(self, configuration: OutputDeviceConfiguration, latency: float):
+        """Opens the device for the output format of the leading device, whose output latency is latency"""
+        import soxr
+        mirror = OutputDeviceConfiguration(filename=configuration.file.name, device_info=self.__device_info)
+        samplerate = min(mirror.samplerate, configuration.samplerate)
+        format = (configuration.samplerate, samplerate, numpy.dtype(configuration.dtype), configuration.channels, mirror.channels)
+        if format == self.__format and self.__output_stream:
+            return
+        self.close()
+        self.__samplerate = samplerate
+        self.__channels = mirror.channels
+        self.__ring = RingBuffer(int(self.RING_SECONDS * samplerate), mirror.channels, configuration.dtype, locked=self.__realtime)
+        self.__resampler = None
+        if samplerate != configuration.samplerate:
+            self.__resampler = soxr.ResampleStream(
+                    in_rate=configuration.samplerate,
+                    out_rate=samplerate,
+                    num_channels=mirror.channels,
+                    dtype=configuration.dtype,
+                    quality=soxr.HQ
+                )
+        blocksize = samplerate // 10
+        self.__output_stream = portaudio.open(
+                device=self.__device_info.index,
+                dtype=configuration.dtype,
+                extra_settings=mirror.extra_settings,
+                samplerate=samplerate,
+                blocksize=blocksize,
+                channels=mirror.channels,
+                dither_off=True,
+                clip_off=True,
+                callback=self.__callback,
+            )
+        # Blocks are fed when the leading device takes them, they are heard after its latency
+        self.__target = int(max(latency - self.__output_stream.latency, 2 * blocksize / samplerate) * samplerate)
+        self.__integral = 0.0
+        self.__carry = 0.0
+        self.__format = format
+        self.__output_stream.start()
+
+    def close(self):
+        if self.__output_stream:
+            portaudio.close(self.__output_stream)
+            self.__output_stream = None
+        self.__format = None
+        if self.__ring:
+            self.__ring.release()
+        self.__ring = None
+
+    def __callback(self, outdata, frames, time_info, status) -> None:
+        ring = self.__ring
+        read = ring.read_into(outdata) if ring else 0
+        outdata[read:] = 0
+        self.__last_callback_time = time.perf_counter()
+
+    def feed(self, block: numpy.ndarray):
+        """Queues a block rendered by the leading device, called from its fan out worker"""
+        ring = self.__ring
+        if not ring or not self.__output_stream:
+            return
+        block = mixer.remix(block, self.__channels)
+        if self.__resampler:
+            block = self.__resampler.resample_chunk(block)
+
+        # The fill is measured right before every write, at the same point of the leading device cycle.
+        # Frames played since the last callback are estimated, the fill only moves by whole blocks.
+        name = self.__device_info.name
+        assert self.__output_stream
+        played = min((time.perf_counter() - self.__last_callback_time) * self.__samplerate, self.__output_stream.blocksize)
+        fill = max(ring.fill - played, 0)
+        error = (fill - self.__target) / self.__samplerate
+        if not ring.fill or abs(error) > 0.25:
+            # Ring ran dry, the leading device was paused, or far off: start over at the target fill
+            self.__integral = 0.0
+            self.__carry = 0.0
+            if error > 0:
+                block = block[min(ring.fill - self.__target, len(block)):]
+            else:
+                ring.write(numpy.zeros((self.__target - ring.fill, self.__channels), dtype=block.dtype))
+            diagnostics.add("outputs", f"{name} resyncs")
+        else:
+            self.__integral += error * len(block) / self.__samplerate
+            limit = self.MAX_DRIFT_PPM * 1e-6 / self.INTEGRAL_GAIN
+            self.__integral = min(max(self.__integral, -limit), limit)
+            ratio = self.PROPORTIONAL_GAIN * error + self.INTEGRAL_GAIN * self.__integral
+            ratio = min(max(ratio, -self.MAX_DRIFT_PPM * 1e-6), self.MAX_DRIFT_PPM * 1e-6)
+            self.__drift_ppm = ratio * 1e6
+            frames = ratio * len(block) + self.__carry
+            slipped = int(frames)
+            self.__carry = frames - slipped
+            block = mixer.slip(block, slipped)
+            diagnostics.add("outputs", f"{name} slipped frames", abs(slipped))
+            diagnostics.set("outputs", f"{name} drift (ppm)", round(self.__drift_ppm, 1))
+        if ring.write(block) < len(block):
+            diagnostics.add("outputs", f"{name} dropped blocks")
+
 class OutputDevice:
-    def __init__(self, device_info: DeviceInfo):
+    """Plays tracks on an output device.
+
+    The audio callback only copies frames from a chain of playback segments.
+    Fades, crossfades and seeks are prepared by a mixer thread as new
+    segments, built from the decoded buffers with vectorized gain ramps, and
+    swapped into the chain without interrupting the output stream. Every
+    change of playback runs on that thread in the order it was asked for,
+    the event loop never waits for a decode or a mix.
+
+    Mirrors play the same output on other devices: the track is decoded once,
+    blocks taken by the callback are handed to a fan out worker feeding them.
+    """
+    FADE_SECONDS = 0.03
+    # Callback delay beyond its block duration and latency after which the device is deemed lost
+    STALL_SECONDS = 0.5
+
+    def __init__(self, device_info: DeviceInfo, realtime: bool = False, read_ahead: int = 0):
         self.__device_info: DeviceInfo = device_info
-        self.__start_streaming_event: threading.Event = threading.Event()
+        self.__realtime: bool = realtime
+        self.__read_ahead: int = read_ahead
         self.__output_stream: sounddevice.OutputStream | None = None
-        self.__buffer_worker: threading.Thread | None = None
-        self.__buffer: numpy.ndarray
-        self.__current_buffer_read_position: int = 0
+        self.__stream_format: tuple | None = None
+        self.__lock: threading.Lock = threading.Lock()
+        self.__segments: deque[PlaybackSegment] = deque()
+        self.__decode_streams: list[DecodeStream] = list()
+        self.__current: DecodeStream | None = None
+        # Frames of the current stream the last track played spans, virtual tracks of an image are a part of it
+        self.__current_start: int = 0
+        self.__current_end: int | None = None
+        self.__halted_event: threading.Event = threading.Event()
         self.__device_is_streaming: bool = False
-        self.__configuration: OutputDeviceConfiguration
-        self.__resampler: soxr.ResampleStream | None = None
-
-    
-    def __initialize_playback(self, filepath: str):
-        self.__configuration = OutputDeviceConfiguration(filename=filepath, device_info=self.__device_info)
-        self.__buffer = numpy.ndarray(shape=(self.__configuration.file.frames, self.__configuration.channels), dtype=self.__configuration.dtype)
-        self.__resampler = soxr.ResampleStream(
-                in_rate=self.__configuration.file.samplerate,
-                out_rate=self.__configuration.samplerate,
-                num_channels=self.__configuration.channels,
-                dtype=self.__configuration.dtype,
-                quality=soxr.VHQ
-            )
+        self.__paused: bool = False
+        self.__stream_configuration: OutputDeviceConfiguration | None = None
+        self.__mirrors: list[MirrorOutput] = list()
+        self.__tap: queue.SimpleQueue = queue.SimpleQueue()
+        self.__fan_out_worker: threading.Thread | None = None
+        self.__last_callback_time: float = 0.0
+        self.__callback_thread: int | None = None
+        self.__preloaded: DecodeStream | None = None
+        self.__mixer: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mixer")
+        self.__memory_consumers = [
+            memory.memory_governor.register(memory.MemoryConsumer("playback buffers", memory.PLAYBACK, lambda: self.__memory_usage(memory.PLAYBACK))),
+            memory.memory_governor.register(memory.MemoryConsumer("decode-ahead", memory.DECODE_AHEAD, lambda: self.__memory_usage(memory.DECODE_AHEAD), self.__drop_preloaded)),
+            memory.memory_governor.register(memory.MemoryConsumer("pcm cache", memory.CACHE, lambda: self.__memory_usage(memory.CACHE), self.__release_played)),
+        ]
 
+    @staticmethod
+    def __format_of(configuration: OutputDeviceConfiguration) -> tuple:
+        return (configuration.samplerate, numpy.dtype(configuration.dtype), configuration.channels, type(configuration.extra_settings))
 
-    def __fill_buffer_worker(self) -> None:
-        with soundfile.SoundFile(file=self.__configuration.file.name) as f:
-            position = 0
-            frames = self.__configuration.blocksize
-            prefill_buffer_count = self.__configuration.prefill_buffersize
-    
-            # Fill the buffer
-            while f.tell() < f.frames:
-                if not prefill_buffer_count:
-                    self.__start_streaming_event.set()
-                # Compute last frame size
-                if f.tell() + frames > f.frames:
-                    frames = f.frames - f.tell()
-                data = f.read(frames=frames, dtype=self.__buffer.dtype, always_2d=True, fill_value=0)
-                if self.__configuration.samplerate != f.samplerate and self.__resampler:
-                    data = self.__resampler.resample_chunk(data)
-                if len(data):
-                    self.__buffer[position:position+len(data)] = data
-                position += len(data)
-                prefill_buffer_count -= 1
-    
-            # Resize the buffer to it's actual length
-            if position < f.frames:
-                self.__buffer.resize((position, self.__configuration.channels), refcheck=False)
-
-    def play(self, filepath : str) -> DevicePlaybackInfo:
+    @staticmethod
+    def __output_frame(configuration: OutputDeviceConfiguration, frame: int | None) -> int | None:
+        """Frame of the output matching a frame of the file"""
+        if frame is None:
+            return None
+        return round(frame * configuration.samplerate / configuration.file.samplerate)
+
+    def __fade_frames(self, configuration: OutputDeviceConfiguration) -> int:
+        return int(self.FADE_SECONDS * configuration.samplerate)
+
+    def __callback(self, outdata, frames, time_info, status) -> None:
+        if status.output_underflow:
+            # A block was late, a glitch the stream plays on from rather than a lost device
+            diagnostics.add("playback", "output underflows")
+        if self.__realtime and self.__callback_thread != threading.get_ident():
+            # Host APIs may run every stream from a new thread
+            self.__callback_thread = threading.get_ident()
+            diagnostics.set("realtime", "callback scheduling", realtime.raise_thread_priority(priority=10))
+
+        written = 0
+        halt = False
+        with self.__lock:
+            segments = self.__segments
+            while written < frames and segments:
+                segment = segments[0]
+                if segment.stop:
+                    segments.popleft()
+                    halt = True
+                    break
+                data = segment.read(frames - written)
+                count = len(data)
+                if count:
+                    outdata[written:written+count] = data
+                    written += count
+                if segment.exhausted():
+                    segments.popleft()
+                elif not count:
+                    # Decoding fell behind playback
+                    diagnostics.add("playback", "decode underruns")
+                    break
+            outdata[written:] = 0
+            if not segments:
+                self.__device_is_streaming = False
+                halt = True
+        if self.__mirrors:
+            self.__tap.put(outdata.copy())
+        self.__last_callback_time = time.perf_counter()
+        if halt:
+            self.__halted_event.set()
+            import sounddevice
+            raise sounddevice.CallbackStop()
+
+    def __head(self) -> PlaybackSegment | None:
+        """First segment of a track in the chain, the one a transition starts from"""
+        for segment in self.__segments:
+            if not segment.stop and segment.data is None:
+                return segment
+        return None
+
+    def __submit(self, job: Callable, *args) -> Future:
+        """Runs job on the mixer thread after the jobs submitted before it"""
+        future = self.__mixer.submit(job, *args)
+        future.add_done_callback(self.__count_failure)
+        return future
+
+    @staticmethod
+    def __count_failure(future: Future):
+        if not future.cancelled() and future.exception():
+            diagnostics.add("playback", "mixer errors")
+            diagnostics.set("playback", "last mixer error", str(future.exception()))
+
+    def __install(self, build: Callable[[PlaybackSegment, int], list[PlaybackSegment]], keep_following: bool = True) -> bool:
+        """Replaces the head of the chain with the segments built from its current position, from the mixer thread
+
+        Segments are built without holding the lock, so the callback never waits
+        for a mix. They are installed only if the callback didn't move in the
+        meantime, which is retried since it reads a block per second at most.
+        """
+        for _ in range(3):
+            with self.__lock:
+                head = self.__head()
+                if not head or not self.__device_is_streaming:
+                    return False
+                position = head.position
+            start = time.perf_counter()
+            segments = build(head, position)
+            elapsed = time.perf_counter() - start
+            with self.__lock:
+                if head.position != position or head not in self.__segments:
+                    continue
+                index = self.__segments.index(head)
+                following = list(self.__segments)[index + 1:] if keep_following else []
+                while len(self.__segments) > index:
+                    self.__segments.pop()
+                self.__segments.extend(segments)
+                self.__segments.extend(following)
+            diagnostics.add("playback", "transitions")
+            diagnostics.set("playback", "last transition build (ms)", round(elapsed * 1000, 3))
+            return True
+        return False
+
+    def __fade_out_segments(self, head: PlaybackSegment, position: int, stop: bool) -> list[PlaybackSegment]:
+        source = head.source
+        assert source
+        count = min(self.__fade_frames(source.configuration), head.available())
+        faded = mixer.fade(source.frames_between(position, position+count), rising=False)
+        segments = [PlaybackSegment(source, data=faded, origin=position)]
+        if stop:
+            segments.append(PlaybackSegment(None, stop=True))
+        segments.append(PlaybackSegment(source, position=position+count, end=head.end))
+        return segments
+
+    def __fade_in_segments(self, source: DecodeStream, position: int, end: int | None = None) -> list[PlaybackSegment]:
+        count = min(self.__fade_frames(source.configuration), max(source.frames - position, 0))
+        faded = mixer.fade(source.frames_between(position, position+count), rising=True)
+        return [PlaybackSegment(source, data=faded, origin=position), PlaybackSegment(source, position=position+count, end=end)]
+
+    def __crossfade_segments(self, incoming: DecodeStream, frames: int, queued: bool, head: PlaybackSegment, position: int, incoming_end: int | None = None) -> list[PlaybackSegment]:
+        outgoing = head.source
+        assert outgoing
+        end = outgoing.expected_frames if head.end is None else head.end
+        # A queued track overlaps the end of the playing one, otherwise it starts right away
+        start = max(position, end - frames) if queued else position
+        first = incoming.start_frame
+        count = max(min(frames, min(end, outgoing.frames) - start, incoming.frames - first), 0)
+        mixed = mixer.crossfade(outgoing.frames_between(start, start+count), incoming.frames_between(first, first+count))
+        segments = list[PlaybackSegment]()
+        if start > position:
+            segments.append(PlaybackSegment(outgoing, position=position, end=start))
+        segments.append(PlaybackSegment(incoming, data=mixed, origin=first))
+        segments.append(PlaybackSegment(incoming, position=first+count, end=incoming_end))
+        return segments
+
+    def __release_decode_streams(self):
+        """Stops the decode workers of tracks the chain doesn't play anymore"""
+        with self.__lock:
+            used = {segment.source for segment in self.__segments}
+        used.add(self.__current)
+        for stream in self.__decode_streams:
+            if stream not in used:
+                stream.stop()
+        self.__decode_streams = [stream for stream in self.__decode_streams if stream in used]
+
+    def __open(self, stream: DecodeStream, end: int | None = None):
+        configuration = stream.configuration
+        with self.__lock:
+            self.__segments = deque(self.__fade_in_segments(stream, stream.start_frame, end))
+            self.__device_is_streaming = True
+        self.__halted_event.clear()
+        self.__paused = False
+        self.__stream_format = self.__format_of(configuration)
+        self.__output_stream = portaudio.open(
+                device=self.__device_info.index,
+                dtype=configuration.dtype,
+                extra_settings=configuration.extra_settings,
+                samplerate=configuration.samplerate,
+                blocksize=configuration.blocksize,
+                channels=configuration.channels,
+                dither_off=True,
+                clip_off=True,
+                callback=self.__callback,
+            )
+        self.__stream_configuration = configuration
+        for mirror in self.__mirrors:
+            mirror.open(configuration, self.__output_stream.latency)
+        self.__last_callback_time = time.perf_counter()
+        self.__output_stream.start()
+
+    def play(self, filepath : str, crossfade : float = 0.0, queued : bool = False, start : int = 0, end : int | None = None, offset : int = 0) -> Future[DevicePlaybackInfo]:
         """Plays a sound file on ouput device
 
+        The playing track fades out before the new one fades in, unless both
+        share the same output format: the new track then crossfades with the
+        playing one, or follows it without gap when queued without crossfade.
+        A part of a file queued right after the playing part of the same file,
+        the next virtual track of an image, is read on by the same stream.
+
+        The mixer thread waits for the first blocks of the track to be decoded
+        and builds the transition, the returned future is done once it plays.
+
         Parameters
         -------
         filepath: str
             sound file path to be played
+        crossfade: float
+            seconds the playing track and the new one overlap
+        queued: bool
+            start the new track at the end of the playing one instead of now
+        start: int
+            frame of the file playback starts at
+        end: int
+            frame of the file playback ends at, the end of the file if None
+        offset: int
+            frames after start decoding and playback begin at, to resume a track
 
         Returns
         -------
-        None
+        Future[DevicePlaybackInfo]
         """
 
         if not filepath:
             raise error("filepath parameter is mandatory")
+        return self.__submit(self.__play, filepath, crossfade, queued, start, end, offset)
 
-        if self.__start_streaming_event.is_set():
-            self.stop()
-
-        self.__initialize_playback(filepath)
-
-        # intitialize buffer_worker
-        self.__buffer_worker = threading.Thread(target=self.__fill_buffer_worker)
-        self.__start_streaming_event.clear()
-        self.__buffer_worker.start()
-
-        # defines streaming callback
-        self.__current_buffer_read_position = 0
-        def callback(outdata, frames, time, status) -> None:
-            if status.output_underflow:
-                print('Output underflow: increase blocksize?', file=sys.stderr)
-                raise sounddevice.CallbackAbort()
-            assert not status
-        
-            data = self.__buffer[self.__current_buffer_read_position:self.__current_buffer_read_position+frames]
-            outdata[:len(data)] = data
-            self.__current_buffer_read_position+=frames
-
-            if self.__current_buffer_read_position >= len(self.__buffer):
-                self.__device_is_streaming = False
-                raise sounddevice.CallbackStop()
+    def __play(self, filepath : str, crossfade : float, queued : bool, start : int, end : int | None, offset : int) -> DevicePlaybackInfo:
+        current = self.__current
+        if current and queued and not offset and current.configuration.file.name == filepath and self.__follows(current, start):
+            configuration = current.configuration
+            first = self.__output_frame(configuration, start)
+            last = self.__output_frame(configuration, end)
+            with tracer.span("chain", "device", image=True, start=first):
+                # Gapless whatever the crossfade, the parts of an image are contiguous
+                chained = self.__install(lambda head, position: [PlaybackSegment(head.source, position=position, end=head.end), PlaybackSegment(current, position=first, end=last)], keep_following=False)
+            if chained:
+                self.__current_start, self.__current_end = first, last
+                return DevicePlaybackInfo(channels=configuration.channels, bitdepth=configuration.file.subtype_info, filetype=configuration.file.format)
 
-        self.__output_stream = sounddevice.OutputStream(
-                device=self.__device_info.index,
-                dtype=self.__buffer.dtype,
-                extra_settings=self.__configuration.extra_settings,
-                samplerate=self.__configuration.samplerate,
-                blocksize=self.__configuration.blocksize,
-                channels=self.__configuration.channels,
-                dither_off=True,
-                clip_off=True,
-                callback=callback,
-            )
+        with self.__lock:
+            stream = self.__preloaded
+            self.__preloaded = None
+        if stream and stream.configuration.file.name == filepath and stream.start_frame == self.__output_frame(stream.configuration, start + offset):
+            stream.preload = False
+            configuration = stream.configuration
+            tracer.instant("preloaded stream", "device", frames=stream.frames)
+        else:
+            if stream:
+                stream.stop()
+            if current and current.configuration.file.name == filepath:
+                # Another part of the playing image
+                configuration = current.configuration
+            else:
+                with tracer.span("configuration", "device", path=filepath):
+                    configuration = OutputDeviceConfiguration(filename=filepath, device_info=self.__device_info)
+            stream = DecodeStream(configuration, realtime=self.__realtime, start=self.__output_frame(configuration, start + offset) or 0, read_ahead=self.__read_ahead)
+            stream.start()
+        first = self.__output_frame(configuration, start) or 0
+        last = self.__output_frame(configuration, end)
+        with tracer.span("prefill", "device", frames=configuration.prefill_buffersize * configuration.blocksize):
+            stream.wait_for(stream.start_frame + configuration.prefill_buffersize * configuration.blocksize)
 
-        self.__start_streaming_event.wait()
-        self.__output_stream.start()
-        self.__device_is_streaming = True
-        return DevicePlaybackInfo(channels=self.__configuration.channels, bitdepth=self.__configuration.file.subtype_info, filetype=self.__configuration.file.format)
+        chained = False
+        if self.__output_stream and not self.__paused and self.__stream_format == self.__format_of(configuration) and (queued or crossfade > 0):
+            frames = int(crossfade * configuration.samplerate)
+            with tracer.span("chain", "device", crossfade=frames, queued=queued):
+                chained = self.__install(lambda head, position: self.__crossfade_segments(stream, frames, queued, head, position, last), keep_following=False)
+
+        self.__decode_streams.append(stream)
+        self.__current = stream
+        self.__current_start, self.__current_end = first, last
+        if not chained:
+            with tracer.span("close stream", "device"):
+                self.__close()
+            with tracer.span("open stream", "device", samplerate=configuration.samplerate, blocksize=configuration.blocksize):
+                self.__open(stream, last)
+        self.__release_decode_streams()
+        return DevicePlaybackInfo(channels=configuration.channels, bitdepth=configuration.file.subtype_info, filetype=configuration.file.format)
+
+    def __follows(self, stream: DecodeStream, start: int) -> bool:
+        """True when the part of the file starting at start frame follows the playing part of stream without gap"""
+        if not self.__output_stream or self.__paused or self.__current_end is None:
+            return False
+        if self.__output_frame(stream.configuration, start) != self.__current_end:
+            return False
+        with self.__lock:
+            head = self.__head()
+            return bool(head and head.source is stream and head.end == self.__current_end)
+
+    def preload(self, filepath: str, start: int = 0):
+        """Starts decoding a track expected to be played next from start frame of the file, as decode-ahead the memory governor may drop
+
+        Its configuration is probed on the mixer thread, after the operations submitted before.
+        """
+        self.__submit(self.__preload, filepath, start)
+
+    def __preload(self, filepath: str, start: int):
+        current = self.__current
+        if current and current.configuration.file.name == filepath and self.__current_end is not None and self.__output_frame(current.configuration, start) == self.__current_end:
+            # The next part of the playing image, read on by its stream
+            return
+        preloaded = self.__preloaded
+        if preloaded and preloaded.configuration.file.name == filepath and preloaded.start_frame == self.__output_frame(preloaded.configuration, start):
+            return
+        self.__drop_preloaded(0)
+        configuration = OutputDeviceConfiguration(filename=filepath, device_info=self.__device_info)
+        stream = DecodeStream(configuration, realtime=self.__realtime, start=self.__output_frame(configuration, start) or 0, preload=True, read_ahead=self.__read_ahead)
+        stream.start()
+        with self.__lock:
+            self.__preloaded = stream
+
+    def __drop_preloaded(self, size: int) -> int:
+        with self.__lock:
+            stream = self.__preloaded
+            self.__preloaded = None
+        if not stream:
+            return 0
+        stream.stop()
+        diagnostics.add("memory", "dropped preloads")
+        return sum(stream.memory_usage())
+
+    def __release_played(self, size: int) -> int:
+        freed = 0
+        # Tracks the chain finishes playing first, then the playing one
+        for stream in sorted(self.__decode_streams, key=lambda stream: stream is self.__current):
+            if freed < size:
+                freed += stream.release_played(size - freed)
+        return freed
+
+    def __memory_usage(self, priority: int) -> int:
+        streams = list(self.__decode_streams)
+        if self.__preloaded:
+            streams.append(self.__preloaded)
+        usage = sum(stream.memory_usage()[priority] for stream in streams)
+        if priority == memory.PLAYBACK:
+            usage += sum(mirror.nbytes for mirror in self.__mirrors)
+        return usage
+
+    @property
+    def realtime(self) -> bool:
+        return self.__realtime
+
+    @realtime.setter
+    def realtime(self, value: bool):
+        """Raises the priority of the workers and locks the buffers in memory from the next track played"""
+        self.__realtime = value
+
+    @property
+    def read_ahead(self) -> int:
+        """Bytes of a file read ahead of its decoder, 0 reads as decoded. Applies from the next track played"""
+        return self.__read_ahead
+
+    @read_ahead.setter
+    def read_ahead(self, size: int):
+        self.__read_ahead = size
 
     @property
     def is_playing(self) -> bool:
@@ -271,17 +1113,228 @@ class OutputDevice:
             return self.__device_is_streaming
         return False
 
-    def stop(self) -> None:
+    @property
+    def is_open(self) -> bool:
+        """True while an output stream is open, paused included"""
+        return self.__output_stream is not None
+
+    @property
+    def failed(self) -> bool:
+        """True when the output stream stopped on its own or its callback stalled while playing, as when the device is unplugged"""
+        stream = self.__output_stream
+        if not stream or self.__paused or not self.__device_is_streaming:
+            return False
+        if not stream.active:
+            # The callback stops the stream itself at the end of the chain or on a fade to silence
+            return not self.__halted_event.is_set()
+        return time.perf_counter() - self.__last_callback_time > stream.blocksize / stream.samplerate + stream.latency + self.STALL_SECONDS
+
+    @property
+    def position(self) -> float:
+        """Playback position of the last track played in seconds, 0 until the chain reaches it"""
+        current = self.__current
+        if not self.__output_stream or not current:
+            return 0.0
+        with self.__lock:
+            for segment in self.__segments:
+                if segment.source is current:
+                    return max(segment.track_position - self.__current_start, 0) / current.configuration.samplerate
+        end = current.expected_frames if self.__current_end is None else self.__current_end
+        return (end - self.__current_start) / current.configuration.samplerate
+
+    @property
+    def heard_position(self) -> float:
+        """Playback position heard on the device, behind position by the block the callback last took and the output latency"""
+        stream = self.__output_stream
+        if not stream:
+            return self.position
+        block = stream.blocksize / stream.samplerate
+        since_callback = min(time.perf_counter() - self.__last_callback_time, block)
+        return max(self.position - block - stream.latency + since_callback, 0.0)
+
+    @property
+    def block_duration(self) -> float:
+        """Seconds of audio the callback takes from the chain at once"""
+        if not self.__output_stream:
+            return 0.0
+        return self.__output_stream.blocksize / self.__output_stream.samplerate
+
+    @property
+    def remaining(self) -> float:
+        """Seconds of audio left in the chain, tracks queued after the playing one included"""
+        current = self.__current
+        if not self.__output_stream or not current:
+            return 0.0
+        with self.__lock:
+            frames = sum(segment.remaining() for segment in self.__segments)
+        return frames / current.configuration.samplerate
+
+    def tap(self, frames: int) -> tuple[numpy.ndarray, int] | None:
+        """Returns the last frames of the playing track heard on the device and its sample rate, or None when silent
+
+        Frames are read from the decoded pages: the callback takes a block
+        which is heard over the next block duration, after the output latency.
+        """
+        stream = self.__output_stream
+        if not stream or self.__paused or not self.__device_is_streaming:
+            return None
+        with self.__lock:
+            head = self.__head()
+            if not head or not head.source:
+                return None
+            source = head.source
+            position = head.position
+        samplerate = source.configuration.samplerate
+        since_callback = min(time.perf_counter() - self.__last_callback_time, stream.blocksize / samplerate)
+        heard = min(max(position - stream.blocksize - int((stream.latency - since_callback) * samplerate), 0), position)
+        return source.frames_between(heard - frames, heard), samplerate
+
+    def seek(self, position: float) -> Future[float]:
+        """Moves playback to position seconds, bounded to the part of the track decoded within a short wait
+
+        A position whose pages were dropped, or that decoding doesn't reach
+        within the wait, is decoded again from there by a new stream.
+
+        Returns
+        -------
+        Future[float]
+            actual position in seconds, once the mixer thread moved playback
+        """
+        return self.__submit(self.__seek, position)
+
+    def __seek(self, position: float) -> float:
+        current = self.__current
+        if not self.__output_stream or not current:
+            return 0.0
+        samplerate = current.configuration.samplerate
+        first = self.__current_start
+        last = current.expected_frames if self.__current_end is None else min(self.__current_end, current.expected_frames)
+        frame = min(max(first + int(position * samplerate), first), last)
+        fade_frames = self.__fade_frames(current.configuration)
+        stream = current
+        if frame < current.retained_from or not current.wait_for(frame + fade_frames, timeout=0.5):
+            stream = DecodeStream(current.configuration, realtime=self.__realtime, start=frame, read_ahead=self.__read_ahead)
+            stream.start()
+            stream.wait_for(frame + fade_frames, timeout=0.5)
+        frame = min(frame, stream.frames)
+
+        def build(head: PlaybackSegment, start: int) -> list[PlaybackSegment]:
+            if self.__paused or head.source is not current:
+                # Nothing is heard while paused and resume fades in
+                return [PlaybackSegment(stream, position=frame, end=self.__current_end)]
+            segments = self.__fade_out_segments(head, start, stop=False)[:-1]
+            return segments + self.__fade_in_segments(stream, frame, self.__current_end)
+        # Whatever followed is dropped, a track queued after the playing one is the one being seeked
+        if not self.__install(build, keep_following=False):
+            if stream is not current:
+                stream.stop()
+            return self.position
+        if stream is not current:
+            self.__decode_streams.append(stream)
+            self.__current = stream
+            self.__release_decode_streams()
+        return (frame - first) / samplerate
+
+    def __close(self):
         if self.__output_stream:
-            self.__output_stream.stop(ignore_errors=True)
-            self.__output_stream.close(ignore_errors=True)
+            # A lost device plays neither the fade nor the queued blocks
+            failed = self.failed
+            if not failed and self.__output_stream.active and self.__device_is_streaming and not self.__paused:
+                self.__halted_event.clear()
+                if self.__install(lambda head, position: self.__fade_out_segments(head, position, stop=True), keep_following=False):
+                    # The callback reads a block per call, the fade is reached within one
+                    stream = self.__output_stream
+                    self.__halted_event.wait(timeout=self.FADE_SECONDS + 2 * stream.blocksize / stream.samplerate + stream.latency)
+            portaudio.close(self.__output_stream, abort=failed)
             self.__output_stream = None
+        with self.__lock:
+            self.__segments.clear()
             self.__device_is_streaming = False
+        self.__paused = False
+
+    def stop(self) -> Future[None]:
+        """Fades out and closes the output stream, the returned future is done once it is closed"""
+        return self.__submit(self.__stop)
+
+    def __stop(self):
+        self.__close()
+        self.__drop_preloaded(0)
+        self.__current = None
+        self.__current_start, self.__current_end = 0, None
+        self.__stream_configuration = None
+        self.__release_decode_streams()
+        for mirror in self.__mirrors:
+            mirror.close()
+
+    def close(self) -> Future[None]:
+        """Stops playback and releases the mirrors, the mixer thread exits once the returned future is done"""
+        future = self.__submit(self.__release)
+        self.__mixer.shutdown(wait=False)
+        return future
+
+    def __release(self):
+        self.__stop()
+        for mirror in list(self.__mirrors):
+            self.remove_mirror(mirror.device_info)
+        for consumer in self.__memory_consumers:
+            memory.memory_governor.unregister(consumer)
+        self.__memory_consumers.clear()
+
+    @property
+    def mirrors(self) -> list[MirrorOutput]:
+        return self.__mirrors
+
+    def add_mirror(self, device_info: DeviceInfo) -> MirrorOutput:
+        """Plays the output of this device on another one too, from the next track or right away if playing"""
+        mirror = MirrorOutput(device_info, realtime=self.__realtime)
+        if self.__stream_configuration and self.__output_stream:
+            mirror.open(self.__stream_configuration, self.__output_stream.latency)
+        self.__mirrors.append(mirror)
+        if not self.__fan_out_worker:
+            self.__tap = queue.SimpleQueue()
+            self.__fan_out_worker = threading.Thread(target=self.__fan_out, args=(self.__tap,), daemon=True)
+            self.__fan_out_worker.start()
+        return mirror
+
+    def remove_mirror(self, device_info: DeviceInfo):
+        for mirror in [mirror for mirror in self.__mirrors if mirror.device_info.index == device_info.index]:
+            self.__mirrors.remove(mirror)
+            mirror.close()
+        if not self.__mirrors and self.__fan_out_worker:
+            self.__tap.put(None)
+            self.__fan_out_worker = None
+
+    def __fan_out(self, tap: queue.SimpleQueue):
+        if self.__realtime:
+            diagnostics.set("realtime", "fan out worker scheduling", realtime.raise_thread_priority())
+        while (block := tap.get()) is not None:
+            for mirror in list(self.__mirrors):
+                mirror.feed(block)
 
     def pause(self):
-        if self.__output_stream:
-            self.__output_stream.stop()
+        """Fades out and halts the output stream, from the mixer thread"""
+        self.__submit(self.__pause)
+
+    def __pause(self):
+        if self.__output_stream and not self.__paused:
+            self.__paused = True
+            self.__halted_event.clear()
+            if not self.__install(lambda head, position: self.__fade_out_segments(head, position, stop=True)):
+                self.__output_stream.stop()
 
     def resume(self):
-        if self.__output_stream:
-            self.__output_stream.start()
+        """Fades the paused track back in, from the mixer thread"""
+        self.__submit(self.__resume)
+
+    def __resume(self):
+        if self.__output_stream and self.__paused:
+            with self.__lock:
+                # Resumed before the fade out was reached
+                self.__segments = deque(segment for segment in self.__segments if not segment.stop)
+            self.__paused = False
+            self.__install(lambda head, position: self.__fade_in_segments(head.source, position, head.end))
+            if not self.__output_stream.active:
+                # A stream stopped from its callback must be stopped before starting again
+                self.__output_stream.stop(ignore_errors=True)
+                self.__last_callback_time = time.perf_counter()
+                self.__output_stream.start()
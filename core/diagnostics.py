@@ -0,0 +1,42 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+class Diagnostics():
+    """Thread safe registry of runtime metrics grouped by section, shown in the diagnostics view"""
+    def __init__(self):
+        self.__lock : threading.Lock = threading.Lock()
+        self.__sections : dict[str, dict[str, Any]] = dict()
+
+    def set(self, section : str, name : str, value : Any):
+        with self.__lock:
+            self.__sections.setdefault(section, dict())[name] = value
+
+    def add(self, section : str, name : str, value : float = 1):
+        with self.__lock:
+            metrics = self.__sections.setdefault(section, dict())
+            metrics[name] = metrics.get(name, 0) + value
+
+    def remove(self, section : str, name : str):
+        with self.__lock:
+            self.__sections.get(section, {}).pop(name, None)
+
+    def get(self, section : str, name : str, default : Any = None) -> Any:
+        with self.__lock:
+            return self.__sections.get(section, {}).get(name, default)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self.__lock:
+            return {section: dict(metrics) for section, metrics in self.__sections.items()}
+
+    @contextmanager
+    def cpu_time(self, section : str, name : str) -> Iterator[None]:
+        """Adds the CPU time spent by the calling thread in the block to section/name, in seconds"""
+        start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(section, name, time.thread_time() - start)
+
+diagnostics = Diagnostics()
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import time
+import numpy
+from typing import Any, Callable
+from core.batch import run_in_processes
+from core.cache import IdentityStore, cache_directory
+from core.decoders import registry as decoder_registry, skip_id3v2
+
+STREAMINFO_MD5_OFFSET = 18
+
+def streaminfo_md5(filepath : str) -> str | None:
+    """Returns the MD5 of the decoded audio stored in the STREAMINFO block of a FLAC file, None if absent or unset"""
+    with open(filepath, "rb") as f:
+        skip_id3v2(f)
+        header = f.read(8 + 34)
+    # STREAMINFO is always the first metadata block
+    if len(header) < 42 or header[:4] != b"fLaC" or header[4] & 0x7F != 0:
+        return None
+    md5 = header[8 + STREAMINFO_MD5_OFFSET:8 + STREAMINFO_MD5_OFFSET + 16]
+    return md5.hex() if any(md5) else None
+
+def pcm_md5(filepath : str, blocksize : int = 65536) -> str:
+    """Returns the MD5 of the decoded audio of a file, read blockwise
+
+    Integer PCM is hashed as FLAC does, interleaved little endian samples of
+    the source bit depth, so a lossless rip matches the STREAMINFO MD5 of its
+    FLAC copy. Other subtypes are hashed as 32 bit floats.
+    """
+    decoder = decoder_registry.get(filepath)
+    digest = hashlib.md5()
+    with decoder.open(filepath) as f:
+        subtype = f.subtype
+        while f.tell() < f.frames:
+            frames = min(blocksize, f.frames - f.tell())
+            if subtype in ("PCM_S8", "PCM_U8"):
+                data = (f.read(frames=frames, dtype="int16", always_2d=True) >> 8).astype("<i1")
+            elif subtype == "PCM_16":
+                data = f.read(frames=frames, dtype="int16", always_2d=True).astype("<i2")
+            elif subtype == "PCM_24":
+                # 24 bit samples come in the high bytes of 32 bit integers
+                samples = (f.read(frames=frames, dtype="int32", always_2d=True) >> 8).astype("<i4")
+                data = samples.view(numpy.uint8).reshape(-1, 4)[:, :3]
+            elif subtype == "PCM_32":
+                data = f.read(frames=frames, dtype="int32", always_2d=True).astype("<i4")
+            else:
+                data = f.read(frames=frames, dtype="float32", always_2d=True).astype("<f4")
+            if not len(data):
+                break
+            digest.update(numpy.ascontiguousarray(data).tobytes())
+    return digest.hexdigest()
+
+class ContentHashStore(IdentityStore):
+    """Content hashes keyed by file identity, persisted as JSON in the user cache directory"""
+    def __init__(self, filepath : str | None = None):
+        super().__init__(filepath or os.path.join(cache_directory("duplicates"), "hashes.json"))
+
+    def apply(self, tracks : list[Any]):
+        """Copies known hashes onto the content_hash attribute of tracks"""
+        for track in tracks:
+            value = self.get(track.path)
+            if value:
+                track.content_hash = value
+
+def duplicate_groups(tracks : list[Any]) -> list[list[Any]]:
+    """Tracks sharing a content hash, in library order, groups of one left out
+
+    Virtual tracks of a CUE sheet share the hash of their image, they are
+    duplicates of the same part of the same audio only.
+    """
+    groups : dict[tuple, list[Any]] = dict()
+    for track in tracks:
+        if getattr(track, "content_hash", None):
+            content = (track.content_hash, getattr(track, "start_frame", 0), getattr(track, "end_frame", None))
+            groups.setdefault(content, list()).append(track)
+    return [group for group in groups.values() if len(group) > 1]
+
+class DuplicateReport():
+    def __init__(self):
+        self.hashed : int = 0
+        self.from_streaminfo : int = 0
+        self.skipped : int = 0
+        self.failed : dict[str, str] = dict()
+        self.elapsed : float = 0.0
+        self.groups : list[list[Any]] = list()
+
+    def __str__(self) -> str:
+        duplicates = sum(len(group) - 1 for group in self.groups)
+        return f"{self.hashed} hashed, {self.from_streaminfo} from FLAC STREAMINFO, {self.skipped} already known, {len(self.failed)} failed in {self.elapsed:.1f}s, {duplicates} duplicates in {len(self.groups)} groups"
+
+def find_duplicates(tracks : list[Any], store : ContentHashStore | None = None, workers : int | None = None, save_every : int = 200, on_progress : Callable[[DuplicateReport, int], None] | None = None) -> DuplicateReport:
+    """Hashes the audio of the tracks missing from store and groups the tracks with the same audio
+
+    FLAC files carrying an MD5 are read from their header, the others are
+    decoded over a process pool. Results are saved every save_every tracks
+    so an interrupted job resumes where it stopped, and are copied onto the
+    tracks when the job ends.
+
+    Parameters
+    ----------
+    tracks: list
+        library tracks, anything with a path attribute
+    on_progress: callable
+        called with the report and the number of tracks left after every hashed track
+    """
+    store = store or ContentHashStore()
+    report = DuplicateReport()
+    start = time.perf_counter()
+    pending = list[str]()
+    for track in tracks:
+        if store.get(track.path):
+            report.skipped += 1
+            continue
+        try:
+            md5 = streaminfo_md5(track.path)
+        except OSError as e:
+            report.failed[track.path] = str(e)
+            continue
+        if md5:
+            store.set(track.path, md5)
+            report.from_streaminfo += 1
+        else:
+            pending.append(track.path)
+    # Virtual tracks of a CUE sheet share their image
+    pending = list(dict.fromkeys(pending))
+
+    left = len(pending)
+    try:
+        for (filepath,), future in run_in_processes(pcm_md5, ((filepath,) for filepath in pending), workers):
+            left -= 1
+            try:
+                store.set(filepath, future.result())
+                report.hashed += 1
+                if report.hashed % save_every == 0:
+                    store.save()
+            except Exception as e:
+                report.failed[filepath] = str(e)
+            report.elapsed = time.perf_counter() - start
+            if on_progress:
+                on_progress(report, left)
+    finally:
+        store.save()
+        report.elapsed = time.perf_counter() - start
+    store.apply(tracks)
+    report.groups = duplicate_groups(tracks)
+    return report
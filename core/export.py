@@ -0,0 +1,126 @@
+import os
+import time
+from typing import Any, Callable
+from core.batch import run_in_processes
+from core.decoders import decode_blocks, sample_dtype, registry as decoder_registry
+
+# Container and subtype written per extension and bit depth
+EXPORT_FORMATS : dict[str, tuple[str, dict[int, str]]] = {
+    "flac": ("FLAC", {16: "PCM_16", 24: "PCM_24"}),
+    "wav": ("WAV", {16: "PCM_16", 24: "PCM_24", 32: "FLOAT"}),
+}
+
+class ExportSettings():
+    def __init__(self, extension : str = "flac", samplerate : int = 44100, bitdepth : int = 16, channels : int = 2):
+        if extension not in EXPORT_FORMATS:
+            raise ValueError(f"unsupported export format: {extension}, expected one of {', '.join(EXPORT_FORMATS)}")
+        format, subtypes = EXPORT_FORMATS[extension]
+        if bitdepth not in subtypes:
+            raise ValueError(f"{extension} can't be exported in {bitdepth} bits, expected one of {', '.join(str(depth) for depth in subtypes)}")
+        self.extension = extension
+        self.format = format
+        self.subtype = subtypes[bitdepth]
+        self.samplerate = samplerate
+        self.bitdepth = bitdepth
+        self.channels = channels
+
+def export_file(source : str, destination : str, settings : ExportSettings) -> dict[str, Any]:
+    """Transcodes source to destination block by block, memory use doesn't depend on the track length
+
+    The output is written next to destination and renamed once complete, so
+    an existing destination is always a finished export.
+    """
+    import soundfile
+    decoder = decoder_registry.get(source)
+    temporary_path = destination + ".part"
+    frames = 0
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        with soundfile.SoundFile(temporary_path, "w", samplerate=settings.samplerate, channels=settings.channels, format=settings.format, subtype=settings.subtype) as output:
+            with decoder.open(source) as f:
+                if hasattr(f, "copy_metadata"):
+                    for key, value in f.copy_metadata().items():
+                        setattr(output, key, value)
+                duration = f.frames / f.samplerate
+            # Decoding to the sample type of the output subtype avoids a conversion per block
+            for block in decode_blocks(source, samplerate=settings.samplerate, channels=settings.channels, dtype=sample_dtype(settings.subtype), decoder=decoder):
+                output.write(block)
+                frames += len(block)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+    os.replace(temporary_path, destination)
+    return {"duration": duration, "frames": frames, "bytes": os.path.getsize(destination)}
+
+def destination_path(source : str, root : str, directory : str, settings : ExportSettings) -> str:
+    """Output path of source, keeping its path relative to root"""
+    relative_path = os.path.splitext(os.path.relpath(source, root))[0]
+    return os.path.join(directory, relative_path + "." + settings.extension)
+
+class ExportReport():
+    def __init__(self):
+        self.exported : int = 0
+        self.skipped : int = 0
+        self.failed : dict[str, str] = dict()
+        self.elapsed : float = 0.0
+        self.audio_seconds : float = 0.0
+        self.bytes_written : int = 0
+
+    @property
+    def realtime_factor(self) -> float:
+        return self.audio_seconds / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_written / 1e6 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.exported} exported, {self.skipped} already done, {len(self.failed)} failed in {self.elapsed:.1f}s ({self.realtime_factor:.0f}x realtime, {self.megabytes_per_second:.1f} MB/s written)"
+
+def export_tracks(sources : list[str], directory : str, settings : ExportSettings, root : str | None = None, workers : int | None = None, on_progress : Callable[[ExportReport, int], None] | None = None) -> ExportReport:
+    """Transcodes files to directory over a process pool
+
+    Files whose export already exists and is newer than the source are
+    skipped, so an interrupted job resumes where it stopped.
+
+    Parameters
+    ----------
+    sources: list
+        audio file paths
+    root: str
+        directory the output tree mirrors, the common directory of sources when not given
+    on_progress: callable
+        called with the report and the number of files left after every exported file
+    """
+    report = ExportReport()
+    sources = [os.path.abspath(source) for source in sources]
+    if not sources:
+        return report
+    root = root or os.path.commonpath([os.path.dirname(source) for source in sources])
+    pending = list[tuple[str, str]]()
+    for source in sources:
+        destination = destination_path(source, root, directory, settings)
+        if os.path.exists(destination) and os.path.getmtime(destination) >= os.path.getmtime(source):
+            report.skipped += 1
+        else:
+            pending.append((source, destination))
+
+    start = time.perf_counter()
+    left = len(pending)
+    try:
+        for (source, _, _), future in run_in_processes(export_file, ((source, destination, settings) for source, destination in pending), workers):
+            left -= 1
+            try:
+                result = future.result()
+                report.exported += 1
+                report.audio_seconds += result["duration"]
+                report.bytes_written += result["bytes"]
+            except Exception as e:
+                report.failed[source] = str(e)
+            report.elapsed = time.perf_counter() - start
+            if on_progress:
+                on_progress(report, left)
+    finally:
+        report.elapsed = time.perf_counter() - start
+    return report
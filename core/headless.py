@@ -0,0 +1,57 @@
+import asyncio
+from core.device import DeviceInfo
+from core.player import HandcraftedAudioPlayer, TrackInfo
+
+def find_output_device(player : HandcraftedAudioPlayer, name : str | None = None) -> DeviceInfo | None:
+    """Returns the first output device whose name contains name, or the default output device
+
+    Parameters
+    ----------
+    name: str
+        Name or partial name of device, case insensitive, host api name can be given as "api:device"
+
+    Returns
+    -------
+    DeviceInfo
+        found device or None
+    """
+    host_apis = player.get_outout_device_list_by_api()
+    if not name:
+        import sounddevice
+        default_index = sounddevice.default.device[1]
+        if default_index is None or default_index < 0:
+            default_index = sounddevice.query_devices(kind='output')['index']
+        for api in host_apis:
+            for device in api.devices:
+                if device.index == default_index:
+                    return device
+        return None
+    api_name, _, device_name = name.rpartition(":")
+    for api in host_apis:
+        if api_name and api.name.lower().find(api_name.lower()) < 0:
+            continue
+        for device in api.devices:
+            if device.name.lower().find(device_name.lower()) >= 0:
+                return device
+    return None
+
+def print_track(track : TrackInfo, device : DeviceInfo):
+    print(f"Playing: {track.artist} - {track.title} [{track.samplerate}Hz, {track.bitdepth}, {track.filetype}] on {device.name}", flush=True)
+
+def print_output_device_changed(device : DeviceInfo, reason : str, seconds : float):
+    print(f"Output moved to {device.name} ({reason} in {seconds * 1000:.0f} ms)", flush=True)
+
+async def play(player : HandcraftedAudioPlayer, devices : list[DeviceInfo]) -> None:
+    """Plays the player queue on devices until it ends, without any user interface"""
+    player.set_output_devices(devices)
+    player.on_track_changed.append(print_track)
+    player.on_output_device_changed.append(print_output_device_changed)
+    ended = asyncio.Event()
+    player.on_playback_state_changed.append(lambda: ended.set() if player.is_stoped else None)
+    player.monitor_devices()
+    try:
+        await player.play(0)
+        await ended.wait()
+    finally:
+        player.unmonitor_devices()
+        player.stop()
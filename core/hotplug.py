@@ -0,0 +1,122 @@
+import asyncio
+import time
+from asyncio.tasks import Task
+from typing import Awaitable, Callable
+from core.device import DeviceInfo, HostApiInfo
+from core.diagnostics import diagnostics
+
+def sound_cards() -> tuple[str, ...] | None:
+    """Names of the sound cards of the system read from /proc/asound/cards, None where it doesn't exist
+
+    Unlike PortAudio, which only lists the devices present when it was
+    initialized, the file follows cards as they are plugged and unplugged.
+    """
+    try:
+        with open("/proc/asound/cards") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    # " 1 [DAC            ]: USB-Audio - USB DAC" followed by the long name
+    return tuple(line.split(" - ", 1)[1].strip() for line in lines if line[:3].strip().isdigit() and " - " in line)
+
+def device_identity(device : DeviceInfo) -> tuple[str, str]:
+    """Host api and name of a device, its index changes when PortAudio is reinitialized"""
+    return (device.hostapi.name, device.name)
+
+def device_card(identity : tuple[str, str], cards : tuple[str, ...] | set[str]) -> str | None:
+    """Sound card of an ALSA device, named "card: device (hw:x,y)", None for other devices"""
+    _, name = identity
+    return next((card for card in cards if name.startswith(card + ":")), None)
+
+def find_device(host_apis : list[HostApiInfo], identity : tuple[str, str] | None) -> DeviceInfo | None:
+    if not identity:
+        return None
+    for api in host_apis:
+        for device in api.devices:
+            if device_identity(device) == identity:
+                return device
+    return None
+
+def fallback_device(host_apis : list[HostApiInfo], identity : tuple[str, str] | None = None) -> DeviceInfo | None:
+    """Device playback falls back to: the default device of the host api of identity, the system default, then any"""
+    hostapi = identity[0] if identity else None
+    apis = sorted(host_apis, key=lambda api: api.name != hostapi)
+    for api in apis:
+        if api.name == hostapi and api.default_output_device and device_identity(api.default_output_device) != identity:
+            return api.default_output_device
+    try:
+        import sounddevice
+        default_index = sounddevice.default.device[1]
+        if default_index is None or default_index < 0:
+            default_index = sounddevice.query_devices(kind='output')['index']
+    except Exception:
+        default_index = None
+    for api in apis:
+        for device in api.devices:
+            if device.index == default_index and device_identity(device) != identity:
+                return device
+    for api in apis:
+        for device in api.devices:
+            if device_identity(device) != identity:
+                return device
+    return None
+
+class DeviceChange():
+    """Output device lost, or sound cards plugged or unplugged since the previous poll"""
+    def __init__(self, detected : float):
+        self.detected : float = detected
+        self.lost : bool = False
+        self.added : set[str] = set()
+        self.removed : set[str] = set()
+        self.cards : tuple[str, ...] | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.lost or self.added or self.removed)
+
+class DeviceMonitor():
+    """Watches the output device and the sound cards of the system from the event loop.
+
+    Every interval the output is checked for a stream which stopped or whose
+    callback stalled, and the card list for plugged and unplugged cards, both
+    cheap enough not to hold the loop. Changes are handed to on_change, which
+    is awaited before polling again, and may enumerate devices in a thread.
+    Where no card list exists, only a lost output is reported.
+    """
+    def __init__(self, is_lost : Callable[[], bool], on_change : Callable[[DeviceChange], Awaitable[None]], interval : float = 0.25):
+        self.__is_lost = is_lost
+        self.__on_change = on_change
+        self.__interval = interval
+        self.__task : Task | None = None
+
+    def start(self):
+        """Must be called from the event loop"""
+        if not self.__task:
+            self.__task = asyncio.create_task(self.__run())
+
+    def stop(self):
+        if self.__task:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __run(self):
+        cards = sound_cards()
+        lost = False
+        while True:
+            await asyncio.sleep(self.__interval)
+            change = DeviceChange(time.perf_counter())
+            # Reported once, until the output plays again
+            is_lost = self.__is_lost()
+            change.lost = is_lost and not lost
+            lost = is_lost
+            change.cards = sound_cards()
+            if change.cards is not None and cards is not None:
+                change.added = set(change.cards) - set(cards)
+                change.removed = set(cards) - set(change.cards)
+            cards = change.cards
+            if not change:
+                continue
+            try:
+                await self.__on_change(change)
+            except Exception as e:
+                diagnostics.add("devices", "monitor errors")
+                diagnostics.set("devices", "last monitor error", str(e))
@@ -0,0 +1,167 @@
+import threading
+import time
+from typing import Callable
+from core.diagnostics import diagnostics
+
+# Consumer priorities, the highest value is shrunk first
+PLAYBACK = 0
+DECODE_AHEAD = 1
+CACHE = 2
+
+MEGABYTE = 2**20
+DEFAULT_BUDGET = 1024 * MEGABYTE
+
+def system_memory() -> tuple[int, int] | None:
+    """Total and available system memory in bytes read from /proc/meminfo, None where it doesn't exist"""
+    try:
+        fields : dict[str, int] = dict()
+        with open("/proc/meminfo") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                fields[name] = int(value.split()[0]) * 1024
+        return fields["MemTotal"], fields.get("MemAvailable", fields["MemFree"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+class MemoryConsumer():
+    """Memory held by one part of the player, reported to the governor
+
+    Parameters
+    ----------
+    usage: callable
+        returns the bytes held
+    shrink: callable
+        frees at least the bytes given if it can, returns the bytes freed. Consumers without one are never shrunk
+    """
+    def __init__(self, name : str, priority : int, usage : Callable[[], int], shrink : Callable[[int], int] | None = None):
+        self.name = name
+        self.priority = priority
+        self.usage = usage
+        self.shrink = shrink
+
+class MemoryGovernor():
+    """A single memory budget shared by playback buffers, decode-ahead and PCM caches.
+
+    Consumers ask before growing and are shrunk, the lowest priority first,
+    whenever the budget is exceeded or the system runs short of available
+    memory. Playback buffers are always granted, they are what keeps the
+    audio going.
+    """
+    # Memory left to the system, as a part of the total memory
+    RESERVE_RATIO = 0.1
+    MEMINFO_INTERVAL = 0.5
+
+    def __init__(self, budget : int | None = None):
+        self.__lock : threading.RLock = threading.RLock()
+        self.__consumers : list[MemoryConsumer] = list()
+        self.__budget : int | None = budget
+        self.__system : tuple[int, int] | None = None
+        self.__system_time : float = float("-inf")
+        self.__reported : set[str] = set()
+
+    @property
+    def budget(self) -> int:
+        """Bytes the consumers may hold together, a quarter of the system memory up to DEFAULT_BUDGET unless set"""
+        if self.__budget is not None:
+            return self.__budget
+        system = self.__system_memory()
+        return min(system[0] // 4, DEFAULT_BUDGET) if system else DEFAULT_BUDGET
+
+    @budget.setter
+    def budget(self, value : int | None):
+        self.__budget = value
+        self.rebalance()
+
+    @property
+    def consumers(self) -> list[MemoryConsumer]:
+        return self.__consumers
+
+    def register(self, consumer : MemoryConsumer) -> MemoryConsumer:
+        with self.__lock:
+            self.__consumers.append(consumer)
+        return consumer
+
+    def unregister(self, consumer : MemoryConsumer):
+        with self.__lock:
+            if consumer in self.__consumers:
+                self.__consumers.remove(consumer)
+        self.report()
+
+    def __system_memory(self) -> tuple[int, int] | None:
+        now = time.monotonic()
+        if now - self.__system_time >= self.MEMINFO_INTERVAL:
+            self.__system = system_memory()
+            self.__system_time = now
+        return self.__system
+
+    def usage(self) -> dict[str, int]:
+        """Bytes held per consumer name"""
+        usage : dict[str, int] = dict()
+        for consumer in list(self.__consumers):
+            usage[consumer.name] = usage.get(consumer.name, 0) + consumer.usage()
+        return usage
+
+    def limit(self, used : int | None = None) -> int:
+        """Bytes the consumers may hold now, the budget or less when the system is under memory pressure"""
+        limit = self.budget
+        system = self.__system_memory()
+        if system:
+            total, available = system
+            used = sum(self.usage().values()) if used is None else used
+            limit = min(limit, used + available - int(total * self.RESERVE_RATIO))
+        return max(limit, 0)
+
+    def request(self, priority : int, size : int) -> bool:
+        """Asks to allocate size bytes, shrinking consumers of a lower priority to make room if needed
+
+        Returns
+        -------
+        bool
+            True when the allocation fits, always for playback buffers
+        """
+        with self.__lock:
+            used = sum(self.usage().values())
+            excess = used + size - self.limit(used)
+            if excess > 0:
+                excess -= self.__shrink(excess, lambda consumer: consumer.priority > priority)
+            self.report()
+            if excess > 0:
+                diagnostics.add("memory", "denied requests")
+            return excess <= 0 or priority == PLAYBACK
+
+    def rebalance(self) -> int:
+        """Shrinks consumers until they fit the limit, returns the bytes freed"""
+        with self.__lock:
+            used = sum(self.usage().values())
+            excess = used - self.limit(used)
+            freed = self.__shrink(excess, lambda consumer: True) if excess > 0 else 0
+            self.report()
+            return freed
+
+    def __shrink(self, excess : int, eligible : Callable[[MemoryConsumer], bool]) -> int:
+        freed = 0
+        for consumer in sorted(self.__consumers, key=lambda consumer: consumer.priority, reverse=True):
+            if freed >= excess:
+                break
+            if consumer.shrink and eligible(consumer):
+                freed += consumer.shrink(excess - freed)
+        if freed:
+            diagnostics.add("memory", "shrinks")
+            diagnostics.add("memory", "freed (MB)", freed / MEGABYTE)
+        return freed
+
+    def report(self):
+        """Publishes the allocations in the memory diagnostics section"""
+        usage = self.usage()
+        diagnostics.set("memory", "budget (MB)", self.budget / MEGABYTE)
+        diagnostics.set("memory", "limit (MB)", self.limit(sum(usage.values())) / MEGABYTE)
+        system = self.__system_memory()
+        if system:
+            diagnostics.set("memory", "system available (MB)", system[1] / MEGABYTE)
+        # Names without consumers left read 0 instead of their last value
+        for name in self.__reported | set(usage):
+            diagnostics.set("memory", f"{name} (MB)", usage.get(name, 0) / MEGABYTE)
+        self.__reported |= set(usage)
+        diagnostics.set("memory", "total (MB)", sum(usage.values()) / MEGABYTE)
+
+memory_governor = MemoryGovernor()
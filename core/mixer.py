@@ -0,0 +1,106 @@
+import functools
+import numpy
+
+@functools.lru_cache(maxsize=32)
+def gain_ramp(frames: int, rising: bool = True, equal_power: bool = False) -> numpy.ndarray:
+    """Gain going from 0 to 1, or 1 to 0, over frames, shaped (frames, 1) to broadcast over channels
+
+    Fades use a raised cosine, crossfades an equal power curve keeping the
+    loudness constant while two uncorrelated tracks overlap.
+    """
+    x = (numpy.arange(frames, dtype=numpy.float32) + 0.5) / max(frames, 1)
+    if equal_power:
+        ramp = numpy.sin(x * numpy.float32(numpy.pi / 2))
+    else:
+        ramp = 0.5 - 0.5 * numpy.cos(x * numpy.float32(numpy.pi))
+    if not rising:
+        ramp = ramp[::-1]
+    ramp = numpy.ascontiguousarray(ramp, dtype=numpy.float32).reshape(-1, 1)
+    ramp.setflags(write=False)
+    return ramp
+
+def _to_dtype(mixed: numpy.ndarray, dtype: numpy.dtype) -> numpy.ndarray:
+    if numpy.issubdtype(dtype, numpy.integer):
+        limits = numpy.iinfo(dtype)
+        return numpy.clip(numpy.rint(mixed), limits.min, limits.max).astype(dtype)
+    return numpy.clip(mixed, -1.0, 1.0).astype(dtype)
+
+def fade(block: numpy.ndarray, rising: bool) -> numpy.ndarray:
+    """Returns a faded copy of block, in the dtype of block"""
+    if not len(block):
+        return block.copy()
+    return _to_dtype(block * gain_ramp(len(block), rising), block.dtype)
+
+def crossfade(outgoing: numpy.ndarray, incoming: numpy.ndarray) -> numpy.ndarray:
+    """Mixes the end of a track fading out with the start of the next one, in the dtype of incoming
+
+    Both blocks must have the same shape, samples stay in the integer or
+    floating point scale of their dtype so no normalization is needed.
+    """
+    if not len(incoming):
+        return incoming.copy()
+    frames = len(incoming)
+    mixed = outgoing * gain_ramp(frames, rising=False, equal_power=True)
+    mixed += incoming * gain_ramp(frames, rising=True, equal_power=True)
+    return _to_dtype(mixed, incoming.dtype)
+
+# Left and right gains of the channels of the WAVE and FLAC layouts of 3 to 8 channels:
+# front left, front right, center, LFE, then back and side channels. ITU-R BS.775 downmix, the LFE at -6 dB
+_CENTER = 0.7071
+_SURROUND = 0.7071
+_LFE = 0.5
+_STEREO_DOWNMIX = {
+    3: [(1, 0), (0, 1), (_CENTER, _CENTER)],
+    4: [(1, 0), (0, 1), (_SURROUND, 0), (0, _SURROUND)],
+    5: [(1, 0), (0, 1), (_CENTER, _CENTER), (_SURROUND, 0), (0, _SURROUND)],
+    6: [(1, 0), (0, 1), (_CENTER, _CENTER), (_LFE, _LFE), (_SURROUND, 0), (0, _SURROUND)],
+    7: [(1, 0), (0, 1), (_CENTER, _CENTER), (_LFE, _LFE), (0.5, 0.5), (_SURROUND, 0), (0, _SURROUND)],
+    8: [(1, 0), (0, 1), (_CENTER, _CENTER), (_LFE, _LFE), (_SURROUND, 0), (0, _SURROUND), (_SURROUND, 0), (0, _SURROUND)],
+}
+
+@functools.lru_cache(maxsize=32)
+def downmix_matrix(source: int, channels: int) -> numpy.ndarray:
+    """Gains of the source channels in every output channel, shaped (source, channels)
+
+    Mono gets the average of all channels and stereo the standard downmix of
+    surround layouts, other counts fold channel i into channel i % channels.
+    Every output channel is normalized to a total gain of 1 so a full scale
+    source can't clip.
+    """
+    if channels == 1:
+        matrix = numpy.ones((source, 1), dtype=numpy.float32)
+    elif channels == 2 and source in _STEREO_DOWNMIX:
+        matrix = numpy.array(_STEREO_DOWNMIX[source], dtype=numpy.float32)
+    else:
+        matrix = numpy.zeros((source, channels), dtype=numpy.float32)
+        matrix[numpy.arange(source), numpy.arange(source) % channels] = 1
+    matrix /= matrix.sum(axis=0, keepdims=True)
+    matrix.setflags(write=False)
+    return matrix
+
+def remix(block: numpy.ndarray, channels: int) -> numpy.ndarray:
+    """Returns block with channels channels, in the dtype of block
+
+    Extra channels are downmixed with downmix_matrix, missing ones repeat
+    the source channels in turn: mono is duplicated and stereo goes to the
+    left and right of every pair.
+    """
+    source = block.shape[1]
+    if source == channels:
+        return block
+    if source < channels:
+        return block[:, numpy.arange(channels) % source]
+    return _to_dtype(block @ downmix_matrix(source, channels), block.dtype)
+
+def slip(block: numpy.ndarray, frames: int) -> numpy.ndarray:
+    """Drops frames, or repeats them when frames is negative, evenly spread over block
+
+    Single frame slips are how an output follows a clock drifting away from
+    the one the audio was produced for, a few hundred per million aren't heard.
+    """
+    count = min(abs(frames), len(block) // 2)
+    if not count:
+        return block
+    counts = numpy.ones(len(block), dtype=numpy.intp)
+    counts[numpy.arange(count) * len(block) // count + len(block) // (2 * count)] = 0 if frames > 0 else 2
+    return numpy.repeat(block, counts, axis=0)
@@ -1,9 +1,25 @@
 import asyncio
 from asyncio.tasks import Task
-import sounddevice
 import os
+import struct
+import time
+from typing import Callable
 from tinytag import TinyTag
-from core.device import OutputDevice, DeviceInfo, HostApiInfo
+from core.device import OutputDevice, OutputDeviceList, DeviceInfo, HostApiInfo
+from core.diagnostics import diagnostics
+from core.hotplug import DeviceChange, DeviceMonitor, device_card, device_identity, fallback_device, find_device
+from core.decoders import registry as decoder_registry
+from core.search import SearchIndex
+from core.watcher import LibraryChanges, LibraryWatcher
+from core.waveform import WaveformCache
+from core.loudness import LoudnessStore
+from core.duplicates import ContentHashStore
+from core.cue import CueSheet, find_cue_sheet, is_cue_sheet, parse_cue_sheet
+from core.memory import memory_governor
+from core.readahead import DEFAULT_WINDOW, Prefetcher
+from core.session import PLAYING, REPEAT, SHUFFLE, SessionSnapshot, SessionStore, library_fingerprint
+from core.tracing import tracer
+import numpy
 from numpy import random
 
 class TrackInfo():
@@ -18,8 +34,99 @@ class TrackInfo():
     channels : int
     bitdepth : str
     filetype: str
+    loudness : float | None = None
+    true_peak : float | None = None
+    replaygain : float | None = None
+    content_hash : str | None = None
+    # Virtual tracks of a CUE sheet are played from start_frame to end_frame of their file
+    start_frame : int = 0
+    end_frame : int | None = None
+    cue_sheet : str | None = None
+
+    @property
+    def key(self) -> str:
+        """Identifies the track in the library, virtual tracks share the path of their file"""
+        return self.path if self.cue_sheet is None else f"{self.path}#{self.start_frame}"
+
+def is_audio_file(filename : str) -> bool:
+    return decoder_registry.is_supported_name(filename)
+
+def read_track_info(filepath : str) -> TrackInfo | None:
+    try:
+        tags = TinyTag.get(filepath)
+    except Exception:
+        return None
+    track_info = TrackInfo()
+    track_info.path = filepath
+    track_info.title = tags.title
+    track_info.album = tags.album
+    track_info.artist = tags.artist
+    track_info.albumartist = tags.albumartist
+    track_info.samplerate = tags.samplerate
+    track_info.duration = tags.duration
+    return track_info
+
+def cue_tracks(image : TrackInfo, sheet : CueSheet) -> list[TrackInfo]:
+    """Virtual tracks of a CUE sheet read from the image file of a whole album, the image alone if it has no sample rate"""
+    samplerate = image.samplerate
+    if not samplerate:
+        return [image]
+    tracks = list[TrackInfo]()
+    for cue_track in sheet.tracks_of(os.path.abspath(image.path)):
+        track_info = TrackInfo()
+        track_info.path = image.path
+        track_info.title = cue_track.title or f"Track {cue_track.number:02}"
+        track_info.album = sheet.title or image.album
+        track_info.artist = cue_track.performer or sheet.performer or image.artist
+        track_info.albumartist = sheet.performer or image.albumartist
+        track_info.samplerate = samplerate
+        track_info.start_frame = cue_track.start_frame(samplerate)
+        track_info.end_frame = sheet.end_frame(cue_track, samplerate)
+        end_seconds = (image.duration or 0.0) if track_info.end_frame is None else track_info.end_frame / samplerate
+        track_info.duration = max(end_seconds - track_info.start_frame / samplerate, 0.0)
+        track_info.cue_sheet = sheet.path
+        tracks.append(track_info)
+    return tracks or [image]
+
+def read_tracks(filepath : str, sheet : CueSheet | None = None) -> list[TrackInfo]:
+    """Track of a file, or its virtual tracks when a CUE sheet of its directory references it"""
+    track_info = read_track_info(filepath)
+    if not track_info:
+        return []
+    sheet = sheet or find_cue_sheet(filepath)
+    return cue_tracks(track_info, sheet) if sheet else [track_info]
+
+def scan_library(path : str) -> list[TrackInfo]:
+    library = list[TrackInfo]()
+    for root, _, files in os.walk(path):
+        # Sheets are parsed once per directory, by the file they reference
+        sheets : dict[str, CueSheet] = dict()
+        for file in files:
+            if is_cue_sheet(file):
+                try:
+                    sheet = parse_cue_sheet(os.path.join(root, file))
+                except (OSError, ValueError):
+                    continue
+                for filepath in sheet.files:
+                    sheets.setdefault(filepath, sheet)
+        for file in files:
+            if is_audio_file(file):
+                filepath = os.path.join(root, file)
+                # Header sniff rejects unsupported files before the tags are parsed
+                if not decoder_registry.find(filepath):
+                    continue
+                track_info = read_track_info(filepath)
+                if track_info:
+                    sheet = sheets.get(os.path.abspath(filepath))
+                    library.extend(cue_tracks(track_info, sheet) if sheet else [track_info])
+    return library
 
 class HandcraftedAudioPlayer():
+    # Seconds before the end of a track the next one starts decoding
+    PRELOAD_SECONDS = 30.0
+    # Seconds after reopening a lost device within which losing it again falls back to another one
+    RESTART_SECONDS = 10.0
+
     def __init__(self):
         self.__current_device_info : DeviceInfo | None = None
         self.__current_track_info : TrackInfo | None = None
@@ -27,6 +134,7 @@ class HandcraftedAudioPlayer():
         self.__on_track_changed : list = list()
         self.__on_track_ended : list = list()
         self.__on_playlist_changed : list = list()
+        self.__on_playback_state_changed : list = list()
         self.__current_library : list[TrackInfo] | None = None
         self.__current_playlist_queue : list[TrackInfo] | None = None
         self.__current_track_index : int = 0
@@ -35,27 +143,180 @@ class HandcraftedAudioPlayer():
         self.__repeat_playlist : bool = False
         self.__is_playlist_queue_shuffled : bool = False
         self.__play_next_task : Task | None = None
+        # Counts plays and stops, a play superseded while its track was being prepared is dropped
+        self.__play_requests : int = 0
+        self.__search_index : SearchIndex = SearchIndex()
+        self.__search_query : str = ""
+        self.__library_path : str | None = None
+        self.__library_watcher : LibraryWatcher | None = None
+        self.__waveforms : WaveformCache = WaveformCache()
+        self.__waveform_lookahead : int = 3
+        self.__device_list : OutputDeviceList = OutputDeviceList()
+        # Host api and name of the device chosen, playback returns to it after a failover
+        self.__preferred_device : tuple[str, str] | None = None
+        self.__device_monitor : DeviceMonitor | None = None
+        self.__restarted : float = 0.0
+        self.__on_output_device_changed : list = list()
+        self.__crossfade : float = 0.0
+        self.__realtime : bool = False
+        self.__read_ahead : int = DEFAULT_WINDOW
+        self.__prefetcher : Prefetcher = Prefetcher()
+        self.__prefetch_lookahead : int = 2
+        self.__collapse_duplicates : bool = False
+        self.__session : SessionStore | None = None
+        # Fingerprint of the library and position of its tracks, the saved queue refers to them
+        self.__library_index : tuple[bytes, dict[int, int]] | None = None
+        # Key of the restored track and the position its next play starts at
+        self.__resume : tuple[str, float] | None = None
         
 
-    def get_outout_device_list_by_api(self) -> list[HostApiInfo]:
-        host_apis = list[HostApiInfo]()
-        for api in sounddevice.query_hostapis():
-            host_apis.append(HostApiInfo(api))
-        return host_apis
+    def get_outout_device_list_by_api(self, refresh : bool = False) -> list[HostApiInfo]:
+        return self.__device_list.get(refresh=refresh)
+
+    @property
+    def device_list(self) -> OutputDeviceList:
+        return self.__device_list
+
+    def refresh_device_list(self, on_host_api = None) -> list[HostApiInfo]:
+        """Enumerates devices again, PortAudio is reinitialized to see hotplugged devices unless a track is playing"""
+        return self.__device_list.get(refresh=True, on_host_api=on_host_api, reinitialize=not self.is_playing and self.is_stoped)
 
     def get_files_into_directory(self, path: str) -> list[TinyTag]:
         filelist = list()
         for root, _, files in os.walk(path):
             for file in files:
-                if file.endswith(".flac"):
+                if is_audio_file(file):
                     filelist.append(TinyTag.get(os.path.join(root, file)))
         return filelist
     
     def set_output_device(self, device : DeviceInfo):
+        """Plays on device from the next track, the device monitor brings playback back to it after a failover"""
+        self.__preferred_device = device_identity(device)
+        self.__open_output_device(device)
+
+    def __open_output_device(self, device : DeviceInfo):
         if self.__output_device:
-            self.__output_device.stop()
+            self.__output_device.close()
         self.__current_device_info = device
-        self.__output_device = OutputDevice(self.__current_device_info)
+        self.__output_device = OutputDevice(self.__current_device_info, realtime=self.__realtime, read_ahead=self.__read_ahead)
+
+    @property
+    def preferred_device(self) -> tuple[str, str] | None:
+        """Host api and name of the device set with set_output_device"""
+        return self.__preferred_device
+
+    @property
+    def on_output_device_changed(self) -> list:
+        """Callbacks receiving the device played on, "failover" or "switch back" and the seconds playback took to move, when the device monitor moves it"""
+        return self.__on_output_device_changed
+
+    def monitor_devices(self):
+        """Moves playback to a fallback device when the output device is lost, and back to the preferred one when it returns
+
+        Must be called from the event loop, devices are enumerated in a thread.
+        A device lost while still listed is reopened first, and only fallen
+        back from when lost again within RESTART_SECONDS. PortAudio only lists devices plugged since its initialization once
+        reinitialized, which needs every stream closed, and only when sound
+        cards are plugged or unplugged. Where the system gives no card list,
+        only Linux does, a returned device is listed once the device settings
+        enumerate devices again while playback is stopped.
+        """
+        if self.__device_monitor:
+            return
+        self.__device_monitor = DeviceMonitor(lambda: bool(self.__output_device and self.__output_device.failed), self.__follow_devices)
+        self.__device_monitor.start()
+
+    def unmonitor_devices(self):
+        if self.__device_monitor:
+            self.__device_monitor.stop()
+            self.__device_monitor = None
+
+    async def __follow_devices(self, change : DeviceChange):
+        if not self.__current_device_info:
+            return
+        current = device_identity(self.__current_device_info)
+        preferred = self.__preferred_device
+        is_open = bool(self.__output_device and self.__output_device.is_open)
+        if change.lost or device_card(current, change.removed):
+            def choose_fallback(host_apis : list[HostApiInfo]) -> DeviceInfo | None:
+                # A lost preferred device that is still listed is broken, it is returned to when plugged again
+                returned = find_device(host_apis, preferred) if preferred != current else None
+                return returned or fallback_device(host_apis, current) or find_device(host_apis, current)
+            if not device_card(current, change.removed) and change.detected - self.__restarted > self.RESTART_SECONDS:
+                # A stream lost while its card is still plugged is reopened on the same device first, a device unplugged is no longer listed
+                self.__restarted = change.detected
+                await self.__reopen_output("restart", change.detected, lambda host_apis: find_device(host_apis, current) or choose_fallback(host_apis))
+                return
+            await self.__reopen_output("failover", change.detected, choose_fallback)
+            return
+        choose = lambda host_apis: find_device(host_apis, preferred) or find_device(host_apis, current) or fallback_device(host_apis, current)
+        if preferred != current and preferred and device_card(preferred, change.added):
+            await self.__reopen_output("switch back", change.detected, choose)
+        elif (change.added or change.removed) and is_open:
+            # Enumerated again when the settings are shown, the playing stream prevents a reinitialization
+            self.__device_list.invalidate()
+        elif change.added or change.removed:
+            # Nothing plays, PortAudio is reinitialized to list the cards plugged and unplugged
+            host_apis = await asyncio.to_thread(self.__device_list.get, refresh=True, reinitialize=True)
+            device = choose(host_apis)
+            if device and (not self.__output_device or device_identity(device) != current or device.index != self.__current_device_info.index):
+                await self.__reopen_output("switch back" if device_identity(device) == preferred else "refresh", change.detected, choose, host_apis)
+
+    async def __reopen_output(self, reason : str, detected : float, choose : Callable[[list[HostApiInfo]], DeviceInfo | None], host_apis : list[HostApiInfo] | None = None):
+        """Closes the output, enumerates devices again unless host_apis are given and plays on the one chosen from where playback was
+
+        Paused playback is left stopped, the next play resumes it where it was.
+        """
+        track = self.__current_track_info
+        output = self.__output_device
+        current = device_identity(self.__current_device_info) if self.__current_device_info else None
+        if track and output and output.is_open and not self.__playback_stoped:
+            self.__resume = (track.key, output.heard_position)
+        playing = bool(self.__resume and not self.__playback_stoped and not self.__playback_paused)
+        mirrors = [device_identity(device) for device in self.current_devices[1:]]
+        if self.__play_next_task:
+            self.__play_next_task.cancel()
+            self.__play_next_task = None
+        with tracer.span("reopen output", "devices", reason=reason):
+            if output:
+                self.__output_device = None
+                await asyncio.wrap_future(output.close())
+            # Playback state listeners are told once it plays again, or when it can't
+            self.__playback_stoped = True
+            if host_apis is None:
+                host_apis = await asyncio.to_thread(self.__device_list.get, refresh=True, reinitialize=True)
+            device = choose(host_apis)
+            if not device:
+                diagnostics.add("devices", f"{reason} failures")
+                self.__notify_playback_state_changed()
+                return
+            if reason == "restart" and device_identity(device) != current:
+                reason = "failover"
+            self.__open_output_device(device)
+            assert self.__output_device
+            for identity in mirrors:
+                mirror = find_device(host_apis, identity)
+                if mirror and identity != device_identity(device):
+                    self.__output_device.add_mirror(mirror)
+            if playing:
+                await self.__play()
+            else:
+                self.__notify_playback_state_changed()
+        if reason == "refresh":
+            return
+        elapsed = time.perf_counter() - detected
+        diagnostics.add("devices", f"{reason}s")
+        diagnostics.set("devices", f"last {reason} (ms)", round(elapsed * 1000, 1))
+        diagnostics.set("devices", "output", device.name)
+        for event in self.__on_output_device_changed:
+            event(device, reason, elapsed)
+
+    def set_output_devices(self, devices : list[DeviceInfo]):
+        """Plays to every device at once, tracks are decoded once and the first device clocks the others"""
+        self.set_output_device(devices[0])
+        assert self.__output_device
+        for device in devices[1:]:
+            self.__output_device.add_mirror(device)
 
     @property
     def is_playing(self) -> bool:
@@ -67,9 +328,15 @@ class HandcraftedAudioPlayer():
     def current_device(self) -> DeviceInfo | None:
         return self.__current_device_info
 
+    @property
+    def current_devices(self) -> list[DeviceInfo]:
+        if not self.__output_device or not self.__current_device_info:
+            return []
+        return [self.__current_device_info] + [mirror.device_info for mirror in self.__output_device.mirrors]
+
     @property
     def current_track(self) -> TrackInfo | None:
-        self.__current_track_info
+        return self.__current_track_info
 
     @property
     def current_playlist(self) -> list[TrackInfo] | None:
@@ -79,36 +346,132 @@ class HandcraftedAudioPlayer():
     def current_track_index(self) -> int :
         return self.__current_track_index
 
-    async def play(self, index : int | None = None) -> None:
-        if self.__play_next_task:
+    @property
+    def waveforms(self) -> WaveformCache:
+        return self.__waveforms
+
+    @property
+    def crossfade(self) -> float:
+        """Seconds consecutive tracks overlap, 0 plays them gapless"""
+        return self.__crossfade
+
+    @crossfade.setter
+    def crossfade(self, seconds : float):
+        self.__crossfade = min(max(float(seconds), 0.0), 12.0)
+
+    @property
+    def memory_budget(self) -> int:
+        """Bytes shared by playback buffers, decode-ahead and PCM caches, see MemoryGovernor"""
+        return memory_governor.budget
+
+    @memory_budget.setter
+    def memory_budget(self, size : int | None):
+        memory_governor.budget = size
+
+    @property
+    def realtime(self) -> bool:
+        """Decodes with a raised worker priority into buffers locked in memory, where the system permits it"""
+        return self.__realtime
+
+    @realtime.setter
+    def realtime(self, value : bool):
+        self.__realtime = value
+        if self.__output_device:
+            self.__output_device.realtime = value
+
+    @property
+    def read_ahead(self) -> int:
+        """Bytes of the playing file read ahead of the decoder, 0 reads as decoded"""
+        return self.__read_ahead
+
+    @read_ahead.setter
+    def read_ahead(self, size : int):
+        self.__read_ahead = size
+        if self.__output_device:
+            self.__output_device.read_ahead = size
+
+    async def play(self, index : int | None = None, position : float = 0.0) -> None:
+        """Plays the track at index of the queue, the current one if None, from position seconds"""
+        await self.__play(index, position=position)
+
+    async def __play(self, index : int | None = None, advance : bool = False, position : float = 0.0) -> None:
+        # Playing the next track from the task waiting for it mustn't cancel the play itself
+        if self.__play_next_task and self.__play_next_task is not asyncio.current_task():
             self.__play_next_task.cancel()
+        self.__play_requests += 1
+        request = self.__play_requests
 
         if self.__output_device and self.__current_playlist_queue:
             if index != None:
                 self.__current_track_index = index
 
             track = self.__current_playlist_queue[self.__current_track_index]
-            playback_info = self.__output_device.play(track.path)
+            resume, self.__resume = self.__resume, None
+            if resume and resume[0] == track.key and not advance and not position:
+                position = resume[1]
+            offset = round(min(max(position, 0.0), track.duration or 0.0) * track.samplerate) if track.samplerate else 0
+            upcoming = self.__current_playlist_queue[self.__current_track_index:self.__current_track_index + 1 + self.__waveform_lookahead]
+            with tracer.span("request waveforms", "player"):
+                self.__waveforms.request([queued.path for queued in upcoming])
+            # Tracks of a CUE image share its file, only the next distinct files are worth warming
+            prefetched = [queued.path for queued in upcoming[1:] if queued.path != track.path]
+            self.__prefetcher.request(list(dict.fromkeys(prefetched))[:self.__prefetch_lookahead])
+            # Skipping crossfades too, the next track is queued at the end of the playing one when it is reached
+            output = self.__output_device
+            with tracer.span("play", "player", path=track.path, index=self.__current_track_index, advance=advance):
+                # Prefilled and mixed on the device mixer thread
+                playback_info = await asyncio.wrap_future(output.play(track.path, crossfade=self.__crossfade, queued=advance, start=track.start_frame, end=track.end_frame, offset=offset))
+            if request != self.__play_requests or output is not self.__output_device:
+                return
 
             self.__playback_stoped = False
             track.channels = playback_info.channels
             track.bitdepth = playback_info.bitdepth
             track.filetype = playback_info.filetype
-            track.elapsed = 0.0
+            track.elapsed = offset / track.samplerate if offset else 0.0
             self.__current_track_info = track
-            for event in self.on_track_changed:
-                event(self.__current_track_info, self.__current_device_info)
+            with tracer.span("track changed handlers", "player", handlers=len(self.on_track_changed)):
+                for event in self.on_track_changed:
+                    event(self.__current_track_info, self.__current_device_info)
             self.__play_next_task = asyncio.create_task(self.__wait_and_play_next())
             self.__playback_stoped = False
             self.__playback_paused = False
+            self.__save_session()
+            self.__notify_playback_state_changed()
 
     async def __wait_and_play_next(self):
+        # The next track is handed to the device while this one still plays, before the callback takes the last block
+        tick = 0.25
         while self.is_playing == True:
-            await asyncio.sleep(1)
-            if self.__current_track_info and self.__playback_paused == False:
-                self.__current_track_info.elapsed += 1
+            await asyncio.sleep(tick)
+            if not self.__output_device or self.__playback_paused or self.__playback_stoped:
+                continue
+            crossfade = self.__crossfade
+            if self.__current_track_info:
+                self.__current_track_info.elapsed = self.__output_device.position
+                # Short tracks don't get skipped by a long crossfade
+                crossfade = min(crossfade, (self.__current_track_info.duration or 0) / 2)
+            memory_governor.rebalance()
+            self.__update_session()
+            remaining = self.__output_device.remaining
+            if self.has_next and remaining <= crossfade + self.PRELOAD_SECONDS and self.__current_playlist_queue:
+                upcoming = self.__current_playlist_queue[(self.__current_track_index + 1) % len(self.__current_playlist_queue)]
+                self.__output_device.preload(upcoming.path, upcoming.start_frame)
+            if self.has_next and remaining <= crossfade + self.__output_device.block_duration + 2 * tick:
+                for event in self.__on_track_ended:
+                    event(self.__current_track_info)
+                self.__increase_current_index()
+                await self.__play(advance=True)
+                return
         if self.__playback_stoped == False:
-            await self.next()
+            for event in self.__on_track_ended:
+                event(self.__current_track_info)
+            if self.has_next:
+                await self.next()
+            else:
+                self.__playback_stoped = True
+                self.__update_session()
+                self.__notify_playback_state_changed()
 
     @property
     def on_track_changed(self) -> list:
@@ -122,6 +485,15 @@ class HandcraftedAudioPlayer():
     def on_playlist_changed(self) -> list:
         return self.__on_playlist_changed
 
+    @property
+    def on_playback_state_changed(self) -> list:
+        """Callbacks called without arguments when playback starts, pauses, resumes or stops"""
+        return self.__on_playback_state_changed
+
+    def __notify_playback_state_changed(self):
+        for event in self.__on_playback_state_changed:
+            event()
+
     @property
     def is_paused(self) -> bool :
         return self.__playback_paused
@@ -134,20 +506,57 @@ class HandcraftedAudioPlayer():
     def is_repeat_enabled(self) -> bool:
         return self.__repeat_playlist
 
+    @property
+    def has_next(self) -> bool:
+        if not self.__current_playlist_queue:
+            return False
+        return self.__repeat_playlist or self.__current_track_index < len(self.__current_playlist_queue)-1
+
+    @property
+    def is_shuffle_enabled(self) -> bool:
+        return self.__is_playlist_queue_shuffled
+
+    def tap(self, frames : int):
+        """Last frames heard on the output device with its sample rate, see OutputDevice.tap"""
+        if not self.__output_device or self.__playback_paused or self.__playback_stoped:
+            return None
+        return self.__output_device.tap(frames)
+
+    async def seek(self, position : float) -> float:
+        """Moves playback of the current track to position seconds and returns the actual position"""
+        output, track = self.__output_device, self.__current_track_info
+        if not output or not track or self.__playback_stoped:
+            return 0.0
+        position = await asyncio.wrap_future(output.seek(position))
+        if output is not self.__output_device or track is not self.__current_track_info or self.__playback_stoped:
+            # Another track or device took over meanwhile
+            return position
+        track.elapsed = position
+        self.__update_session()
+        self.__notify_playback_state_changed()
+        return position
+
     def resume(self):
         if self.__output_device:
             self.__output_device.resume()
             self.__playback_paused = False
+            self.__update_session()
+            self.__notify_playback_state_changed()
 
     def pause(self):
         if self.__output_device:
             self.__output_device.pause()
             self.__playback_paused = True
+            self.__update_session()
+            self.__notify_playback_state_changed()
 
     def stop(self):
+        self.__play_requests += 1
         if self.__output_device:
+            # Faded out on the mixer thread, a play requested meanwhile runs after it
             self.__output_device.stop()
             self.__playback_stoped = True
+            self.__notify_playback_state_changed()
 
     def __increase_current_index(self):
         if self.__current_playlist_queue:
@@ -173,43 +582,323 @@ class HandcraftedAudioPlayer():
         self.__decrease_current_index()
         await self.play()
 
+    def __build_playlist_queue(self) -> list[TrackInfo]:
+        if self.__search_query:
+            queue = self.__search_index.search(self.__search_query)
+        elif self.__current_library:
+            queue = self.__current_library.copy()
+        else:
+            queue = list[TrackInfo]()
+        if self.__collapse_duplicates:
+            hashes = set[tuple]()
+            collapsed = list[TrackInfo]()
+            for track in queue:
+                if track.content_hash:
+                    # Virtual tracks of an image share its hash, only the same part of the same audio is a duplicate
+                    content = (track.content_hash, track.start_frame, track.end_frame)
+                    if content in hashes:
+                        continue
+                    hashes.add(content)
+                collapsed.append(track)
+            queue = collapsed
+        if self.__is_playlist_queue_shuffled == True:
+            random.shuffle(queue)
+        return queue
+
+    def __rebuild_playlist_queue(self):
+        current_file = None
+        if self.__current_playlist_queue and self.__current_track_index < len(self.__current_playlist_queue):
+            current_file = self.__current_playlist_queue[self.__current_track_index]
+        self.__current_playlist_queue = self.__build_playlist_queue()
+        self.__current_track_index = 0
+        if current_file:
+            for index, track in enumerate(self.__current_playlist_queue):
+                if track.key == current_file.key:
+                    self.__current_track_index = index
+                    break
+        self.__save_session()
+        for event in self.__on_playlist_changed:
+            event()
+
     def shuffle(self):
         self.__is_playlist_queue_shuffled = not self.__is_playlist_queue_shuffled
         if self.__current_playlist_queue and self.__current_library:
-            current_file = self.__current_playlist_queue[self.__current_track_index]
-            self.__current_playlist_queue = self.__current_library.copy()
-            if self.__is_playlist_queue_shuffled == True:
-                random.shuffle(self.__current_playlist_queue)
-            index = 0
-            for track in self.__current_playlist_queue:
-                if track.path == current_file.path:
-                    break
-                index += 1
-            self.__current_track_index = index
-            for event in self.__on_playlist_changed:
-                event()
+            self.__rebuild_playlist_queue()
+
+    @property
+    def search_query(self) -> str:
+        return self.__search_query
+
+    def search(self, query : str) -> list[TrackInfo]:
+        """Returns library tracks whose title, artist, album or album artist match query"""
+        return self.__search_index.search(query)
+
+    def filter(self, query : str):
+        """Replaces the playlist queue with the library tracks matching query
+
+        Parameters
+        ----------
+        query: str
+            search terms, an empty query restores the whole library
+        """
+        query = query.strip()
+        if query == self.__search_query:
+            return
+        self.__search_query = query
+        self.__rebuild_playlist_queue()
 
     def repeat(self):
         self.__repeat_playlist = not self.__repeat_playlist
+        self.__update_session()
+
+    @property
+    def collapse_duplicates(self) -> bool:
+        """Shows only the first of the tracks with the same audio in the queue, see find_duplicates"""
+        return self.__collapse_duplicates
+
+    @collapse_duplicates.setter
+    def collapse_duplicates(self, value : bool):
+        if value != self.__collapse_duplicates:
+            self.__collapse_duplicates = value
+            self.__rebuild_playlist_queue()
+
+    @property
+    def session(self) -> SessionStore | None:
+        """Store the queue and playback state are saved to whenever they change, see restore_session
+
+        Stopping isn't saved, it is also how the player is shut down.
+        """
+        return self.__session
+
+    @session.setter
+    def session(self, store : SessionStore | None):
+        if self.__session:
+            self.__session.close()
+        self.__session = store
+
+    def restore_session(self) -> SessionSnapshot | None:
+        """Restores the queue order, the current track, shuffle and repeat from the session store
+
+        The saved queue is used as is while the library is the same, otherwise
+        it is built again from the library. The next play of the current track
+        starts at its saved position.
+
+        Returns
+        -------
+        SessionSnapshot
+            restored snapshot, None if there is none
+        """
+        if not self.__session or not self.__current_library:
+            return None
+        snapshot = self.__session.load()
+        if not snapshot:
+            return None
+        library = self.__current_library
+        self.__is_playlist_queue_shuffled = snapshot.shuffle
+        self.__repeat_playlist = snapshot.repeat
+        self.__search_query = snapshot.query
+        if snapshot.fingerprint == self.__indexed_library()[0] and bool((snapshot.queue < len(library)).all()):
+            self.__current_playlist_queue = [library[position] for position in snapshot.queue.tolist()]
+        else:
+            self.__current_playlist_queue = self.__build_playlist_queue()
+        queue = self.__current_playlist_queue
+        index = snapshot.index if snapshot.index < len(queue) and queue[snapshot.index].key == snapshot.key else None
+        if index is None:
+            index = next((index for index, track in enumerate(queue) if track.key == snapshot.key), None)
+        self.__current_track_index = index if index is not None else min(snapshot.index, max(len(queue) - 1, 0))
+        if index is not None and queue[index].samplerate:
+            self.__resume = (snapshot.key, snapshot.frame / queue[index].samplerate)
+        for event in self.__on_playlist_changed:
+            event()
+        return snapshot
+
+    def __session_state(self) -> tuple[int, int, int]:
+        """Current index, frame of the current track and flags saved to the session"""
+        flags = (SHUFFLE if self.__is_playlist_queue_shuffled else 0) | (REPEAT if self.__repeat_playlist else 0)
+        if not self.__playback_stoped and not self.__playback_paused:
+            flags |= PLAYING
+        index = self.__current_track_index
+        queue = self.__current_playlist_queue or []
+        track = self.__current_track_info
+        # The position is the one of the queued track only, the playing one may have been filtered out
+        playing = track is not None and index < len(queue) and queue[index] is track
+        frame = round(track.elapsed * track.samplerate) if playing and track and track.samplerate else 0
+        return index, frame, flags
+
+    def __indexed_library(self) -> tuple[bytes, dict[int, int]]:
+        if self.__library_index is None:
+            library = self.__current_library or []
+            self.__library_index = (library_fingerprint(track.key for track in library), {id(track): position for position, track in enumerate(library)})
+        return self.__library_index
+
+    def __save_session(self):
+        if not self.__session:
+            return
+        queue = self.__current_playlist_queue or []
+        fingerprint, positions = self.__indexed_library()
+        snapshot = SessionSnapshot()
+        snapshot.queue = numpy.fromiter(map(positions.__getitem__, map(id, queue)), dtype="<u4", count=len(queue))
+        snapshot.index, snapshot.frame, snapshot.flags = self.__session_state()
+        snapshot.fingerprint = fingerprint
+        snapshot.query = self.__search_query
+        if self.__current_track_index < len(queue):
+            snapshot.key = queue[self.__current_track_index].key
+        try:
+            self.__session.save(snapshot)
+        except (OSError, struct.error):
+            pass
+
+    def __update_session(self):
+        if self.__session:
+            self.__session.update(*self.__session_state())
 
     def load_library(self, path : str):
+        self.__library_path = os.path.abspath(path)
+        self.__set_library(scan_library(self.__library_path))
+
+    def load_files(self, paths : list[str]):
+        """Loads files, CUE sheets and directories as the library, in the given order, without watching them"""
+        tracks = list[TrackInfo]()
+        for path in paths:
+            if os.path.isdir(path):
+                tracks.extend(scan_library(os.path.abspath(path)))
+            elif is_cue_sheet(path):
+                try:
+                    sheet = parse_cue_sheet(path)
+                except (OSError, ValueError):
+                    continue
+                for filepath in sheet.files:
+                    if os.path.exists(filepath) and decoder_registry.find(filepath):
+                        tracks.extend(read_tracks(filepath, sheet))
+            elif decoder_registry.find(path):
+                tracks.extend(read_tracks(os.path.abspath(path)))
+        self.__library_path = None
+        self.__set_library(tracks)
+
+    def __set_library(self, tracks : list[TrackInfo]):
         if not self.__current_library:
             self.__current_library = list[TrackInfo]()
         self.__current_library.clear()
-        for root, _, files in os.walk(path):
-            for file in files:
-                if file.endswith(".flac"):
-                    filepath = os.path.join(root, file)
-                    tags = TinyTag.get(filepath)
-                    track_info = TrackInfo()
-                    track_info.path = filepath
-                    track_info.title = tags.title
-                    track_info.album = tags.album
-                    track_info.artist = tags.artist
-                    track_info.albumartist = tags.albumartist
-                    track_info.samplerate = tags.samplerate
-                    track_info.duration = tags.duration
-                    self.__current_library.append(track_info)
-        self.__current_playlist_queue = self.__current_library.copy()
+        self.__current_library.extend(tracks)
+        self.__library_index = None
+        LoudnessStore().apply(self.__current_library)
+        ContentHashStore().apply(self.__current_library)
+        self.__search_index.clear()
+        self.__search_index.update(self.__current_library)
+        self.__current_playlist_queue = self.__build_playlist_queue()
+        self.__current_track_index = 0
+        self.__save_session()
+        for event in self.__on_playlist_changed:
+            event()
+
+    def watch_library(self):
+        """Keeps the library in sync with its directory until unwatch_library is called
+
+        Must be called from the event loop, changes are read in the watcher
+        thread and applied on the loop in batches.
+        """
+        if self.__library_watcher or not self.__library_path:
+            return
+        loop = asyncio.get_running_loop()
+        library_path = self.__library_path
+        def on_changes(changes : LibraryChanges):
+            if changes.rescan:
+                tracks = scan_library(library_path)
+                LoudnessStore().apply(tracks)
+                ContentHashStore().apply(tracks)
+                loop.call_soon_threadsafe(self.__apply_library_changes, tracks, None, True)
+                return
+            # Files whose CUE sheet changed are read again, as virtual tracks or as a whole
+            updated = {path for path in changes.updated if not is_cue_sheet(path)}
+            for path in changes.updated - updated:
+                try:
+                    updated.update(filepath for filepath in parse_cue_sheet(path).files if os.path.exists(filepath))
+                except (OSError, ValueError):
+                    pass
+            sheets = {path for path in changes.removed if is_cue_sheet(path)}
+            updated.update(track.path for track in list(self.__current_library or []) if track.cue_sheet in sheets and os.path.exists(track.path))
+            tracks = list[TrackInfo]()
+            for path in updated:
+                if not decoder_registry.find(path):
+                    continue
+                tracks.extend(read_tracks(path))
+            # Known measures are read with the tags, the stores stat every file
+            LoudnessStore().apply(tracks)
+            ContentHashStore().apply(tracks)
+            removed = set(changes.removed) - sheets
+            if changes.removed_directories:
+                prefixes = tuple(os.path.join(directory, "") for directory in changes.removed_directories)
+                removed.update(track.path for track in list(self.__current_library or []) if track.path.startswith(prefixes))
+            loop.call_soon_threadsafe(self.__apply_library_changes, tracks, removed, False)
+        self.__library_watcher = LibraryWatcher(library_path, on_changes, lambda filename: is_audio_file(filename) or is_cue_sheet(filename))
+        self.__library_watcher.start()
+
+    def unwatch_library(self):
+        if self.__library_watcher:
+            self.__library_watcher.stop()
+            self.__library_watcher = None
+
+    def __apply_library_changes(self, tracks : list[TrackInfo], removed : set[str] | None, replace : bool):
+        if self.__current_library is None:
+            self.__current_library = list[TrackInfo]()
+        if replace:
+            removed = {track.path for track in self.__current_library}
+        removed = (removed or set()) | {track.path for track in tracks}
+        if removed:
+            for track in self.__current_library:
+                if track.path in removed:
+                    self.__search_index.remove(track.key)
+            self.__current_library[:] = [track for track in self.__current_library if track.path not in removed]
+        self.__current_library.extend(tracks)
+        self.__library_index = None
+        self.__search_index.update(tracks)
+        self.__update_playlist_queue(tracks, removed)
+
+    def __update_playlist_queue(self, tracks : list[TrackInfo], removed : set[str]):
+        """Puts tracks read again in the queue in place of their previous version and queues new ones, the order of the others is kept"""
+        queue = self.__current_playlist_queue or []
+        current = queue[self.__current_track_index] if self.__current_track_index < len(queue) else None
+        query = self.__search_query
+        added = {track.key: track for track in tracks if not query or self.__search_index.matches(track, query)}
+        updated = list[TrackInfo]()
+        gone = list[TrackInfo]()
+        index = 0
+        for track in queue:
+            if track is current:
+                # A current track removed gives its place to the next one
+                index = len(updated)
+            if track.path in removed:
+                replacement = added.pop(track.key, None)
+                if not replacement:
+                    gone.append(track)
+                    continue
+                track = replacement
+            updated.append(track)
+        new = list(added.values())
+        if self.__collapse_duplicates:
+            hashes = {(track.content_hash, track.start_frame, track.end_frame) for track in updated if track.content_hash}
+            contents = {(track.content_hash, track.start_frame, track.end_frame) for track in gone if track.content_hash}
+            if contents:
+                # Duplicates hidden behind a removed track are shown in its place
+                queued = set(map(id, updated + new))
+                new.extend(track for track in self.__current_library or [] if (track.content_hash, track.start_frame, track.end_frame) in contents - hashes and id(track) not in queued)
+            collapsed = list[TrackInfo]()
+            for track in new:
+                if track.content_hash:
+                    content = (track.content_hash, track.start_frame, track.end_frame)
+                    if content in hashes:
+                        continue
+                    hashes.add(content)
+                collapsed.append(track)
+            new = collapsed
+        for track in new:
+            if self.__is_playlist_queue_shuffled:
+                # Shuffled in among the tracks still to be played
+                updated.insert(random.randint(min(index + 1, len(updated)), len(updated)), track)
+            else:
+                updated.append(track)
+        self.__current_playlist_queue = updated
+        self.__current_track_index = min(index, max(len(updated) - 1, 0))
+        self.__save_session()
         for event in self.__on_playlist_changed:
             event()
@@ -0,0 +1,121 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Innermost functions of a waiting thread, where threads have no CPU clock
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+@functools.lru_cache(maxsize=None)
+def subsystem(filename : str) -> str:
+    """Module of the player, package of a dependency, or python for the standard library"""
+    path = os.path.abspath(filename)
+    if path.startswith(ROOT + os.sep):
+        return os.path.splitext(os.path.relpath(path, ROOT))[0].replace(os.sep, ".")
+    for marker in ("site-packages", "dist-packages"):
+        if marker in path:
+            relative = path.split(marker, 1)[1].lstrip(os.sep)
+            return relative.split(os.sep)[0].removesuffix(".py")
+    return "python"
+
+def thread_cpu_time(ident : int) -> float | None:
+    """CPU time of a thread in seconds, None where threads have no CPU clock"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        return None
+
+class SamplingProfiler():
+    """Samples the stacks of every Python thread at a fixed interval.
+
+    Unlike cProfile, which only sees the thread that enabled it, the decode
+    workers, the audio callback and the user interface are profiled together.
+    Every sample is weighted by the CPU time its thread used since the last
+    one, waiting threads weigh nothing, and work done by extensions (numpy,
+    soxr, libsndfile) is billed to the Python code calling them.
+    """
+    def __init__(self, interval : float = 0.005):
+        self.__interval = interval
+        self.__stacks : Counter[tuple[str, ...]] = Counter()
+        self.__subsystems : Counter[str] = Counter()
+        self.__functions : Counter[str] = Counter()
+        self.__cpu_times : dict[int, float] = dict()
+        self.__samples : int = 0
+        self.__threads : set[int] = set()
+        self.__elapsed : float = 0.0
+        self.__stop_event = threading.Event()
+        self.__worker : threading.Thread | None = None
+
+    def start(self):
+        if self.__worker:
+            return
+        self.__stop_event.clear()
+        self.__worker = threading.Thread(target=self.__run, name="profiler", daemon=True)
+        self.__worker.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        if self.__worker:
+            self.__worker.join()
+            self.__worker = None
+
+    def __busy_time(self, ident : int, frame : Any, elapsed : float) -> float:
+        """CPU seconds the thread used since the previous sample, guessed from its innermost frame without CPU clocks"""
+        cpu_time = thread_cpu_time(ident)
+        if cpu_time is None:
+            code = frame.f_code
+            return 0.0 if (os.path.basename(code.co_filename), code.co_name) in IDLE_FUNCTIONS else elapsed
+        previous = self.__cpu_times.get(ident, cpu_time)
+        self.__cpu_times[ident] = cpu_time
+        return cpu_time - previous
+
+    def __run(self):
+        own = threading.get_ident()
+        start = last = time.perf_counter()
+        while not self.__stop_event.wait(self.__interval):
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self.__threads.add(ident)
+                self.__samples += 1
+                busy = self.__busy_time(ident, frame, now - last)
+                if busy <= 0:
+                    continue
+                code = frame.f_code
+                name = subsystem(code.co_filename)
+                self.__subsystems[name] += busy
+                self.__functions[f"{name}:{code.co_name}:{frame.f_lineno}"] += busy
+                stack = list[str]()
+                while frame:
+                    stack.append(f"{subsystem(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self.__stacks[tuple(reversed(stack))] += busy
+            last = now
+        self.__elapsed = time.perf_counter() - start
+
+    def write_stacks(self, path : str):
+        """Writes the busy stacks in the collapsed format of flamegraph.pl and speedscope, weighted in microseconds"""
+        with open(path, "w") as f:
+            for stack, busy in self.__stacks.most_common():
+                f.write(f"{';'.join(stack)} {round(busy * 1e6)}\n")
+
+    def summary(self, top : int = 15) -> str:
+        busy = sum(self.__subsystems.values())
+        lines = [f"{self.__samples} samples of {len(self.__threads)} threads over {self.__elapsed:.1f}s, {busy:.2f}s of CPU"]
+        lines.append(f"{'subsystem':<32}{'cpu (s)':>10}{'share':>8}")
+        for name, seconds in self.__subsystems.most_common():
+            lines.append(f"{name:<32}{seconds:>10.3f}{100 * seconds / max(busy, 1e-9):>7.1f}%")
+        lines.append(f"{'function':<56}{'cpu (s)':>10}")
+        for name, seconds in self.__functions.most_common(top):
+            lines.append(f"{name:<56}{seconds:>10.3f}")
+        return "\n".join(lines)
@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+from core import memory
+from core.diagnostics import diagnostics
+from core.tracing import tracer
+
+CHUNK_SIZE = memory.MEGABYTE
+DEFAULT_WINDOW = 16 * memory.MEGABYTE
+DEFAULT_PREFETCH = 32 * memory.MEGABYTE
+# Reads waiting longer are counted as stalls
+STALL_SECONDS = 0.05
+# Files whose wait is shown in the diagnostics
+RECENT_FILES = 8
+
+def advise(fd : int, offset : int, length : int, advice : str) -> bool:
+    """Gives an os.posix_fadvise hint such as "WILLNEED" or "SEQUENTIAL", False where hints aren't supported"""
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, "POSIX_FADV_" + advice))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+_recent_waits : OrderedDict[str, float] = OrderedDict()
+_recent_lock = threading.Lock()
+
+def _report_wait(name : str, seconds : float):
+    """Publishes the I/O wait of a file, only the last RECENT_FILES files are kept"""
+    with _recent_lock:
+        _recent_waits[name] = seconds
+        _recent_waits.move_to_end(name)
+        while len(_recent_waits) > RECENT_FILES:
+            expired, _ = _recent_waits.popitem(last=False)
+            diagnostics.remove("io", f"wait (ms) {expired}")
+    diagnostics.set("io", f"wait (ms) {name}", round(seconds * 1000, 1))
+
+class ReadAheadFile():
+    """Binary file whose bytes are read ahead of the reader by a worker thread, in large sequential chunks.
+
+    The worker keeps up to window bytes ahead of the read position in memory,
+    so latency spikes of a network mount or a sleeping disk are absorbed by
+    the window instead of stalling the decoder. Chunks ahead of the one being
+    read are asked to the memory governor as decode-ahead. A seek moves the
+    window, chunks left behind are dropped. Time the reader spends waiting is
+    reported per file in the io diagnostics section.
+
+    Implements read, seek and tell, enough for soundfile virtual I/O.
+    """
+    def __init__(self, filepath : str, window : int = DEFAULT_WINDOW, chunk_size : int = CHUNK_SIZE):
+        self.__file = open(filepath, "rb", buffering=0)
+        self.__name = os.path.basename(filepath)
+        self.__size = os.fstat(self.__file.fileno()).st_size
+        self.__chunk_size = chunk_size
+        self.__window_chunks = max(window // chunk_size, 1)
+        self.__chunks : dict[int, bytes] = dict()
+        self.__position : int = 0
+        self.__wait : float = 0.0
+        self.__closed : bool = False
+        self.__condition = threading.Condition()
+        advise(self.__file.fileno(), 0, 0, "SEQUENTIAL")
+        self.__consumer = memory.memory_governor.register(memory.MemoryConsumer("read-ahead", memory.DECODE_AHEAD, self.buffered, self.__release))
+        self.__worker = threading.Thread(target=self.__read_worker, name="read-ahead", daemon=True)
+        self.__worker.start()
+
+    def __enter__(self) -> "ReadAheadFile":
+        return self
+
+    def __exit__(self, *_ : Any):
+        self.close()
+
+    @property
+    def wait(self) -> float:
+        """Seconds the reader waited for bytes"""
+        return self.__wait
+
+    def buffered(self) -> int:
+        """Bytes held in memory"""
+        return sum(len(chunk) for chunk in list(self.__chunks.values()))
+
+    def __release(self, size : int) -> int:
+        """Drops the chunks furthest ahead, the one being read is kept"""
+        freed = 0
+        with self.__condition:
+            current = self.__position // self.__chunk_size
+            for index in sorted(self.__chunks, reverse=True):
+                if freed >= size or index <= current:
+                    break
+                freed += len(self.__chunks.pop(index))
+        return freed
+
+    def __next_chunk(self) -> int | None:
+        """First chunk of the window not read yet"""
+        first = self.__position // self.__chunk_size
+        last = min(-(-self.__size // self.__chunk_size), first + self.__window_chunks)
+        for index in range(first, last):
+            if index not in self.__chunks:
+                return index
+        return None
+
+    def __read_worker(self):
+        while True:
+            with self.__condition:
+                while not self.__closed and (index := self.__next_chunk()) is None:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+                ahead = index > self.__position // self.__chunk_size
+            if ahead and not memory.memory_governor.request(memory.DECODE_AHEAD, self.__chunk_size):
+                # Read once the reader catches up or memory is freed
+                with self.__condition:
+                    self.__condition.wait(0.1)
+                continue
+            start = time.perf_counter()
+            with tracer.span("read ahead", "io", chunk=index):
+                try:
+                    self.__file.seek(index * self.__chunk_size)
+                    data = self.__file.read(self.__chunk_size) or b""
+                except (OSError, ValueError):
+                    data = b""
+            diagnostics.add("io", "read (MB)", len(data) / memory.MEGABYTE)
+            diagnostics.add("io", "read time (s)", time.perf_counter() - start)
+            with self.__condition:
+                if self.__closed:
+                    return
+                self.__chunks[index] = data
+                # The chunk before the position is kept for the short seeks back of parsers
+                first = self.__position // self.__chunk_size - 1
+                for dropped in [i for i in self.__chunks if i < first or i >= first + 1 + self.__window_chunks]:
+                    del self.__chunks[dropped]
+                self.__condition.notify_all()
+                if not data:
+                    # Read error or truncated file, the reader gets an end of file
+                    return
+
+    def read(self, size : int = -1) -> bytes:
+        if size < 0:
+            size = self.__size - self.__position
+        parts = list[bytes]()
+        with self.__condition:
+            while size > 0 and self.__position < self.__size:
+                index, offset = divmod(self.__position, self.__chunk_size)
+                chunk = self.__chunks.get(index)
+                if chunk is None:
+                    if not self.__worker.is_alive():
+                        break
+                    start = time.perf_counter()
+                    self.__condition.notify_all()
+                    self.__condition.wait_for(lambda: index in self.__chunks or not self.__worker.is_alive(), timeout=1.0)
+                    waited = time.perf_counter() - start
+                    self.__wait += waited
+                    diagnostics.add("io", "wait (ms)", waited * 1000)
+                    if waited >= STALL_SECONDS:
+                        diagnostics.add("io", "stalls")
+                    continue
+                data = chunk[offset:offset + size]
+                if not data:
+                    break
+                parts.append(data)
+                size -= len(data)
+                self.__position += len(data)
+                # Moving to the next chunk makes room in the window
+                self.__condition.notify_all()
+        return b"".join(parts)
+
+    def seek(self, offset : int, whence : int = os.SEEK_SET) -> int:
+        with self.__condition:
+            if whence == os.SEEK_CUR:
+                offset += self.__position
+            elif whence == os.SEEK_END:
+                offset += self.__size
+            self.__position = max(offset, 0)
+            self.__condition.notify_all()
+        return self.__position
+
+    def tell(self) -> int:
+        return self.__position
+
+    def close(self):
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__chunks.clear()
+            self.__condition.notify_all()
+        self.__worker.join()
+        self.__file.close()
+        memory.memory_governor.unregister(self.__consumer)
+        _report_wait(self.__name, self.__wait)
+
+class Prefetcher():
+    """Warms the page cache with the files about to be played, from a worker thread.
+
+    Every file gets a WILLNEED hint, then its first bytes are read in large
+    sequential reads and dropped: opening and starting the next track then
+    hit memory instead of a slow disk or a network mount.
+    """
+    def __init__(self, size : int = DEFAULT_PREFETCH, chunk_size : int = 4 * memory.MEGABYTE, remembered : int = 64):
+        self.__size = size
+        self.__chunk_size = chunk_size
+        self.__remembered = remembered
+        self.__pending : list[str] = list()
+        self.__done : OrderedDict[tuple[str, int], None] = OrderedDict()
+        self.__condition = threading.Condition()
+        self.__worker : threading.Thread | None = None
+
+    def request(self, filepaths : list[str]):
+        """Prefetches filepaths in order, replacing the files requested before and not prefetched yet"""
+        with self.__condition:
+            self.__pending = list(dict.fromkeys(filepaths))
+            if not self.__worker:
+                self.__worker = threading.Thread(target=self.__prefetch_worker, name="prefetch", daemon=True)
+                self.__worker.start()
+            self.__condition.notify_all()
+
+    def __prefetch_worker(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: bool(self.__pending))
+                filepath = self.__pending.pop(0)
+            try:
+                self.__prefetch(filepath)
+            except OSError:
+                diagnostics.add("io", "prefetch failures")
+
+    def __prefetch(self, filepath : str):
+        stat = os.stat(filepath)
+        key = (filepath, stat.st_mtime_ns)
+        if key in self.__done:
+            return
+        size = min(stat.st_size, self.__size)
+        start = time.perf_counter()
+        with tracer.span("prefetch", "io", path=filepath, bytes=size), open(filepath, "rb", buffering=0) as f:
+            advise(f.fileno(), 0, size, "WILLNEED")
+            read = 0
+            while read < size:
+                data = f.read(min(self.__chunk_size, size - read))
+                if not data:
+                    break
+                read += len(data)
+        elapsed = time.perf_counter() - start
+        self.__done[key] = None
+        while len(self.__done) > self.__remembered:
+            self.__done.popitem(last=False)
+        diagnostics.add("io", "prefetched files")
+        diagnostics.add("io", "prefetched (MB)", read / memory.MEGABYTE)
+        if elapsed > 0:
+            diagnostics.set("io", "last prefetch (MB/s)", round(read / memory.MEGABYTE / elapsed, 1))
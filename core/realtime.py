@@ -0,0 +1,78 @@
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+from typing import Any
+from core.diagnostics import diagnostics
+
+# Policies raise_thread_priority can return
+REALTIME = "realtime"
+NICE = "nice"
+NORMAL = "normal"
+
+_libc : Any | None = None
+
+def is_available() -> bool:
+    return sys.platform.startswith("linux")
+
+def raise_thread_priority(priority : int = 5, nice : int = -10) -> str:
+    """Raises the scheduling priority of the calling thread as far as permitted
+
+    Round robin real-time scheduling is asked for first, it needs
+    CAP_SYS_NICE or an RLIMIT_RTPRIO allowing priority. A negative nice value
+    is tried next, it needs RLIMIT_NICE to allow it. The thread is left as is
+    otherwise, or when it is real-time already like some host APIs make their
+    audio threads.
+
+    Returns
+    -------
+    str
+        REALTIME, NICE or NORMAL, the policy the thread runs with
+    """
+    if not is_available():
+        return NORMAL
+    if os.sched_getscheduler(0) in (os.SCHED_FIFO, os.SCHED_RR):
+        return REALTIME
+    try:
+        # Linux applies the scheduler to the calling thread, not to the whole process
+        os.sched_setscheduler(0, os.SCHED_RR, os.sched_param(priority))
+        return REALTIME
+    except OSError:
+        pass
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+        return NICE
+    except OSError:
+        return NORMAL
+
+def memory_lock_limit() -> int | None:
+    """Bytes a process may lock in memory, None when unlimited"""
+    import resource
+    limit = resource.getrlimit(resource.RLIMIT_MEMLOCK)[0]
+    return None if limit == resource.RLIM_INFINITY else limit
+
+def _c_library() -> Any:
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+def lock_memory(array : Any) -> bool:
+    """Locks the pages of a numpy array in memory so they are never swapped out
+
+    Pages are touched and locked at once, the array then costs its full size
+    in resident memory. Returns False when the RLIMIT_MEMLOCK limit or the
+    platform doesn't allow it.
+    """
+    if not is_available() or not array.nbytes:
+        return False
+    if _c_library().mlock(ctypes.c_void_p(array.ctypes.data), ctypes.c_size_t(array.nbytes)) != 0:
+        diagnostics.add("realtime", "memory lock failures")
+        return False
+    diagnostics.add("realtime", "locked memory (MB)", array.nbytes / 2**20)
+    return True
+
+def unlock_memory(array : Any):
+    if is_available() and _c_library().munlock(ctypes.c_void_p(array.ctypes.data), ctypes.c_size_t(array.nbytes)) == 0:
+        diagnostics.add("realtime", "locked memory (MB)", -array.nbytes / 2**20)
@@ -0,0 +1,361 @@
+import asyncio
+import time
+from asyncio.tasks import Task
+from typing import Any, Callable
+from core.client import PlayerClient
+from core.device import DeviceInfo, HostApiInfo
+from core.diagnostics import diagnostics
+from core.hotplug import find_device
+from core.player import TrackInfo
+from core.waveform import WaveformCache
+
+def track_from_dict(values : dict[str, Any], track : TrackInfo | None = None) -> TrackInfo:
+    """Fills track, a new TrackInfo if None, from a dict of track_to_dict"""
+    track = track or TrackInfo()
+    track.path = values["path"]
+    track.title = values["title"]
+    track.artist = values["artist"]
+    track.album = values["album"]
+    track.duration = values["duration"]
+    track.elapsed = values["elapsed"]
+    track.samplerate = values.get("samplerate")
+    track.bitdepth = values.get("bitdepth")
+    track.filetype = values.get("filetype")
+    track.start_frame = values.get("start_frame", 0)
+    track.cue_sheet = values.get("cue_sheet")
+    return track
+
+def host_api_from_dict(values : dict[str, Any]) -> HostApiInfo:
+    devices = {device["index"]: device for device in values["devices"]}
+    return HostApiInfo({"name": values["name"], "devices": list(devices), "default_output_device": values["default_output_device"]}, devices)
+
+def merge_queue_changes(first : dict[str, Any] | None, second : dict[str, Any] | None, version : int) -> dict[str, Any] | None:
+    """Single range covering two queue changes pushed one after the other, first leading to version
+
+    None when either is unknown or they don't follow each other, the whole queue is fetched then.
+    """
+    if not first or not second or second["since"] != version:
+        return None
+    # Range of the queue between the two changes covering both, it shifts by the difference of the tracks removed and inserted around it
+    start = min(first["start"], second["start"])
+    end = max(first["start"] + first["count"], second["start"] + second["removed"])
+    return {
+        "since": first["since"],
+        "start": start,
+        "removed": end + first["removed"] - first["count"] - start,
+        "count": end + second["count"] - second["removed"] - start,
+    }
+
+class RemoteDeviceList():
+    """Output devices of the daemon, the OutputDeviceList interface the settings screen uses
+
+    get is called from worker threads, requests are made on the loop of the client.
+    """
+    def __init__(self, client : PlayerClient, loop : asyncio.AbstractEventLoop):
+        self.__client = client
+        self.__loop = loop
+        self.__host_apis : list[HostApiInfo] | None = None
+        self.__on_changed : list = list()
+
+    @property
+    def on_changed(self) -> list:
+        return self.__on_changed
+
+    @property
+    def cached(self) -> list[HostApiInfo] | None:
+        return self.__host_apis
+
+    def invalidate(self):
+        self.__host_apis = None
+
+    async def fetch(self, refresh : bool = False) -> list[HostApiInfo]:
+        self.__host_apis = [host_api_from_dict(api) for api in await self.__client.request("devices", refresh=refresh)]
+        return self.__host_apis
+
+    def get(self, refresh : bool = False, on_host_api : Callable[[HostApiInfo], None] | None = None, reinitialize : bool = False) -> list[HostApiInfo]:
+        """Must not be called from the loop of the client, it waits for the response"""
+        host_apis = self.__host_apis
+        if host_apis is None or refresh:
+            host_apis = asyncio.run_coroutine_threadsafe(self.fetch(refresh or reinitialize), self.__loop).result()
+        if on_host_api:
+            for api in host_apis:
+                on_host_api(api)
+        return host_apis
+
+class RemoteTrackInfo(TrackInfo):
+    """Track played by the daemon, its elapsed time runs on from the last status while playing"""
+    def __init__(self):
+        self.__elapsed : float = 0.0
+        self.__since : float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.__since is None:
+            return self.__elapsed
+        return min(self.__elapsed + time.monotonic() - self.__since, self.duration or 0.0)
+
+    @elapsed.setter
+    def elapsed(self, value : float):
+        self.__elapsed = value or 0.0
+
+    def run(self, playing : bool):
+        self.__since = time.monotonic() if playing else None
+
+class RemotePlayer():
+    """Player of a PlayerDaemon, driven by the status it pushes
+
+    Offers the part of the HandcraftedAudioPlayer interface the user interface
+    uses: events are fired when a pushed status differs from the previous
+    one, commands are sent as requests whose effect comes back as status.
+    The audio plays in the daemon, there is no tap to analyze; waveforms are
+    computed locally from the same files.
+    """
+    # Tracks fetched per queue request
+    QUEUE_PAGE = 1000
+
+    def __init__(self, client : PlayerClient):
+        self.__client = client
+        self.__device_list : RemoteDeviceList | None = None
+        self.__waveforms : WaveformCache = WaveformCache()
+        self.__waveform_lookahead : int = 3
+        self.__status : dict[str, Any] = dict()
+        self.__pending_status : dict[str, Any] | None = None
+        self.__status_task : Task | None = None
+        self.__requests : set[Task] = set()
+        self.__playlist : list[TrackInfo] = list()
+        self.__queue_version : int | None = None
+        self.__current_track : RemoteTrackInfo | None = None
+        self.__current_device : DeviceInfo | None = None
+        self.__on_track_changed : list = list()
+        self.__on_playlist_changed : list = list()
+        self.__on_playback_state_changed : list = list()
+        self.__on_output_device_changed : list = list()
+
+    async def attach(self):
+        """Connects to the daemon, fetches its devices and queue and subscribes to its status"""
+        await self.__client.connect()
+        self.__device_list = RemoteDeviceList(self.__client, asyncio.get_running_loop())
+        await self.__device_list.fetch()
+        self.__client.on_status.append(self.__on_status)
+        self.__client.on_device_changed.append(self.__on_device_changed)
+        # Applied like the statuses pushed after it, in order
+        self.__on_status(await self.__client.subscribe())
+        if self.__status_task:
+            await asyncio.shield(self.__status_task)
+
+    async def detach(self):
+        if self.__status_task:
+            self.__status_task.cancel()
+        await self.__client.close()
+        self.__waveforms.shutdown()
+
+    def __send(self, command : str, **args):
+        """Sends a request without waiting for its response, its effect comes back as status"""
+        task = asyncio.create_task(self.__client.request(command, **args))
+        self.__requests.add(task)
+        task.add_done_callback(self.__on_request_done)
+
+    def __on_request_done(self, task : Task):
+        self.__requests.discard(task)
+        if not task.cancelled() and task.exception():
+            diagnostics.add("client", "failed requests")
+            diagnostics.set("client", "last request error", str(task.exception()))
+
+    def __on_status(self, status : dict[str, Any]):
+        # Statuses received while one is applied are coalesced, the last one wins with the queue changes of both
+        pending = self.__pending_status
+        if pending and pending["queue_version"] == status["queue_version"]:
+            status["queue_change"] = pending.get("queue_change")
+        elif pending and pending["queue_version"] != self.__queue_version:
+            status["queue_change"] = merge_queue_changes(pending.get("queue_change"), status.get("queue_change"), pending["queue_version"])
+        self.__pending_status = status
+        if not self.__status_task:
+            self.__status_task = asyncio.create_task(self.__apply_statuses())
+
+    async def __apply_statuses(self):
+        try:
+            while self.__pending_status is not None:
+                status, self.__pending_status = self.__pending_status, None
+                await self.__apply(status)
+        finally:
+            self.__status_task = None
+
+    async def __fetch_queue(self, start : int, count : int, version : int) -> list[TrackInfo] | None:
+        """Tracks of the queue of the daemon from start, None when it changed from version meanwhile"""
+        tracks = list[TrackInfo]()
+        while len(tracks) < count:
+            try:
+                page = await self.__client.request("queue", start=start + len(tracks), count=min(self.QUEUE_PAGE, count - len(tracks)), version=version)
+            except RuntimeError:
+                # A status with the newer queue follows
+                return None
+            if not page:
+                break
+            tracks.extend(map(track_from_dict, page))
+        return tracks
+
+    async def __apply(self, status : dict[str, Any]):
+        previous, self.__status = self.__status, status
+        version = status["queue_version"]
+        if version != self.__queue_version:
+            change = status.get("queue_change")
+            if change and change["since"] == self.__queue_version:
+                # Only the range that changed is fetched
+                tracks = await self.__fetch_queue(change["start"], change["count"], version)
+                if tracks is not None:
+                    self.__playlist[change["start"]:change["start"] + change["removed"]] = tracks
+            else:
+                tracks = await self.__fetch_queue(0, status["queue_length"], version)
+                if tracks is not None:
+                    self.__playlist = tracks
+            if tracks is not None:
+                self.__queue_version = version
+                for event in self.__on_playlist_changed:
+                    event()
+        identity = (status["hostapi"], status["device"])
+        if not self.__current_device or (self.__current_device.hostapi.name, self.__current_device.name) != identity:
+            assert self.__device_list
+            host_apis = self.__device_list.cached or []
+            self.__current_device = find_device(host_apis, identity) or find_device(await self.__device_list.fetch(), identity)
+        values = status["track"]
+        track_changed = bool(values) and (not self.__current_track or previous.get("index") != status["index"] or (self.__current_track.path, self.__current_track.start_frame) != (values["path"], values.get("start_frame", 0)) or previous.get("state") == "stopped")
+        if values and (track_changed or not self.__current_track):
+            track = RemoteTrackInfo()
+            track_from_dict(values, track)
+            self.__current_track = track
+        if self.__current_track and values:
+            self.__current_track.elapsed = values["elapsed"]
+            self.__current_track.run(status["state"] == "playing")
+        if track_changed and self.__current_track and status["state"] != "stopped":
+            upcoming = self.__playlist[status["index"]:status["index"] + 1 + self.__waveform_lookahead]
+            self.__waveforms.request([queued.path for queued in upcoming])
+            for event in self.__on_track_changed:
+                event(self.__current_track, self.__current_device)
+        for event in self.__on_playback_state_changed:
+            event()
+
+    def __on_device_changed(self, message : dict[str, Any]):
+        async def notify():
+            assert self.__device_list
+            device = find_device(await self.__device_list.fetch(), (message["hostapi"], message["device"]))
+            if device:
+                for event in self.__on_output_device_changed:
+                    event(device, message["reason"], message["seconds"])
+        task = asyncio.create_task(notify())
+        self.__requests.add(task)
+        task.add_done_callback(self.__on_request_done)
+
+    @property
+    def on_track_changed(self) -> list:
+        return self.__on_track_changed
+
+    @property
+    def on_playlist_changed(self) -> list:
+        return self.__on_playlist_changed
+
+    @property
+    def on_playback_state_changed(self) -> list:
+        return self.__on_playback_state_changed
+
+    @property
+    def on_output_device_changed(self) -> list:
+        return self.__on_output_device_changed
+
+    @property
+    def device_list(self) -> RemoteDeviceList:
+        assert self.__device_list
+        return self.__device_list
+
+    def refresh_device_list(self, on_host_api = None) -> list[HostApiInfo]:
+        """Enumerates the devices of the daemon again, from a worker thread"""
+        return self.device_list.get(refresh=True, on_host_api=on_host_api)
+
+    def set_output_device(self, device : DeviceInfo):
+        self.__send("device", hostapi=device.hostapi.name, name=device.name)
+
+    @property
+    def current_device(self) -> DeviceInfo | None:
+        return self.__current_device
+
+    @property
+    def current_track(self) -> TrackInfo | None:
+        return self.__current_track
+
+    @property
+    def current_playlist(self) -> list[TrackInfo]:
+        return self.__playlist
+
+    @property
+    def current_track_index(self) -> int:
+        return self.__status.get("index", 0)
+
+    @property
+    def waveforms(self) -> WaveformCache:
+        return self.__waveforms
+
+    @property
+    def crossfade(self) -> float:
+        return self.__status.get("crossfade", 0.0)
+
+    @property
+    def is_playing(self) -> bool:
+        return self.__status.get("state") == "playing"
+
+    @property
+    def is_paused(self) -> bool:
+        return self.__status.get("state") == "paused"
+
+    @property
+    def is_stoped(self) -> bool:
+        return self.__status.get("state", "stopped") == "stopped"
+
+    @property
+    def is_repeat_enabled(self) -> bool:
+        return self.__status.get("repeat", False)
+
+    @property
+    def is_shuffle_enabled(self) -> bool:
+        return self.__status.get("shuffle", False)
+
+    @property
+    def search_query(self) -> str:
+        return self.__status.get("search_query", "")
+
+    @property
+    def collapse_duplicates(self) -> bool:
+        return self.__status.get("collapse_duplicates", False)
+
+    @collapse_duplicates.setter
+    def collapse_duplicates(self, value : bool):
+        self.__send("collapse_duplicates", value=value)
+
+    def tap(self, frames : int):
+        """The audio is heard from the daemon, nothing to analyze here"""
+        return None
+
+    async def play(self, index : int | None = None) -> None:
+        await self.__client.request("play", index=index)
+
+    async def next(self) -> None:
+        await self.__client.request("next")
+
+    async def previous(self) -> None:
+        await self.__client.request("previous")
+
+    def pause(self):
+        self.__send("pause")
+
+    def resume(self):
+        self.__send("resume")
+
+    def stop(self):
+        self.__send("stop")
+
+    def shuffle(self):
+        self.__send("shuffle")
+
+    def repeat(self):
+        self.__send("repeat")
+
+    def filter(self, query : str):
+        self.__send("filter", query=query)
@@ -0,0 +1,133 @@
+import unicodedata
+from typing import Any, Iterable
+
+SEARCHABLE_FIELDS = ("title", "artist", "album", "albumartist")
+
+def normalize(text: str | None) -> str:
+    """Returns text lowered and stripped of diacritics so that 'Björk' matches 'bjork'"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+class SearchIndex():
+    """Incremental trigram index over track tags.
+
+    Every track gets an integer id in insertion order. Queries intersect the
+    posting sets of the query trigrams (or of the word prefixes for one and two
+    letter terms), then confirm candidates with a substring test, so the cost
+    depends on the number of matching tracks rather than on the library size.
+    """
+    def __init__(self):
+        self.__next_id : int = 0
+        self.__ids : dict[str, int] = dict()
+        self.__tracks : dict[int, Any] = dict()
+        self.__texts : dict[int, str] = dict()
+        self.__trigrams : dict[str, set[int]] = dict()
+        self.__prefixes : dict[str, set[int]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.__tracks)
+
+    def __keys(self, text: str) -> tuple[set[str], set[str]]:
+        prefixes = set[str]()
+        for word in text.split():
+            prefixes.add(word[:1])
+            prefixes.add(word[:2])
+        return trigrams(text), prefixes
+
+    def add(self, track: Any) -> None:
+        """Adds or re-indexes a track, tracks are identified by their key"""
+        if track.key in self.__ids:
+            self.remove(track.key)
+        track_id = self.__next_id
+        self.__next_id += 1
+        text = "\n".join(normalize(getattr(track, field, None)) for field in SEARCHABLE_FIELDS)
+        self.__ids[track.key] = track_id
+        self.__tracks[track_id] = track
+        self.__texts[track_id] = text
+        grams, prefixes = self.__keys(text)
+        for gram in grams:
+            self.__trigrams.setdefault(gram, set()).add(track_id)
+        for prefix in prefixes:
+            self.__prefixes.setdefault(prefix, set()).add(track_id)
+
+    def update(self, tracks: Iterable[Any]) -> None:
+        for track in tracks:
+            self.add(track)
+
+    def remove(self, key: str) -> None:
+        track_id = self.__ids.pop(key, None)
+        if track_id is None:
+            return
+        del self.__tracks[track_id]
+        grams, prefixes = self.__keys(self.__texts.pop(track_id))
+        for key, postings in [(gram, self.__trigrams) for gram in grams] + [(prefix, self.__prefixes) for prefix in prefixes]:
+            ids = postings.get(key)
+            if ids is not None:
+                ids.discard(track_id)
+                if not ids:
+                    del postings[key]
+
+    def matches(self, track: Any, query: str) -> bool:
+        """True when the indexed track is one search returns for query, checked on its own text"""
+        track_id = self.__ids.get(track.key)
+        if track_id is None or self.__tracks[track_id] is not track:
+            return False
+        text = self.__texts[track_id]
+        words = text.split()
+        # Short terms match word prefixes, as __candidates looks them up
+        return all(term in text if len(term) > 2 else any(word.startswith(term) for word in words) for term in set(normalize(query).split()))
+
+    def clear(self) -> None:
+        self.__ids.clear()
+        self.__tracks.clear()
+        self.__texts.clear()
+        self.__trigrams.clear()
+        self.__prefixes.clear()
+
+    def __candidates(self, term: str) -> set[int]:
+        if len(term) < 3:
+            return self.__prefixes.get(term, set())
+        postings = [self.__trigrams.get(gram) for gram in trigrams(term)]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, query: str) -> list[Any]:
+        """Returns tracks matching every term of query, in insertion order
+
+        Parameters
+        ----------
+        query: str
+            space separated terms, each one must appear in one of the indexed tags
+
+        Returns
+        -------
+        list
+            matching tracks, all tracks if query is empty
+        """
+        terms = set(normalize(query).split())
+        if not terms:
+            return [self.__tracks[track_id] for track_id in sorted(self.__tracks)]
+        candidates = sorted((self.__candidates(term) for term in terms), key=len)
+        result = set(candidates[0])
+        for ids in candidates[1:]:
+            result &= ids
+            if not result:
+                return []
+        # Trigram postings only tell that every trigram of a term is present somewhere
+        texts = self.__texts
+        for term in terms:
+            if len(term) > 3:
+                result = {track_id for track_id in result if term in texts[track_id]}
+        return [self.__tracks[track_id] for track_id in sorted(result)]
@@ -0,0 +1,146 @@
+import hashlib
+import mmap
+import os
+import struct
+import numpy
+from typing import Iterable
+from core.cache import cache_directory
+
+MAGIC = b"HAPS"
+VERSION = 1
+
+# Magic, version, flags, current index, queue length, frame, library fingerprint, query and key sizes
+HEADER = struct.Struct("<4sHHIIq16sHH4x")
+FLAGS_OFFSET = 6
+INDEX_OFFSET = 8
+FRAME_OFFSET = 16
+# Largest query and key the header sizes can hold
+MAX_TEXT_SIZE = 0xFFFF
+
+SHUFFLE = 1
+REPEAT = 2
+PLAYING = 4
+
+def session_filepath(library_path : str) -> str:
+    """Session file of a library in the user cache directory, each library path has its own"""
+    digest = hashlib.blake2b(os.path.abspath(library_path).encode("utf-8", "surrogateescape"), digest_size=8).hexdigest()
+    return os.path.join(cache_directory("session"), f"session-{digest}.bin")
+
+def library_fingerprint(keys : Iterable[str]) -> bytes:
+    """Digest of the library track keys in order, the queue is stored as positions in it"""
+    return hashlib.blake2b("\0".join(keys).encode("utf-8", "surrogateescape"), digest_size=16).digest()
+
+class SessionSnapshot():
+    """Queue and playback state of a player
+
+    The queue is a permutation of the library held as an array of positions
+    in the library, valid as long as the library fingerprint matches.
+    """
+    def __init__(self):
+        self.queue : numpy.ndarray = numpy.empty(0, dtype="<u4")
+        self.index : int = 0
+        self.frame : int = 0
+        self.flags : int = 0
+        self.fingerprint : bytes = bytes(16)
+        self.query : str = ""
+        self.key : str = ""
+
+    @property
+    def shuffle(self) -> bool:
+        return bool(self.flags & SHUFFLE)
+
+    @property
+    def repeat(self) -> bool:
+        return bool(self.flags & REPEAT)
+
+    @property
+    def playing(self) -> bool:
+        return bool(self.flags & PLAYING)
+
+class SessionStore():
+    """Session snapshot persisted as a binary file in the user cache directory.
+
+    The file is a fixed header, the queue as a little endian uint32 array and
+    the search query and current track key. It is rewritten when the queue
+    changes; the index, frame and flags, updated while playing, are written
+    in place through a memory map. Sessions of different libraries are kept
+    in different files, see session_filepath.
+    """
+    def __init__(self, library_path : str, filepath : str | None = None):
+        self.__filepath = filepath or session_filepath(library_path)
+        self.__map : mmap.mmap | None = None
+
+    @property
+    def filepath(self) -> str:
+        return self.__filepath
+
+    def __open_map(self) -> mmap.mmap | None:
+        if self.__map is None:
+            try:
+                with open(self.__filepath, "r+b") as f:
+                    self.__map = mmap.mmap(f.fileno(), 0)
+            except (OSError, ValueError):
+                return None
+        return self.__map
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+
+    def load(self) -> SessionSnapshot | None:
+        """Reads the snapshot, None if there is none or it can't be read"""
+        data = self.__open_map()
+        if data is None or len(data) < HEADER.size:
+            return None
+        magic, version, flags, index, count, frame, fingerprint, query_size, key_size = HEADER.unpack_from(data, 0)
+        tail = HEADER.size + 4 * count
+        if magic != MAGIC or version != VERSION or len(data) < tail + query_size + key_size:
+            return None
+        snapshot = SessionSnapshot()
+        # Copied out of the map, which is closed when the file is rewritten
+        snapshot.queue = numpy.frombuffer(data, dtype="<u4", count=count, offset=HEADER.size).copy()
+        snapshot.index = index
+        snapshot.frame = frame
+        snapshot.flags = flags
+        snapshot.fingerprint = fingerprint
+        snapshot.query = data[tail:tail + query_size].decode("utf-8", "surrogateescape")
+        snapshot.key = data[tail + query_size:tail + query_size + key_size].decode("utf-8", "surrogateescape")
+        return snapshot
+
+    def save(self, snapshot : SessionSnapshot):
+        """Writes the whole snapshot, replacing the file at once
+
+        A query longer than the header can hold is truncated, such a key is
+        left out: the current track is then restored from the index.
+        """
+        query = snapshot.query.encode("utf-8", "surrogateescape")
+        if len(query) > MAX_TEXT_SIZE:
+            # Cut at a character boundary, not inside a multibyte sequence
+            end = MAX_TEXT_SIZE
+            while query[end] & 0xC0 == 0x80:
+                end -= 1
+            query = query[:end]
+        key = snapshot.key.encode("utf-8", "surrogateescape")
+        if len(key) > MAX_TEXT_SIZE:
+            key = b""
+        # Packed first, struct.error leaves the file as it was
+        header = HEADER.pack(MAGIC, VERSION, snapshot.flags, snapshot.index, len(snapshot.queue), snapshot.frame, snapshot.fingerprint, len(query), len(key))
+        # The map of the replaced file would keep writing to it
+        self.close()
+        temporary_path = self.__filepath + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(header)
+            f.write(numpy.ascontiguousarray(snapshot.queue, dtype="<u4").tobytes())
+            f.write(query)
+            f.write(key)
+        os.replace(temporary_path, self.__filepath)
+
+    def update(self, index : int, frame : int, flags : int):
+        """Writes the playback state in place, without rewriting the queue"""
+        data = self.__open_map()
+        if data is None or len(data) < HEADER.size:
+            return
+        struct.pack_into("<H", data, FLAGS_OFFSET, flags)
+        struct.pack_into("<I", data, INDEX_OFFSET, index)
+        struct.pack_into("<q", data, FRAME_OFFSET, frame)
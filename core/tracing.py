@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+class Tracer():
+    """Records spans of work as Chrome trace events, viewable in chrome://tracing or Perfetto.
+
+    Nothing is recorded until started, a disabled span costs a flag check.
+    Spans are complete events stamped with the thread they ran on, so the
+    timeline shows how the player, the decode workers and the devices
+    overlap during a track change.
+    """
+    def __init__(self):
+        self.__lock : threading.Lock = threading.Lock()
+        self.__events : list[dict[str, Any]] = list()
+        self.__threads : dict[int, str] = dict()
+        self.__enabled : bool = False
+        self.__path : str | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.__enabled
+
+    def start(self, path : str | None = None):
+        """Starts recording, events are written to path when stopped"""
+        with self.__lock:
+            self.__events.clear()
+            self.__threads.clear()
+            self.__path = path
+            self.__enabled = True
+
+    def stop(self) -> list[dict[str, Any]]:
+        """Stops recording, writes the trace if a path was given and returns its events"""
+        with self.__lock:
+            self.__enabled = False
+            events = self.__trace_events()
+        if self.__path:
+            self.write(self.__path, events)
+        return events
+
+    def __trace_events(self) -> list[dict[str, Any]]:
+        pid = os.getpid()
+        names = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for tid, name in self.__threads.items()]
+        return names + list(self.__events)
+
+    def write(self, path : str, events : list[dict[str, Any]] | None = None):
+        if events is None:
+            with self.__lock:
+                events = self.__trace_events()
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def __record(self, event : dict[str, Any]):
+        tid = threading.get_native_id()
+        event["pid"] = os.getpid()
+        event["tid"] = tid
+        with self.__lock:
+            if not self.__enabled:
+                return
+            if tid not in self.__threads:
+                self.__threads[tid] = threading.current_thread().name
+            self.__events.append(event)
+
+    @contextmanager
+    def span(self, name : str, category : str, **args : Any) -> Iterator[None]:
+        """Records the time spent in the block, args are shown with the span"""
+        if not self.__enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.__record({"name": name, "cat": category, "ph": "X", "ts": start / 1000, "dur": (end - start) / 1000, "args": args})
+
+    def instant(self, name : str, category : str, **args : Any):
+        if self.__enabled:
+            self.__record({"name": name, "cat": category, "ph": "i", "s": "t", "ts": time.perf_counter_ns() / 1000, "args": args})
+
+tracer = Tracer()
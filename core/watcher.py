@@ -0,0 +1,218 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+class LibraryChanges():
+    """Batch of filesystem changes, paths are absolute"""
+    def __init__(self):
+        self.updated : set[str] = set()
+        self.removed : set[str] = set()
+        self.removed_directories : set[str] = set()
+        self.rescan : bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.updated or self.removed or self.removed_directories or self.rescan)
+
+    def update(self, path: str):
+        self.removed.discard(path)
+        self.updated.add(path)
+
+    def remove(self, path: str):
+        self.updated.discard(path)
+        self.removed.add(path)
+
+    def remove_directory(self, path: str):
+        prefix = os.path.join(path, "")
+        self.updated = {p for p in self.updated if not p.startswith(prefix)}
+        self.removed_directories.add(path)
+
+class LibraryWatcher():
+    """Watches a library directory and reports debounced batches of changes.
+
+    Uses inotify on Linux and falls back to periodic directory snapshots
+    elsewhere or when inotify can't be initialized. Changes are accumulated
+    until the tree has been quiet for `debounce` seconds, or for at most
+    `max_latency` seconds during a long copy, then handed to `on_changes` from
+    the watcher thread.
+    """
+    def __init__(self, path: str, on_changes: Callable[[LibraryChanges], None], is_audio_file: Callable[[str], bool], debounce: float = 1.0, max_latency: float = 5.0, poll_interval: float = 10.0):
+        self.__path = os.path.abspath(path)
+        self.__on_changes = on_changes
+        self.__is_audio_file = is_audio_file
+        self.__debounce = debounce
+        self.__max_latency = max_latency
+        self.__poll_interval = poll_interval
+        self.__stop_event : threading.Event = threading.Event()
+        self.__thread : threading.Thread | None = None
+        self.__pending : LibraryChanges = LibraryChanges()
+        self.__first_event_time : float = 0.0
+        self.__last_event_time : float = 0.0
+
+    @property
+    def path(self) -> str:
+        return self.__path
+
+    def start(self):
+        if self.__thread:
+            return
+        self.__stop_event.clear()
+        inotify = _Inotify.create()
+        if inotify:
+            self.__thread = threading.Thread(target=self.__inotify_worker, args=(inotify,), daemon=True, name="library-watcher")
+        else:
+            self.__thread = threading.Thread(target=self.__polling_worker, daemon=True, name="library-watcher")
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        if self.__thread and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.__thread = None
+
+    def __add_event(self, apply: Callable[[LibraryChanges], None]):
+        now = time.monotonic()
+        if not self.__pending:
+            self.__first_event_time = now
+        self.__last_event_time = now
+        apply(self.__pending)
+
+    def __flush_if_due(self):
+        if not self.__pending:
+            return
+        now = time.monotonic()
+        if now - self.__last_event_time >= self.__debounce or now - self.__first_event_time >= self.__max_latency:
+            changes, self.__pending = self.__pending, LibraryChanges()
+            self.__on_changes(changes)
+
+    def __inotify_worker(self, inotify: "_Inotify"):
+        directories : dict[int, str] = dict()
+        def watch_tree(root: str, report: bool):
+            for current, _, files in os.walk(root):
+                wd = inotify.add_watch(current, WATCH_MASK)
+                if wd >= 0:
+                    directories[wd] = current
+                if report:
+                    # Files copied before the watch was set up are only seen by walking
+                    for file in files:
+                        if self.__is_audio_file(file):
+                            self.__add_event(lambda c, p=os.path.join(current, file): c.update(p))
+
+        try:
+            watch_tree(self.__path, report=False)
+            while not self.__stop_event.is_set():
+                timeout = self.__debounce / 4 if self.__pending else 0.5
+                readable, _, _ = select.select([inotify.fd], [], [], timeout)
+                if readable:
+                    for wd, mask, name in inotify.read_events():
+                        if mask & IN_Q_OVERFLOW:
+                            self.__add_event(lambda c: setattr(c, "rescan", True))
+                            continue
+                        directory = directories.get(wd)
+                        if directory is None:
+                            continue
+                        if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+                            if mask & IN_IGNORED:
+                                directories.pop(wd, None)
+                            continue
+                        path = os.path.join(directory, name)
+                        if mask & IN_ISDIR:
+                            if mask & (IN_CREATE | IN_MOVED_TO):
+                                watch_tree(path, report=True)
+                            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                                self.__add_event(lambda c: c.remove_directory(path))
+                        elif self.__is_audio_file(name):
+                            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                                self.__add_event(lambda c: c.update(path))
+                            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                                self.__add_event(lambda c: c.remove(path))
+                self.__flush_if_due()
+        finally:
+            inotify.close()
+
+    def __snapshot(self) -> dict[str, tuple[int, int]]:
+        snapshot : dict[str, tuple[int, int]] = dict()
+        for root, _, files in os.walk(self.__path):
+            for file in files:
+                if self.__is_audio_file(file):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def __polling_worker(self):
+        previous = self.__snapshot()
+        while not self.__stop_event.wait(self.__poll_interval):
+            current = self.__snapshot()
+            for path, identity in current.items():
+                if previous.get(path) != identity:
+                    self.__add_event(lambda c, p=path: c.update(p))
+            for path in previous.keys() - current.keys():
+                self.__add_event(lambda c, p=path: c.remove(p))
+            previous = current
+            # A snapshot already spans the whole poll interval, no need to wait for more
+            if self.__pending:
+                changes, self.__pending = self.__pending, LibraryChanges()
+                self.__on_changes(changes)
+
+class _Inotify():
+    def __init__(self, libc: ctypes.CDLL, fd: int):
+        self.__libc = libc
+        self.fd = fd
+
+    @staticmethod
+    def create() -> "_Inotify | None":
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(IN_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return _Inotify(libc, fd)
+
+    def add_watch(self, path: str, mask: int) -> int:
+        return self.__libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+    def read_events(self) -> list[tuple[int, int, str]]:
+        events = list[tuple[int, int, str]]()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset+length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
@@ -0,0 +1,183 @@
+import os
+import threading
+import numpy
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+from core.cache import cache_directory, content_identity
+from core.decoders import registry as decoder_registry
+
+WAVEFORM_COLUMNS = 512
+
+def compute_peaks(filepath : str, columns : int = WAVEFORM_COLUMNS, blocksize : int = 65536) -> numpy.ndarray:
+    """Returns the min and max sample of every column of a file in one streaming pass
+
+    Parameters
+    ----------
+    filepath: str
+        audio file path
+    columns: int
+        number of columns the track is split into
+
+    Returns
+    -------
+    numpy.ndarray
+        int8 array of shape (columns, 2) holding min and max peaks scaled to [-127, 127]
+    """
+    decoder = decoder_registry.get(filepath)
+    lows = numpy.full(columns, numpy.inf, dtype=numpy.float32)
+    highs = numpy.full(columns, -numpy.inf, dtype=numpy.float32)
+    with decoder.open(filepath) as f:
+        frames = f.frames
+        if frames <= 0:
+            return numpy.zeros((columns, 2), dtype=numpy.int8)
+        # Column c covers frames [edges[c], edges[c+1])
+        edges = (numpy.arange(columns + 1, dtype=numpy.int64) * frames) // columns
+        position = 0
+        while position < frames:
+            data = f.read(frames=min(blocksize, frames - position), dtype='float32', always_2d=True)
+            if not len(data):
+                break
+            low = data.min(axis=1)
+            high = data.max(axis=1)
+            first = int(numpy.searchsorted(edges, position, side='right')) - 1
+            last = min(int(numpy.searchsorted(edges, position + len(data) - 1, side='right')) - 1, columns - 1)
+            block_columns = numpy.arange(first, last + 1)
+            offsets = numpy.unique(numpy.clip(edges[block_columns] - position, 0, len(data) - 1))
+            block_columns = numpy.searchsorted(edges, offsets + position, side='right') - 1
+            numpy.minimum.at(lows, block_columns, numpy.minimum.reduceat(low, offsets))
+            numpy.maximum.at(highs, block_columns, numpy.maximum.reduceat(high, offsets))
+            position += len(data)
+    empty = lows > highs
+    lows[empty] = 0
+    highs[empty] = 0
+    peaks = numpy.stack([lows, highs], axis=1)
+    return numpy.round(numpy.clip(peaks, -1.0, 1.0) * 127).astype(numpy.int8)
+
+def downsample_peaks(peaks : numpy.ndarray, width : int) -> numpy.ndarray:
+    """Returns the absolute peak level in [0, 1] of width columns"""
+    if width <= 0 or not len(peaks):
+        return numpy.zeros(max(width, 0), dtype=numpy.float32)
+    levels = numpy.abs(peaks.astype(numpy.int16)).max(axis=1)
+    if width >= len(levels):
+        indexes = (numpy.arange(width) * len(levels)) // width
+        return levels[indexes].astype(numpy.float32) / 127
+    starts = (numpy.arange(width) * len(levels)) // width
+    return numpy.maximum.reduceat(levels, starts).astype(numpy.float32) / 127
+
+class WaveformCache():
+    """Waveform overviews of tracks, computed in a background pool and kept on disk.
+
+    Overviews are stored as .npy files keyed by content identity under the
+    user cache directory, so that a moved file keeps its overview, and the
+    most recently used ones are kept in memory. Files read are touched, the
+    least recently used beyond disk_entries are deleted by modification time.
+    """
+    def __init__(self, directory : str | None = None, workers : int = 2, memory_entries : int = 64, disk_entries : int = 10000):
+        self.__directory = directory
+        self.__workers = workers
+        self.__memory_entries = memory_entries
+        self.__disk_entries = disk_entries
+        # Overviews on disk, counted on the first write
+        self.__stored : int | None = None
+        self.__executor : ThreadPoolExecutor | None = None
+        self.__lock : threading.Lock = threading.Lock()
+        self.__peaks : OrderedDict[str, numpy.ndarray] = OrderedDict()
+        self.__pending : dict[str, Future] = dict()
+        self.__on_ready : list[Callable[[str, numpy.ndarray], None]] = list()
+
+    @property
+    def on_ready(self) -> list:
+        """Callbacks receiving (filepath, peaks), called from a pool thread"""
+        return self.__on_ready
+
+    def __cache_path(self, filepath : str) -> str:
+        if not self.__directory:
+            self.__directory = cache_directory("waveforms")
+        return os.path.join(self.__directory, content_identity(filepath) + ".npy")
+
+    def __remember(self, filepath : str, peaks : numpy.ndarray):
+        with self.__lock:
+            self.__peaks[filepath] = peaks
+            self.__peaks.move_to_end(filepath)
+            while len(self.__peaks) > self.__memory_entries:
+                self.__peaks.popitem(last=False)
+
+    def get(self, filepath : str) -> numpy.ndarray | None:
+        """Returns the overview of filepath if it's in memory or on disk, never decodes"""
+        with self.__lock:
+            peaks = self.__peaks.get(filepath)
+            if peaks is not None:
+                self.__peaks.move_to_end(filepath)
+                return peaks
+        try:
+            cache_path = self.__cache_path(filepath)
+            peaks = numpy.load(cache_path)
+            os.utime(cache_path)
+        except (OSError, ValueError):
+            return None
+        self.__remember(filepath, peaks)
+        return peaks
+
+    def __load_or_compute(self, filepath : str) -> numpy.ndarray:
+        peaks = self.get(filepath)
+        if peaks is None:
+            peaks = compute_peaks(filepath)
+            cache_path = self.__cache_path(filepath)
+            temporary_path = cache_path + ".tmp"
+            with open(temporary_path, "wb") as f:
+                numpy.save(f, peaks)
+            os.replace(temporary_path, cache_path)
+            self.__remember(filepath, peaks)
+            self.__evict()
+        return peaks
+
+    def __evict(self):
+        """Deletes the least recently used overviews once more than disk_entries are stored, down to nine tenths of it"""
+        with self.__lock:
+            if self.__stored is not None and self.__stored < self.__disk_entries:
+                self.__stored += 1
+                return
+            self.__stored = self.__disk_entries
+        assert self.__directory
+        entries = list[tuple[float, str]]()
+        for entry in os.scandir(self.__directory):
+            try:
+                if entry.name.endswith(".npy"):
+                    entries.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                pass
+        entries.sort()
+        excess = len(entries) - self.__disk_entries * 9 // 10 if len(entries) > self.__disk_entries else 0
+        for _, path in entries[:excess]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        with self.__lock:
+            self.__stored = len(entries) - excess
+
+    def __on_done(self, filepath : str, future : Future):
+        with self.__lock:
+            self.__pending.pop(filepath, None)
+        if future.cancelled() or future.exception():
+            return
+        for event in self.__on_ready:
+            event(filepath, future.result())
+
+    def request(self, filepaths : list[str]):
+        """Schedules the overview computation of filepaths, already known ones are skipped"""
+        for filepath in filepaths:
+            with self.__lock:
+                if filepath in self.__peaks or filepath in self.__pending:
+                    continue
+                if not self.__executor:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix="waveform")
+                future = self.__executor.submit(self.__load_or_compute, filepath)
+                self.__pending[filepath] = future
+            future.add_done_callback(lambda f, p=filepath: self.__on_done(p, f))
+
+    def shutdown(self):
+        if self.__executor:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
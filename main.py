@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 import argparse
-import sounddevice
-from ui import HandcraftedAudioPlayerApp
 
+# Heavy modules (sounddevice, numpy, textual...) are imported by the code path needing them
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument(
     '-l', '--list-devices', action='store_true',
@@ -10,6 +9,7 @@ parser.add_argument(
 )
 args, remaining = parser.parse_known_args()
 if args.list_devices:
+    import sounddevice
     print(sounddevice.query_devices())
     parser.exit(0)
 parser = argparse.ArgumentParser(
@@ -17,14 +17,259 @@ parser = argparse.ArgumentParser(
     formatter_class=argparse.RawDescriptionHelpFormatter,
     parents=[parser])
 parser.add_argument(
-    'path', metavar='PATH',
+    'path', metavar='PATH', nargs='?',
     help='audio library path')
+parser.add_argument(
+    '--analyze-loudness', action='store_true',
+    help='measure loudness of the library tracks not analyzed yet and exit')
+parser.add_argument(
+    '--find-duplicates', action='store_true',
+    help='hash the audio of the library tracks not hashed yet, list the tracks with the same audio and exit')
+parser.add_argument(
+    '--collapse-duplicates', action='store_true',
+    help='show one track of every group of tracks with the same audio, as found by --find-duplicates')
+parser.add_argument(
+    '--export', metavar='DIRECTORY',
+    help='transcode PATH, or the files given with --queue, to DIRECTORY and exit, already exported files are skipped')
+parser.add_argument(
+    '--export-format', choices=['flac', 'wav'], default='flac',
+    help='export file format')
+parser.add_argument(
+    '--export-rate', metavar='HZ', type=int, default=44100,
+    help='export sample rate')
+parser.add_argument(
+    '--export-bits', metavar='BITS', type=int, default=16,
+    help='export bit depth: 16 or 24, 32 for floating point wav')
+parser.add_argument(
+    '--play', metavar='PATH',
+    help='play a file, a CUE sheet or a directory without the user interface')
+parser.add_argument(
+    '--queue', metavar='PATH', nargs='+', default=[],
+    help='files or directories played after --play, without the user interface')
+parser.add_argument(
+    '-d', '--device', metavar='NAME', action='append', default=[],
+    help='output device used without the user interface, "api:device" or part of it, default output device otherwise. Repeat to play on several devices, the first one clocks the others')
+parser.add_argument(
+    '--crossfade', metavar='SECONDS', type=float, default=0.0,
+    help='overlap consecutive tracks, they play gapless otherwise')
+parser.add_argument(
+    '--memory-budget', metavar='MB', type=int,
+    help='memory shared by playback buffers, decode-ahead and caches, a quarter of the system memory up to 1024 MB by default')
+parser.add_argument(
+    '--no-resume', action='store_true',
+    help='start from the library order instead of restoring the queue and position of the last session')
+parser.add_argument(
+    '--read-ahead', metavar='MB', type=int, default=16,
+    help='file bytes read ahead of the decoder, absorbs the latency of network mounts and sleeping disks, 0 reads as decoded (default: %(default)s)')
+parser.add_argument(
+    '--realtime', action='store_true',
+    help='decode with a real-time or raised priority and lock the audio buffers in memory, as far as the system permits (Linux)')
+parser.add_argument(
+    '--daemon', action='store_true',
+    help='run the player without user interface, controlled through a unix socket. The user interface started while it runs attaches to it')
+parser.add_argument(
+    '--send', metavar='COMMAND', nargs='+',
+    help='send a command to the daemon: status, queue, load PATH..., play [INDEX], pause, resume, stop, next, previous, seek SECONDS, crossfade [SECONDS], shuffle, repeat, filter [QUERY], devices, device API NAME or subscribe')
+parser.add_argument(
+    '--socket', metavar='PATH',
+    help='daemon socket path')
+parser.add_argument(
+    '--trace', metavar='FILE',
+    help='record track changes, device setup and decoding as a Chrome trace event file, open it in chrome://tracing or ui.perfetto.dev')
+parser.add_argument(
+    '--profile', metavar='FILE',
+    help='sample every thread during the session, print a summary per subsystem on exit and write the stacks to FILE for flamegraph.pl or speedscope')
 args = parser.parse_args(remaining)
+if not args.path and not args.play and not args.queue and not args.daemon and not args.send:
+    from core.client import daemon_reachable
+    if not daemon_reachable(args.socket):
+        parser.error('PATH is required unless --play, --queue, --daemon or --send is given, or a daemon is running')
+
+def find_output_devices(player) -> list:
+    from core import headless
+    devices = list()
+    for name in args.device or [None]:
+        device = headless.find_output_device(player, name)
+        if not device:
+            parser.exit(1, f'Output device not found: {name}\n')
+        devices.append(device)
+    return devices
+
+def start_instrumentation():
+    """Starts the tracer and the profiler asked for, both report when the interpreter exits"""
+    import atexit
+    import sys
+    if args.trace:
+        from core.tracing import tracer
+        def write_trace():
+            events = tracer.stop()
+            print(f'{len(events)} trace events written to {args.trace}', file=sys.stderr)
+        tracer.start(args.trace)
+        atexit.register(write_trace)
+    if args.profile:
+        from core.profiling import SamplingProfiler
+        profiler = SamplingProfiler()
+        def write_profile():
+            profiler.stop()
+            profiler.write_stacks(args.profile)
+            print(profiler.summary(), file=sys.stderr)
+        profiler.start()
+        atexit.register(write_profile)
 
 if __name__ == "__main__":
+    start_instrumentation()
+    if args.analyze_loudness:
+        from core.loudness import analyze_library
+        from core.player import scan_library
+        try:
+            report = analyze_library(scan_library(args.path), on_progress=lambda report, left: print(f"\r{report} - {left} left", end="", flush=True))
+            print(f"\n{report}")
+        except KeyboardInterrupt:
+            parser.exit(1, '\nInterrupted by user, analysis will resume from here')
+        parser.exit(0)
+    if args.find_duplicates:
+        from core.duplicates import find_duplicates
+        from core.player import scan_library
+        try:
+            report = find_duplicates(scan_library(args.path), on_progress=lambda report, left: print(f"\r{report} - {left} left", end="", flush=True))
+            print(f"\n{report}")
+            for group in report.groups:
+                print()
+                for track in group:
+                    print(track.path)
+        except KeyboardInterrupt:
+            parser.exit(1, '\nInterrupted by user, hashing will resume from here')
+        parser.exit(0)
+    if args.export:
+        import os
+        from core.export import ExportSettings, export_tracks
+        from core.player import HandcraftedAudioPlayer
+        try:
+            settings = ExportSettings(args.export_format, args.export_rate, args.export_bits)
+        except ValueError as e:
+            parser.error(str(e))
+        player = HandcraftedAudioPlayer()
+        player.load_files(([args.path] if args.path else []) + args.queue)
+        # Virtual tracks of a CUE sheet are exported as their image
+        sources = list(dict.fromkeys(track.path for track in player.current_playlist or []))
+        root = os.path.abspath(args.path) if args.path and os.path.isdir(args.path) and not args.queue else None
+        try:
+            report = export_tracks(sources, args.export, settings, root=root, on_progress=lambda report, left: print(f"\r{report} - {left} left", end="", flush=True))
+            print(f"\n{report}")
+            for source, error in report.failed.items():
+                print(f"Failed: {source}: {error}")
+        except KeyboardInterrupt:
+            parser.exit(1, '\nInterrupted by user, export will resume from here')
+        parser.exit(0)
+    if args.send:
+        import asyncio
+        import json
+        import os
+        from core.client import PlayerClient
+        async def send(command : str, arguments : list[str]):
+            async with PlayerClient(args.socket) as client:
+                if command == "subscribe":
+                    client.on_status.append(lambda status: print(json.dumps(status), flush=True))
+                    print(json.dumps(await client.subscribe()), flush=True)
+                    await asyncio.Event().wait()
+                elif command == "play" and arguments:
+                    print(json.dumps(await client.request(command, index=int(arguments[0]))))
+                elif command == "seek":
+                    print(json.dumps(await client.request(command, position=float(arguments[0]))))
+                elif command == "crossfade" and arguments:
+                    print(json.dumps(await client.request(command, seconds=float(arguments[0]))))
+                elif command == "load":
+                    print(json.dumps(await client.request(command, paths=[os.path.abspath(path) for path in arguments])))
+                elif command == "filter":
+                    print(json.dumps(await client.request(command, query=" ".join(arguments))))
+                elif command == "device":
+                    print(json.dumps(await client.request(command, hostapi=arguments[0], name=" ".join(arguments[1:]))))
+                elif command == "queue" and arguments:
+                    print(json.dumps(await client.request(command, start=int(arguments[0]))))
+                else:
+                    print(json.dumps(await client.request(command)))
+        try:
+            asyncio.run(send(args.send[0], args.send[1:]))
+        except KeyboardInterrupt:
+            pass
+        except (ConnectionError, FileNotFoundError, RuntimeError) as e:
+            parser.exit(1, type(e).__name__ + ': ' + str(e) + '\n')
+        parser.exit(0)
+    if args.daemon:
+        import asyncio
+        from core import headless
+        from core.daemon import PlayerDaemon
+        from core.player import HandcraftedAudioPlayer
+        from core.session import SessionStore
+        async def serve():
+            player = HandcraftedAudioPlayer()
+            player.crossfade = args.crossfade
+            player.realtime = args.realtime
+            player.read_ahead = args.read_ahead * 2**20
+            player.collapse_duplicates = args.collapse_duplicates
+            if args.memory_budget:
+                player.memory_budget = args.memory_budget * 2**20
+            devices = find_output_devices(player)
+            player.set_output_devices(devices)
+            if args.path:
+                player.load_library(args.path)
+                player.watch_library()
+                player.session = SessionStore(args.path)
+                snapshot = None if args.no_resume else player.restore_session()
+                if snapshot and snapshot.playing:
+                    await player.play()
+            player.monitor_devices()
+            daemon = PlayerDaemon(player, args.socket)
+            print(f'Listening on {daemon.socket_path}', flush=True)
+            try:
+                await daemon.serve_forever()
+            finally:
+                player.unwatch_library()
+                player.unmonitor_devices()
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        parser.exit(0)
+    if args.play or args.queue:
+        import asyncio
+        from core import headless
+        from core.player import HandcraftedAudioPlayer
+        try:
+            player = HandcraftedAudioPlayer()
+            player.crossfade = args.crossfade
+            player.realtime = args.realtime
+            player.read_ahead = args.read_ahead * 2**20
+            player.collapse_duplicates = args.collapse_duplicates
+            if args.memory_budget:
+                player.memory_budget = args.memory_budget * 2**20
+            player.load_files(([args.play] if args.play else []) + args.queue)
+            if not player.current_playlist:
+                parser.exit(1, 'No playable file found\n')
+            asyncio.run(headless.play(player, find_output_devices(player)))
+        except KeyboardInterrupt:
+            parser.exit(1, '\nInterrupted by user')
+        parser.exit(0)
     try:
+        from core.client import PlayerClient, daemon_reachable
+        from core.remote import RemotePlayer
+        from core.session import SessionStore
+        from ui.app import HandcraftedAudioPlayerApp
+        if daemon_reachable(args.socket):
+            # Playback stays with the daemon, PATH and the playback options are its own
+            HandcraftedAudioPlayerApp(player=RemotePlayer(PlayerClient(args.socket))).run()
+            parser.exit(0)
         app = HandcraftedAudioPlayerApp()
+        app.player.crossfade = args.crossfade
+        app.player.realtime = args.realtime
+        app.player.read_ahead = args.read_ahead * 2**20
+        app.player.collapse_duplicates = args.collapse_duplicates
+        if args.memory_budget:
+            app.player.memory_budget = args.memory_budget * 2**20
         app.player.load_library(args.path)
+        app.player.session = SessionStore(args.path)
+        if not args.no_resume:
+            app.player.restore_session()
         app.run()
     except KeyboardInterrupt:
         parser.exit(1, '\nInterrupted by user')
@@ -4,11 +4,11 @@ import os
 import sounddevice
 import asyncio
 from numpy import random
-from core import OutputDevice
+from core.device import OutputDevice
 from tinytag import TinyTag
 from core.device import DeviceInfo, HostApiInfo
 from core.player import TrackInfo
-from ui import HandcraftedAudioPlayerApp
+from ui.app import HandcraftedAudioPlayerApp
 
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument(
@@ -0,0 +1,71 @@
+import numpy
+import pytest
+import soundfile
+from core.cue import CD_FRAMES_PER_SECOND, find_cue_sheet, parse_cue_sheet, parse_time
+
+SHEET = """REM GENRE Rock
+PERFORMER "The Band"
+TITLE "Album"
+FILE "album.wav" WAVE
+  TRACK 01 AUDIO
+    TITLE "One"
+    INDEX 01 00:00:00
+  TRACK 02 AUDIO
+    TITLE "Two's"
+    PERFORMER "Guest"
+    INDEX 00 00:03:70
+    INDEX 01 00:04:00
+  TRACK 03 AUDIO
+    TITLE "Three"
+    INDEX 01 00:08:37
+"""
+
+@pytest.fixture
+def album(tmp_path):
+    soundfile.write(tmp_path / "album.wav", numpy.zeros((44100 * 12, 2), dtype=numpy.int16), 44100)
+    (tmp_path / "album.cue").write_text(SHEET, encoding="utf-8")
+    return tmp_path
+
+def test_parse_time():
+    assert parse_time("00:00:00") == 0
+    assert parse_time("01:02:03") == (62 * CD_FRAMES_PER_SECOND) + 3
+    # Minutes go past an hour on long images
+    assert parse_time("75:00:00") == 75 * 60 * CD_FRAMES_PER_SECOND
+    with pytest.raises(ValueError):
+        parse_time("00:60:00")
+    with pytest.raises(ValueError):
+        parse_time("00:00:75")
+
+def test_tracks_and_tags(album):
+    sheet = parse_cue_sheet(str(album / "album.cue"))
+    assert (sheet.title, sheet.performer) == ("Album", "The Band")
+    assert sheet.files == [str(album / "album.wav")]
+    assert [(track.number, track.title, track.performer) for track in sheet.tracks] == [(1, "One", None), (2, "Two's", "Guest"), (3, "Three", None)]
+
+def test_tracks_are_contiguous_with_pregaps_played_before(album):
+    sheet = parse_cue_sheet(str(album / "album.cue"))
+    one, two, three = sheet.tracks
+    assert two.start_frame(44100) == 4 * 44100
+    assert three.start_frame(44100) == (8 * 75 + 37) * 44100 // 75
+    assert sheet.end_frame(one, 44100) == two.start_frame(44100)
+    assert sheet.end_frame(two, 44100) == three.start_frame(44100)
+    assert sheet.end_frame(three, 44100) is None
+
+def test_converted_image_is_found_by_name(album):
+    soundfile.write(album / "album.flac", numpy.zeros((44100, 2), dtype=numpy.int16), 44100)
+    (album / "album.wav").unlink()
+    sheet = parse_cue_sheet(str(album / "album.cue"))
+    assert sheet.files == [str(album / "album.flac")]
+    assert find_cue_sheet(str(album / "album.flac")).path == str(album / "album.cue")
+
+def test_data_tracks_are_skipped_and_legacy_encoding_read(tmp_path):
+    sheet = 'TITLE "Caf\xe9"\r\nFILE "disc.bin" BINARY\r\n  TRACK 01 MODE1/2352\r\n    INDEX 01 00:00:00\r\nFILE "disc.wav" WAVE\r\n  TRACK 02 AUDIO\r\n    INDEX 01 00:00:00\r\n'
+    (tmp_path / "disc.cue").write_bytes(sheet.encode("cp1252"))
+    parsed = parse_cue_sheet(str(tmp_path / "disc.cue"))
+    assert parsed.title == "Café"
+    assert [track.number for track in parsed.tracks] == [2]
+
+def test_track_before_file_is_malformed(tmp_path):
+    (tmp_path / "bad.cue").write_text("TRACK 01 AUDIO\n  INDEX 01 00:00:00\n")
+    with pytest.raises(ValueError):
+        parse_cue_sheet(str(tmp_path / "bad.cue"))
@@ -0,0 +1,47 @@
+import shutil
+import subprocess
+import numpy
+import pytest
+import soundfile
+from core.duplicates import duplicate_groups, pcm_md5, streaminfo_md5
+
+def write_noise(path, subtype, samplerate=44100, channels=2, seconds=1.5, seed=0):
+    noise = numpy.random.default_rng(seed).uniform(-0.5, 0.5, (int(samplerate * seconds), channels))
+    soundfile.write(path, noise, samplerate, subtype=subtype)
+    return str(path)
+
+@pytest.mark.parametrize("subtype", ["PCM_S8", "PCM_16", "PCM_24"])
+def test_pcm_md5_of_a_rip_matches_the_streaminfo_md5_of_its_flac_copy(tmp_path, subtype):
+    wav = write_noise(tmp_path / "rip.wav", "PCM_U8" if subtype == "PCM_S8" else subtype)
+    flac = str(tmp_path / "rip.flac")
+    data, samplerate = soundfile.read(wav, dtype="int32")
+    # libFLAC computes the STREAMINFO MD5 of the samples it encodes
+    soundfile.write(flac, data, samplerate, subtype=subtype)
+    expected = streaminfo_md5(flac)
+    assert expected
+    assert pcm_md5(wav) == expected
+    assert pcm_md5(flac) == expected
+
+@pytest.mark.skipif(not shutil.which("flac"), reason="the flac command line encoder is not installed")
+@pytest.mark.parametrize("subtype", ["PCM_16", "PCM_24"])
+def test_pcm_md5_matches_the_md5_the_flac_encoder_verifies(tmp_path, subtype):
+    wav = write_noise(tmp_path / "rip.wav", subtype, channels=1)
+    subprocess.run(["flac", "--verify", "--silent", "-o", str(tmp_path / "rip.flac"), wav], check=True)
+    assert pcm_md5(wav) == streaminfo_md5(str(tmp_path / "rip.flac"))
+
+def test_streaminfo_md5_is_read_past_an_id3v2_tag(tmp_path):
+    flac = write_noise(tmp_path / "plain.flac", "PCM_16")
+    size = 300
+    tag = b"ID3\x04\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + bytes(size)
+    (tmp_path / "tagged.flac").write_bytes(tag + (tmp_path / "plain.flac").read_bytes())
+    assert streaminfo_md5(str(tmp_path / "tagged.flac")) == streaminfo_md5(flac)
+
+def test_streaminfo_md5_of_other_formats_is_none(tmp_path):
+    assert streaminfo_md5(write_noise(tmp_path / "rip.wav", "PCM_16")) is None
+
+def test_virtual_tracks_are_duplicates_of_the_same_part_only():
+    class Track():
+        def __init__(self, content_hash, start_frame=0, end_frame=None):
+            self.content_hash, self.start_frame, self.end_frame = content_hash, start_frame, end_frame
+    first, copy, part, other = Track("a"), Track("a"), Track("a", 0, 100), Track("b")
+    assert duplicate_groups([first, part, other, copy]) == [[first, copy]]
@@ -0,0 +1,42 @@
+import math
+import numpy
+import pytest
+import soundfile
+from core.loudness import LoudnessStore, measure
+
+def write_sine(path, level, samplerate=48000, channels=2, seconds=5.0, frequency=1000.0):
+    t = numpy.arange(int(samplerate * seconds)) / samplerate
+    tone = 10 ** (level / 20) * numpy.sin(2 * numpy.pi * frequency * t)
+    soundfile.write(path, numpy.repeat(tone[:, None], channels, axis=1).astype(numpy.float32), samplerate, subtype="FLOAT")
+    return str(path)
+
+@pytest.mark.parametrize("samplerate", [44100, 48000])
+def test_stereo_sine_at_minus_20_dbfs_measures_minus_20_lufs(tmp_path, samplerate):
+    result = measure(write_sine(tmp_path / "sine.wav", -20.0, samplerate=samplerate))
+    assert result["integrated"] == pytest.approx(-20.0, abs=0.1)
+    assert result["true_peak"] == pytest.approx(-20.0, abs=0.1)
+    assert result["replaygain"] == pytest.approx(2.0, abs=0.1)
+
+def test_mono_sine_is_3_db_below_stereo(tmp_path):
+    # BS.1770 sums the channel powers, a single channel holds half of it
+    result = measure(write_sine(tmp_path / "sine.wav", -20.0, channels=1))
+    assert result["integrated"] == pytest.approx(-23.01, abs=0.1)
+
+def test_silence_is_gated_out(tmp_path):
+    path = tmp_path / "silence.wav"
+    soundfile.write(path, numpy.zeros((48000 * 2, 2), dtype=numpy.float32), 48000, subtype="FLOAT")
+    result = measure(str(path))
+    assert result["integrated"] == -math.inf
+    assert result["replaygain"] == 0.0
+
+def test_store_applies_known_results(tmp_path):
+    path = write_sine(tmp_path / "sine.wav", -20.0, seconds=1.0)
+    store = LoudnessStore(str(tmp_path / "loudness.json"))
+    store.set(path, {"integrated": -20.0, "true_peak": -20.0, "replaygain": 2.0})
+    store.save()
+    class Track():
+        loudness = None
+    track = Track()
+    track.path = path
+    LoudnessStore(str(tmp_path / "loudness.json")).apply([track])
+    assert track.loudness == -20.0
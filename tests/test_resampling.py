@@ -0,0 +1,46 @@
+import time
+import numpy
+import pytest
+import soundfile
+from core.decoders import decode_blocks
+
+def write_silence(path, samplerate, frames):
+    soundfile.write(path, numpy.zeros((frames, 2), dtype=numpy.int16), samplerate)
+    return str(path)
+
+@pytest.mark.parametrize("source_rate, output_rate, frames", [
+    (192000, 48000, 192000 * 3 + 7),
+    (44100, 48000, 44100 * 2 + 1),
+    (48000, 44100, 48000 * 2 + 13),
+    (96000, 44100, 96000 + 5),
+])
+@pytest.mark.parametrize("blocksize", [None, 4096])
+def test_resampled_length_is_the_source_length_at_the_output_rate(tmp_path, source_rate, output_rate, frames, blocksize):
+    path = write_silence(tmp_path / "track.flac", source_rate, frames)
+    blocks = list(decode_blocks(path, samplerate=output_rate, blocksize=blocksize))
+    assert abs(sum(len(block) for block in blocks) - frames * output_rate / source_rate) < 1
+    assert all(block.shape[1] == 2 for block in blocks)
+
+def test_unresampled_length_is_the_source_length(tmp_path):
+    path = write_silence(tmp_path / "track.flac", 44100, 44100 + 3)
+    assert sum(len(block) for block in decode_blocks(path, blocksize=1000)) == 44100 + 3
+
+def output_device():
+    try:
+        from core.device import OutputDeviceList
+        return next(device for api in OutputDeviceList().get() for device in api.devices if device.is_default_output_device)
+    except (OSError, StopIteration):
+        return None
+
+@pytest.mark.skipif(output_device() is None, reason="PortAudio or an output device is not available")
+def test_decode_stream_stops_at_the_expected_frames(tmp_path):
+    from core.device import DecodeStream, OutputDeviceConfiguration
+    path = write_silence(tmp_path / "track.flac", 192000, 192000 * 3 + 7)
+    configuration = OutputDeviceConfiguration(path, output_device())
+    stream = DecodeStream(configuration)
+    stream.start()
+    deadline = time.monotonic() + 10
+    while not stream.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stream.stop()
+    assert stream.frames == int((192000 * 3 + 7) * configuration.samplerate / 192000)
@@ -0,0 +1,61 @@
+import numpy
+from core.session import MAX_TEXT_SIZE, PLAYING, REPEAT, SHUFFLE, SessionSnapshot, SessionStore, library_fingerprint, session_filepath
+
+def snapshot_of(count=5, query="", key="track"):
+    snapshot = SessionSnapshot()
+    snapshot.queue = numpy.arange(count, dtype="<u4")[::-1].copy()
+    snapshot.index = 2
+    snapshot.frame = 123456789012
+    snapshot.flags = SHUFFLE | PLAYING
+    snapshot.fingerprint = library_fingerprint(f"/music/{n}.flac" for n in range(count))
+    snapshot.query = query
+    snapshot.key = key
+    return snapshot
+
+def test_round_trip(tmp_path):
+    store = SessionStore(str(tmp_path), str(tmp_path / "session.bin"))
+    saved = snapshot_of(query="björk", key="/music/2.flac#0")
+    store.save(saved)
+    loaded = SessionStore(str(tmp_path), str(tmp_path / "session.bin")).load()
+    assert loaded is not None
+    assert loaded.queue.tolist() == saved.queue.tolist()
+    assert (loaded.index, loaded.frame, loaded.flags) == (saved.index, saved.frame, saved.flags)
+    assert loaded.fingerprint == saved.fingerprint
+    assert (loaded.query, loaded.key) == ("björk", "/music/2.flac#0")
+    assert loaded.shuffle and loaded.playing and not loaded.repeat
+
+def test_update_writes_state_in_place(tmp_path):
+    store = SessionStore(str(tmp_path), str(tmp_path / "session.bin"))
+    store.save(snapshot_of())
+    store.update(4, 48000, REPEAT)
+    store.close()
+    loaded = SessionStore(str(tmp_path), str(tmp_path / "session.bin")).load()
+    assert (loaded.index, loaded.frame, loaded.flags) == (4, 48000, REPEAT)
+    assert loaded.queue.tolist() == [4, 3, 2, 1, 0]
+
+def test_oversized_query_is_truncated_at_a_character_boundary(tmp_path):
+    store = SessionStore(str(tmp_path), str(tmp_path / "session.bin"))
+    # Two byte characters, the limit falls inside one of them
+    store.save(snapshot_of(query="a" + "é" * MAX_TEXT_SIZE))
+    loaded = store.load()
+    assert loaded is not None
+    encoded = loaded.query.encode("utf-8")
+    assert len(encoded) <= MAX_TEXT_SIZE
+    assert loaded.query == ("a" + "é" * MAX_TEXT_SIZE)[:len(loaded.query)]
+    assert len(encoded) > MAX_TEXT_SIZE - 2
+
+def test_oversized_key_is_left_out(tmp_path):
+    store = SessionStore(str(tmp_path), str(tmp_path / "session.bin"))
+    store.save(snapshot_of(query="jazz", key="k" * (MAX_TEXT_SIZE + 1)))
+    loaded = store.load()
+    assert (loaded.query, loaded.key) == ("jazz", "")
+
+def test_missing_or_corrupt_file_loads_nothing(tmp_path):
+    assert SessionStore(str(tmp_path), str(tmp_path / "none.bin")).load() is None
+    (tmp_path / "bad.bin").write_bytes(b"HAPS" + bytes(60))
+    assert SessionStore(str(tmp_path), str(tmp_path / "bad.bin")).load() is None
+
+def test_each_library_has_its_own_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert session_filepath("/music/a") != session_filepath("/music/b")
+    assert session_filepath("/music/a") == session_filepath("/music/a/")
@@ -2,9 +2,13 @@ import time
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical
 from textual.coordinate import Coordinate
-from textual.widgets import DataTable, Footer, Header
+from textual.timer import Timer
+from textual.widgets import DataTable, Footer, Header, Input
+from core.device import DeviceInfo
 from core.player import HandcraftedAudioPlayer
-from ui.controls import CurrentTrackWidget
+from core.remote import RemotePlayer
+from ui.controls.currenttrackcontrols import AudioVisualizer, CurrentTrackWidget
+from ui.scheduler import RefreshScheduler
 from ui.settings import SettingsScreen
 
 
@@ -14,6 +18,10 @@ class HandcraftedAudioPlayerApp(App):
     }
     DEFAULT_CSS = """
 
+    #search_input {
+        dock: top;
+    }
+
     #current_playlist_data_table {
         height: 100%;
     }
@@ -28,12 +36,20 @@ class HandcraftedAudioPlayerApp(App):
     BINDINGS = [
         ("q", "quit", "Quit"),
         ("ctrl+s", "settings", "Settings"),
+        ("ctrl+f", "search", "Search"),
+        ("escape", "clear_search", "Clear search"),
+        ("ctrl+l", "toggle_visualizer", "Levels"),
+        ("ctrl+d", "toggle_duplicates", "Duplicates"),
     ]
 
-    def __init__(self, *args, **kwargs):
-        self.__player = HandcraftedAudioPlayer()
+    def __init__(self, *args, player : HandcraftedAudioPlayer | RemotePlayer | None = None, **kwargs):
+        """Plays with its own player, or is a thin client of a daemon when given a RemotePlayer"""
+        self.__player = player or HandcraftedAudioPlayer()
         self.__current_playlist_data_table: DataTable = DataTable(zebra_stripes=True, id="current_playlist_data_table")
         self.__current_playlist_data_table.cursor_type = "row" 
+        self.__search_input : Input = Input(placeholder="Search title, artist, album...", id="search_input")
+        self.__search_timer : Timer | None = None
+        self.__refresh_scheduler : RefreshScheduler = RefreshScheduler(self)
         self.__current_track_controls = CurrentTrackWidget(id="current_track_controls")
         self.__previous_track_index : int = 0
         return super().__init__(*args, **kwargs)
@@ -41,20 +57,57 @@ class HandcraftedAudioPlayerApp(App):
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
         yield Vertical(
+            self.__search_input,
             self.__current_playlist_data_table,
             self.__current_track_controls,
         )
         yield Footer()
 
     @property
-    def player(self) -> HandcraftedAudioPlayer:
+    def player(self) -> HandcraftedAudioPlayer | RemotePlayer:
         return self.__player
+
+    @property
+    def refresh_scheduler(self) -> RefreshScheduler:
+        return self.__refresh_scheduler
+
+    def on_app_blur(self) -> None:
+        self.__refresh_scheduler.set_background(True)
+
+    def on_app_focus(self) -> None:
+        self.__refresh_scheduler.set_background(False)
     
     def action_settings(self):
         if len(self.screen_stack) > 1:
             self.pop_screen()
         self.push_screen(SettingsScreen(id="settings"))
 
+    def action_toggle_visualizer(self):
+        self.query_one(AudioVisualizer).toggle()
+
+    def action_toggle_duplicates(self):
+        self.__player.collapse_duplicates = not self.__player.collapse_duplicates
+
+    def action_search(self):
+        self.__search_input.focus()
+
+    def action_clear_search(self):
+        self.__search_input.value = ""
+        self.__current_playlist_data_table.focus()
+
+    def on_input_changed(self, event : Input.Changed) -> None:
+        if event.input.id != "search_input":
+            return
+        # Coalesces keystrokes so that the table is filled once per typing pause
+        if self.__search_timer:
+            self.__search_timer.stop()
+        self.__search_timer = self.set_timer(0.15, lambda: self.__player.filter(event.value))
+
+    def on_input_submitted(self, event : Input.Submitted) -> None:
+        if event.input.id == "search_input":
+            self.__player.filter(event.value)
+            self.__current_playlist_data_table.focus()
+
     async def on_data_table_row_selected(self, selected_row : DataTable.RowSelected) -> None:
         if not self.__player.current_device:
             self.action_settings()
@@ -67,6 +120,9 @@ class HandcraftedAudioPlayerApp(App):
         self.__current_playlist_data_table._highlight_row(self.__player.current_track_index)
         self.__previous_track_index = self.__player.current_track_index
 
+    def __on_output_device_changed(self, device : DeviceInfo, reason : str, seconds : float):
+        self.notify(f"Playing on {device.name} ({reason} in {seconds * 1000:.0f} ms)", severity="warning" if reason == "failover" else "information")
+
     def __on_playlist_changed(self, *_):
         self.__current_playlist_data_table.clear()
         self.__fill_playlist_widget()
@@ -84,8 +140,27 @@ class HandcraftedAudioPlayerApp(App):
                 index += 1
             self.__current_playlist_data_table._highlight_row(self.__player.current_track_index)
 
-    def on_mount(self) -> None:
+    async def on_mount(self) -> None:
+        if isinstance(self.__player, RemotePlayer):
+            await self.__player.attach()
         self.__player.on_track_changed.append(self.__on_track_changed)
         self.__player.on_playlist_changed.append(self.__on_playlist_changed)
+        self.__player.on_track_changed.append(self.__refresh_scheduler.wake)
+        self.__player.on_playback_state_changed.append(self.__refresh_scheduler.wake)
         self.__current_playlist_data_table.add_columns(" ", "Title", "Artist", "Duration")
         self.__fill_playlist_widget()
+        # A restored session may have been filtered
+        self.__search_input.value = self.__player.search_query
+        self.__player.on_output_device_changed.append(self.__on_output_device_changed)
+        if isinstance(self.__player, HandcraftedAudioPlayer):
+            # A daemon watches its library and devices itself
+            self.__player.watch_library()
+            self.__player.monitor_devices()
+
+    async def on_unmount(self) -> None:
+        if isinstance(self.__player, RemotePlayer):
+            await self.__player.detach()
+            return
+        self.__player.unwatch_library()
+        self.__player.unmonitor_devices()
+        self.__player.waveforms.shutdown()
@@ -1 +0,0 @@
-from .currenttrackcontrols import *
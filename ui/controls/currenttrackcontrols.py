@@ -1,11 +1,17 @@
 import asyncio
 import time
+import numpy
+from rich.console import Console, ConsoleOptions, RenderResult
 from rich.progress import BarColumn, Progress, Task, TextColumn
+from rich.segment import Segment
+from rich.style import StyleType
 from rich.text import Text
 from textual.app import ComposeResult
-from textual.events import Timer
+from textual.timer import Timer
 from textual.widgets import Label, Static, Button
+from core.analyzer import AnalyzerSnapshot, SpectrumAnalyzer
 from core.player import DeviceInfo, TrackInfo
+from core.waveform import downsample_peaks
 
 
 class TrackDetails(Static):
@@ -158,6 +164,42 @@ class TrackTotalTimeColumn(TextColumn):
             t = time.gmtime(task.total)
             return Text(time.strftime("%M:%S", t))
 
+class WaveformBar():
+    LEVELS = " ▁▂▃▄▅▆▇█"
+
+    def __init__(self, levels : numpy.ndarray, completed : float, total : float | None, style : StyleType, complete_style : StyleType):
+        self.__levels = levels
+        self.__completed = completed
+        self.__total = total
+        self.__style = style
+        self.__complete_style = complete_style
+
+    def __rich_console__(self, console: Console, options: ConsoleOptions) -> RenderResult:
+        width = len(self.__levels)
+        played = int(width * self.__completed / self.__total) if self.__total else 0
+        indexes = numpy.minimum((self.__levels * (len(self.LEVELS) - 1)).round().astype(int), len(self.LEVELS) - 1)
+        bars = "".join(self.LEVELS[i] for i in indexes)
+        yield Segment(bars[:played], console.get_style(self.__complete_style))
+        yield Segment(bars[played:], console.get_style(self.__style))
+
+class WaveformBarColumn(BarColumn):
+    """Bar column drawing the waveform overview of the track, or a plain bar until it's known"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__peaks : numpy.ndarray | None = None
+        self.__levels : numpy.ndarray | None = None
+
+    def set_peaks(self, peaks : numpy.ndarray | None):
+        self.__peaks = peaks
+        self.__levels = None
+
+    def render(self, task: Task):
+        if self.__peaks is None:
+            return super().render(task)
+        width = self.bar_width or 40
+        if self.__levels is None or len(self.__levels) != width:
+            self.__levels = downsample_peaks(self.__peaks, width)
+        return WaveformBar(self.__levels, task.completed, task.total, self.style, self.finished_style if task.finished else self.complete_style)
 
 class TrackProgressBar(Static):
     DEFAULT_CSS = """
@@ -171,31 +213,143 @@ class TrackProgressBar(Static):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.__elapsed_column = TrackElapsedTimeColumn()
-        self.__bar = BarColumn()
+        self.__bar = WaveformBarColumn()
         self.__total_column = TrackTotalTimeColumn()
         self.__progress_bar = Progress(self.__elapsed_column, self.__bar, self.__total_column)
         self.__task_id = self.__progress_bar.add_task("dummy")
         self.app.player.on_track_changed.append(self.__on_track_changed)
-        self.__current_track_timer : Timer | None = None
+        self.app.player.waveforms.on_ready.append(self.__on_waveform_ready)
+        self.__current_track : TrackInfo | None = None
+        self.__displayed : tuple | None = None
+
+    def on_mount(self) -> None:
+        self.app.refresh_scheduler.register(self.__update_progress_bar)
+
+    def on_unmount(self) -> None:
+        self.app.refresh_scheduler.unregister(self.__update_progress_bar)
+
+    def __on_waveform_ready(self, filepath : str, peaks : numpy.ndarray):
+        # Called from a waveform pool thread
+        self.app.call_from_thread(self.__set_waveform, filepath, peaks)
+
+    def __set_waveform(self, filepath : str, peaks : numpy.ndarray):
+        if self.__current_track and self.__current_track.path == filepath and not self.__current_track.cue_sheet:
+            self.__bar.set_peaks(peaks)
+            self.refresh()
 
     def __on_track_changed(self, current_track : TrackInfo, *_):
         self.__current_track = current_track
-        if self.__current_track_timer:
-            self.__current_track_timer.stop()
+        # Overviews cover whole files, a virtual track of a CUE sheet gets a plain bar
+        self.__bar.set_peaks(None if current_track.cue_sheet else self.app.player.waveforms.get(current_track.path))
         self.__progress_bar.update(self.__task_id, description="play", total=self.__current_track.duration, completed=0)
-        self.__current_track_timer = self.set_interval(1/60, self.__update_progress_bar, pause=True)
-        self.__current_track_timer.resume()
-        self.refresh(repaint=True)
-
-    def __update_progress_bar(self):
+        self.__displayed = None
+        self.refresh()
+
+    def __update_progress_bar(self) -> bool:
+        if not self.__current_track:
+            return False
+        # Elapsed time is displayed with a one second resolution
+        displayed = (int(self.__current_track.elapsed), self.__current_track.duration, self.size.width)
+        if displayed == self.__displayed:
+            return False
+        self.__displayed = displayed
         self.__progress_bar.update(task_id=self.__task_id, description="elapsed", total=self.__current_track.duration, completed=self.__current_track.elapsed)
-        self.refresh(repaint=True)
+        self.refresh()
+        return True
 
     def render(self):
         return self.__progress_bar
     
 
 
+class AudioVisualizer(Static):
+    """Spectrum and level meters of the audio heard, hidden until toggled
+
+    The analyzer and the redraw timer only run while the widget is shown and
+    a track plays, redraws happen when the analyzer published a new snapshot.
+    """
+    DEFAULT_CSS = """
+    AudioVisualizer {
+        width: 100%;
+        height: 6;
+        display: none;
+    }
+
+    AudioVisualizer.shown {
+        display: block;
+    }
+    """
+    BARS = " ▁▂▃▄▅▆▇█"
+    SPECTRUM_ROWS = 4
+    RANGE_DB = 72.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.__analyzer = SpectrumAnalyzer(self.app.player.tap)
+        self.__timer : Timer | None = None
+        self.__sequence : int = -1
+
+    @property
+    def shown(self) -> bool:
+        return self.has_class("shown")
+
+    def toggle(self):
+        self.toggle_class("shown")
+        self.__update_state()
+
+    def on_mount(self) -> None:
+        self.app.player.on_playback_state_changed.append(self.__update_state)
+
+    def on_unmount(self) -> None:
+        self.__analyzer.stop()
+
+    def __update_state(self):
+        player = self.app.player
+        active = self.shown and not player.is_stoped and not player.is_paused
+        if active and not self.__timer:
+            self.__analyzer.start()
+            self.__timer = self.set_interval(1 / 15, self.__update)
+        elif not active and self.__timer:
+            self.__analyzer.stop()
+            self.__timer.stop()
+            self.__timer = None
+            self.refresh()
+
+    def __update(self):
+        snapshot = self.__analyzer.snapshot
+        if snapshot and snapshot.sequence != self.__sequence:
+            self.__sequence = snapshot.sequence
+            self.refresh()
+
+    def __level(self, db : float) -> float:
+        return min(max((db + self.RANGE_DB) / self.RANGE_DB, 0.0), 1.0)
+
+    def render(self):
+        snapshot : AnalyzerSnapshot | None = self.__analyzer.snapshot
+        width = max(self.size.width, 1)
+        text = Text()
+        if not snapshot or not self.__timer:
+            return text
+        # Spectrum, each band stretched over the width, several rows of eighths of a cell
+        columns = numpy.minimum(numpy.arange(width) * len(snapshot.bands) // width, len(snapshot.bands) - 1)
+        heights = numpy.clip((snapshot.bands[columns] + self.RANGE_DB) / self.RANGE_DB, 0.0, 1.0) * self.SPECTRUM_ROWS * 8
+        for row in reversed(range(self.SPECTRUM_ROWS)):
+            cells = numpy.clip(heights - row * 8, 0, 8).astype(int)
+            text.append("".join(self.BARS[cell] for cell in cells) + "\n", style="green")
+        # One meter per channel, RMS filled and peak marked
+        label_width = 11
+        bar_width = max(width - label_width, 1)
+        for channel, (peak, rms) in enumerate(zip(snapshot.peak[:2], snapshot.rms[:2])):
+            filled = int(self.__level(rms) * bar_width)
+            marker = min(int(self.__level(peak) * bar_width), bar_width - 1)
+            bar = ["█" if i < filled else " " for i in range(bar_width)]
+            bar[marker] = "▌"
+            text.append(f"{'LR'[channel]} {peak:6.1f}dB ", style="grey50")
+            text.append("".join(bar), style="red" if peak > -1.0 else "yellow")
+            if channel == 0:
+                text.append("\n")
+        return text
+
 class CurrentTrackWidget(Static):
     DEFAULT_CSS = """
     TrackInfo {
@@ -249,5 +403,6 @@ class CurrentTrackWidget(Static):
 
     def compose(self) -> ComposeResult:
         yield TrackDetails()
+        yield AudioVisualizer()
         yield TrackProgressBar()
         yield TrackControls()
@@ -0,0 +1,78 @@
+import time
+from typing import Callable
+from textual.app import App
+from textual.timer import Timer
+from core.diagnostics import diagnostics
+
+class RefreshScheduler():
+    """Drives the periodic updates of the widgets showing playback progress.
+
+    Registered updaters return True when they actually redrew something. They
+    are called from a single timer whose rate follows the playback state: no
+    timer at all when paused or stopped, a slow one when the terminal doesn't
+    have focus. Player events wake the scheduler, several events received in
+    the same loop iteration lead to a single update.
+    """
+    PLAYING_INTERVAL = 1/2
+    BACKGROUND_INTERVAL = 2.0
+
+    def __init__(self, app : App):
+        self.__app = app
+        self.__updaters : list[Callable[[], bool]] = list()
+        self.__timer : Timer | None = None
+        self.__interval : float | None = None
+        self.__background : bool = False
+        self.__update_scheduled : bool = False
+        self.__last_thread_time : float = time.thread_time()
+        self.__last_wall_time : float = time.perf_counter()
+
+    def register(self, updater : Callable[[], bool]):
+        self.__updaters.append(updater)
+
+    def unregister(self, updater : Callable[[], bool]):
+        if updater in self.__updaters:
+            self.__updaters.remove(updater)
+
+    def set_background(self, background : bool):
+        self.__background = background
+        self.wake()
+
+    def wake(self, *_):
+        """Schedules an update and adapts the timer rate to the current playback state"""
+        player = self.__app.player
+        if player.is_stoped or player.is_paused:
+            interval = None
+        elif self.__background:
+            interval = self.BACKGROUND_INTERVAL
+        else:
+            interval = self.PLAYING_INTERVAL
+        if interval != self.__interval:
+            if self.__timer:
+                self.__timer.stop()
+                self.__timer = None
+            if interval:
+                self.__timer = self.__app.set_interval(interval, self.__update)
+            self.__interval = interval
+            diagnostics.set("ui", "refresh interval", f"{interval}s" if interval else "idle")
+        if not self.__update_scheduled:
+            self.__update_scheduled = True
+            self.__app.call_later(self.__update)
+
+    def __update(self):
+        self.__update_scheduled = False
+        start = time.thread_time()
+        redraws = 0
+        for updater in self.__updaters:
+            if updater():
+                redraws += 1
+        diagnostics.add("ui", "updates")
+        diagnostics.add("ui", "redraws", redraws)
+        now = time.thread_time()
+        diagnostics.add("ui", "update cpu time (s)", now - start)
+        # Updates run on the UI thread, its CPU time covers rendering and event handling too
+        wall_time = time.perf_counter()
+        if wall_time - self.__last_wall_time >= 1.0:
+            diagnostics.set("ui", "ui thread cpu time (s)", round(now, 3))
+            diagnostics.set("ui", "ui thread load (%)", round(100 * (now - self.__last_thread_time) / (wall_time - self.__last_wall_time), 1))
+            self.__last_thread_time = now
+            self.__last_wall_time = wall_time
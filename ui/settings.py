@@ -3,7 +3,9 @@ from textual.containers import Horizontal, Vertical, VerticalScroll
 from textual.widgets import Button, ContentSwitcher, Footer, Header, Markdown, RadioButton, RadioSet, Static
 from textual.screen import Screen
 from core.device import DeviceInfo, HostApiInfo
+from core.diagnostics import diagnostics
 from core.player import HandcraftedAudioPlayer
+from core.remote import RemotePlayer
 
 class ApiRadioButton(RadioButton):
     hostapi : HostApiInfo
@@ -36,25 +38,20 @@ class DeviceSettingsPage(Static):
     selected_device : DeviceInfo | None = None
     
     def __init__(self, *args, **kwargs):
-        __apis = self.app.player.get_outout_device_list_by_api()
-        api_buttons : list[ApiRadioButton] = []
-        devices_radiosets : list[RadioSet] = []
-        for api in __apis:
-            api_buttons.append(ApiRadioButton(api))
-            current_api_devices_buttons : list[RadioButton] = []
-            for device in api.devices:
-                current_api_devices_buttons.append(DeviceRadioButton(device))
-            devices_radiosets.append(RadioSet(*current_api_devices_buttons, id="api_" + api.index))
-        self.__api_list_radio_set = RadioSet(*api_buttons, id="api-list")
-        self.__content_switcher = ContentSwitcher(*devices_radiosets, id="devices-list")
+        self.__api_list_radio_set = RadioSet(id="api-list")
+        self.__content_switcher = ContentSwitcher(id="devices-list")
+        self.__loading_label = Static("Loading devices...", id="devices-loading")
+        self.__refreshing : bool = False
         super().__init__(*args, **kwargs)
     
     def compose(self) -> ComposeResult:
         with Vertical():
+            yield self.__loading_label
             with Horizontal(id="device-selection-group"):
                 yield self.__api_list_radio_set
                 yield self.__content_switcher
             with Horizontal(id="device-settings-group"):
+                yield Button("Refresh devices", id="refresh-devices")
                 with ContentSwitcher(id="api-specific-settings", initial="no-device-selected"):
                     yield Markdown(markdown="No device selected", id="no-device-selected")
     
@@ -68,12 +65,90 @@ class DeviceSettingsPage(Static):
             self.selected_device = event.pressed.device 
 
     def on_mount(self) -> None:
-        player : HandcraftedAudioPlayer = self.app.player
+        player : HandcraftedAudioPlayer | RemotePlayer = self.app.player
+        host_apis = player.device_list.cached
+        if host_apis is not None:
+            for api in host_apis:
+                self.__add_host_api(api)
+            self.__loading_label.display = False
+        else:
+            self.run_worker(lambda: self.__enumerate_devices(refresh=False), thread=True, exclusive=True, group="devices")
+        player.device_list.on_changed.append(self.__on_device_list_changed)
+
+    def on_unmount(self) -> None:
+        self.app.player.device_list.on_changed.remove(self.__on_device_list_changed)
+
+    def __enumerate_devices(self, refresh : bool) -> None:
+        # Runs in a worker thread, host apis are shown one by one as soon as they are enumerated
+        player : HandcraftedAudioPlayer | RemotePlayer = self.app.player
+        on_host_api = lambda api: self.app.call_from_thread(self.__add_host_api, api)
+        try:
+            if refresh:
+                player.refresh_device_list(on_host_api=on_host_api)
+            else:
+                player.device_list.get(on_host_api=on_host_api)
+        finally:
+            self.app.call_from_thread(self.__on_enumeration_done)
+
+    def __on_enumeration_done(self) -> None:
+        self.__loading_label.display = False
+        self.__refreshing = False
+
+    def __on_device_list_changed(self, *_) -> None:
+        # Called from the thread that refreshed the list, a refresh started here already shows the new list
+        if not self.__refreshing:
+            self.app.call_from_thread(self.__reload_devices)
+
+    async def __reload_devices(self, refresh : bool = False) -> None:
+        self.__refreshing = refresh
+        self.__loading_label.display = True
+        await self.__api_list_radio_set.query(ApiRadioButton).remove()
+        await self.__content_switcher.query(RadioSet).remove()
+        self.run_worker(lambda: self.__enumerate_devices(refresh=refresh), thread=True, exclusive=True, group="devices")
+
+    def __add_host_api(self, api : HostApiInfo) -> None:
+        devices_radio_set = RadioSet(*[DeviceRadioButton(device) for device in api.devices], id="api_" + api.index)
+        devices_radio_set.display = self.__content_switcher.current == devices_radio_set.id
+        self.__api_list_radio_set.mount(ApiRadioButton(api))
+        self.__content_switcher.mount(devices_radio_set)
+        player : HandcraftedAudioPlayer | RemotePlayer = self.app.player
+        if player.current_device and player.current_device.hostapi.index == api.index:
+            self.call_after_refresh(self.__select_current_device)
+
+    def __select_current_device(self) -> None:
+        player : HandcraftedAudioPlayer | RemotePlayer = self.app.player
         if player.current_device:
             self.query_one("#" + player.current_device.hostapi.index).toggle()
             self.query_one("#device_" + str(player.current_device.index)).toggle()
+
+    async def on_button_pressed(self, event: Button.Pressed) -> None:
+        if event.button.id == "refresh-devices":
+            event.stop()
+            self.selected_device = None
+            await self.__reload_devices(refresh=True)
     
 
+class DiagnosticsPage(Markdown):
+    """Shows the runtime metrics of core.diagnostics, refreshed every second while displayed"""
+    async def on_mount(self) -> None:
+        await self.__update()
+        self.set_interval(1, self.__update)
+
+    async def __update(self) -> None:
+        if not self.display:
+            return
+        lines = list[str]()
+        for section, metrics in sorted(diagnostics.snapshot().items()):
+            lines.append(f"## {section}")
+            lines.append("| metric | value |")
+            lines.append("| --- | --- |")
+            for name, value in metrics.items():
+                if isinstance(value, float):
+                    value = f"{value:.3f}"
+                lines.append(f"| {name} | {value} |")
+        await self.update("\n".join(lines) if lines else "No diagnostics yet")
+
+
 class SettingsScreen(Screen):
     DEFAULT_CSS = """
     SettingsScreen {
@@ -107,9 +182,11 @@ class SettingsScreen(Screen):
             with Horizontal(id="buttons"):  
                 yield Button("Output device", id="device-settings")  
                 yield Button("General", id="markdown")  
+                yield Button("Diagnostics", id="diagnostics")
             with ContentSwitcher(initial="device-settings", id="content-switcher"):
                 yield DeviceSettingsPage(id="device-settings")
                 yield Markdown(id="markdown")
+                yield DiagnosticsPage(id="diagnostics")
             with Horizontal(id="footer-buttons"):
                 yield Button("Save", id="save")
                 yield Button("Cancel", id="cancel")